@@ -0,0 +1,120 @@
+"""
+Customer "recent activity" feed for the user dashboard.
+
+Orders, manual sales and points transactions are merged with a UNION ALL
+ordered by timestamp in the database, so only one page of a customer's
+history is ever loaded, however many purchases they have made.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, func, literal, or_, select, union_all
+from sqlalchemy.orm import selectinload
+
+from models import db, Sale, Order, PointsTransaction
+
+DEFAULT_FEED_SIZE = 20
+
+ActivityEntry = namedtuple('ActivityEntry', ['kind', 'timestamp', 'item'])
+ActivityPage = namedtuple('ActivityPage', ['entries', 'next_cursor'])
+
+# kind -> (model, timestamp column)
+SOURCES = {
+    'order': (Order, Order.created_at),
+    'points': (PointsTransaction, PointsTransaction.created_at),
+    'sale': (Sale, Sale.date),
+}
+
+
+def encode_cursor(timestamp, kind, row_id):
+    """Serialize a feed position into a URL-safe cursor"""
+    return f'{timestamp.isoformat()}_{kind}_{row_id}'
+
+
+def decode_cursor(cursor):
+    """Parse a cursor string, returning None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        timestamp, kind, row_id = cursor.rsplit('_', 2)
+        if kind not in SOURCES:
+            return None
+        return datetime.fromisoformat(timestamp), kind, int(row_id)
+    except ValueError:
+        return None
+
+
+def _after_cursor(kind, ts_col, id_col, position):
+    """Keyset condition for one source, given the (timestamp, kind, id) position"""
+    timestamp, cursor_kind, row_id = position
+    if kind < cursor_kind:
+        return ts_col <= timestamp
+    if kind == cursor_kind:
+        return or_(ts_col < timestamp, and_(ts_col == timestamp, id_col < row_id))
+    return ts_col < timestamp
+
+
+def get_activity(user_id, cursor=None, limit=DEFAULT_FEED_SIZE):
+    """One page of a user's orders, sales and points transactions, newest first"""
+    position = decode_cursor(cursor)
+
+    # Each branch is limited on its own so the database only reads the
+    # newest few rows per source via the (user_id, timestamp) access path.
+    branches = []
+    for kind, (model, ts_col) in SOURCES.items():
+        branch = select(
+            literal(kind).label('kind'),
+            model.id.label('id'),
+            ts_col.label('ts'),
+        ).where(model.user_id == user_id, ts_col.isnot(None))
+        if position:
+            branch = branch.where(_after_cursor(kind, ts_col, model.id, position))
+        branch = branch.order_by(ts_col.desc(), model.id.desc()).limit(limit + 1).subquery()
+        branches.append(select(branch))
+
+    feed = union_all(*branches).subquery()
+    rows = db.session.execute(
+        select(feed.c.kind, feed.c.id, feed.c.ts)
+        .order_by(feed.c.ts.desc(), feed.c.kind.desc(), feed.c.id.desc())
+        .limit(limit + 1)
+    ).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(_as_datetime(last.ts), last.kind, last.id)
+
+    # Load the full objects for this page with one IN query per source
+    ids = {kind: [row.id for row in rows if row.kind == kind] for kind in SOURCES}
+    loaded = {}
+    if ids['order']:
+        for order in Order.query.options(selectinload(Order.items)).filter(Order.id.in_(ids['order'])):
+            loaded[('order', order.id)] = order
+    if ids['sale']:
+        for sale in Sale.query.filter(Sale.id.in_(ids['sale'])):
+            loaded[('sale', sale.id)] = sale
+    if ids['points']:
+        for txn in PointsTransaction.query.filter(PointsTransaction.id.in_(ids['points'])):
+            loaded[('points', txn.id)] = txn
+
+    entries = [
+        ActivityEntry(row.kind, _as_datetime(row.ts), loaded[(row.kind, row.id)])
+        for row in rows if (row.kind, row.id) in loaded
+    ]
+    return ActivityPage(entries, next_cursor)
+
+
+def get_purchase_count(user_id):
+    """Number of orders plus manual sales for a user, counted in SQL"""
+    return db.session.execute(select(
+        select(func.count(Order.id)).where(Order.user_id == user_id).scalar_subquery()
+        + select(func.count(Sale.id)).where(Sale.user_id == user_id).scalar_subquery()
+    )).scalar()
+
+
+def _as_datetime(value):
+    """Timestamps read back through a UNION come back as strings on SQLite"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
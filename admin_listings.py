@@ -0,0 +1,56 @@
+"""
+Paginated order/sale listings and their summary figures for the admin pages.
+
+Rows are fetched one keyset page at a time; totals and per-status counts
+come from a single grouped query instead of being summed in the template.
+"""
+from sqlalchemy import case, func
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, Sale, Order
+from pagination import keyset_paginate, filter_date_range
+
+ORDER_STATUSES = ('pending', 'processing', 'shipped', 'delivered', 'cancelled')
+
+
+def get_order_stats(date_from=None, date_to=None):
+    """Order count, completed revenue and count per order status"""
+    query = db.session.query(
+        Order.order_status,
+        func.count(Order.id),
+        func.coalesce(func.sum(case((Order.payment_status == 'completed', Order.total), else_=0)), 0),
+    )
+    query = filter_date_range(query, Order.created_at, date_from, date_to)
+    rows = query.group_by(Order.order_status).all()
+
+    by_status = dict.fromkeys(ORDER_STATUSES, 0)
+    total = 0
+    revenue = 0
+    for status, count, status_revenue in rows:
+        by_status[status or 'pending'] = by_status.get(status or 'pending', 0) + count
+        total += count
+        revenue += status_revenue
+    return {'total': total, 'revenue': revenue, 'by_status': by_status}
+
+
+def get_sale_stats(date_from=None, date_to=None):
+    """Manual sale count and revenue"""
+    query = db.session.query(func.count(Sale.id), func.coalesce(func.sum(Sale.amount), 0))
+    query = filter_date_range(query, Sale.date, date_from, date_to)
+    count, revenue = query.one()
+    return {'total': count, 'revenue': revenue}
+
+
+def list_orders(cursor=None, per_page=50, status=None, date_from=None, date_to=None):
+    """One page of orders, newest first, optionally filtered by order status"""
+    query = Order.query.options(joinedload(Order.user), selectinload(Order.items))
+    if status:
+        query = query.filter(Order.order_status == status)
+    query = filter_date_range(query, Order.created_at, date_from, date_to)
+    return keyset_paginate(query, Order.created_at, Order.id, cursor, per_page)
+
+
+def list_sales(cursor=None, per_page=50, date_from=None, date_to=None):
+    """One page of manual sales, newest first"""
+    query = filter_date_range(Sale.query.options(joinedload(Sale.user)), Sale.date, date_from, date_to)
+    return keyset_paginate(query, Sale.date, Sale.id, cursor, per_page)
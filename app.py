@@ -1,24 +1,113 @@
-from flask import Flask, render_template, redirect, url_for, request, flash, abort, session, jsonify
+from flask import Flask, render_template, redirect, url_for, request, flash, abort, session, jsonify, Response, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from models import db, User, Sale, LoyaltyCard, Product, PointsTransaction, Reward, Order, OrderItem
+from sqlalchemy.orm import joinedload, selectinload
+from models import db, User, Sale, LoyaltyCard, Product, Reward, Order, OrderItem, PendingPayment
+from dashboard_metrics import get_cached_recent_sales, get_cached_report_totals, get_dashboard_metrics
+from kpi_cache import GROUPS as KPI_GROUPS, kpi_cache
+from revenue_rollup import record_sale, record_order, rebuild_daily_revenue
+from admin_listings import ORDER_STATUSES, get_order_stats, get_sale_stats, list_orders, list_sales
+from pagination import get_page_size, parse_date_range
+from activity_feed import get_activity, get_purchase_count
+from checkout import resolve_cart
+from cart_store import carts, prune_carts
+from pricing import pricing, quote_cart
+from sale_import import import_sales
+from pos_sync import BatchConflict, BatchError, authenticate, parse_tokens, submit_batch
+from data_export import EXPORTS, FORMATS, export_filename, stream_export
+from inventory import InsufficientStock, reserve_stock
+from khalti_client import KhaltiClient, KhaltiError
+from payments import PaymentWorker, create_pending_payment, mark_returned, process_due_payments
+from points_ledger import InsufficientPoints, earn_points, redeem_points, reconcile_balances, count_drifted_cards
+from catalog_cache import catalog, conditional_page
+from product_search import ensure_search_index, parse_search_args
+from image_pipeline import delete_image, process_image
+from static_assets import StaticAssets
+from instrumentation import instrumentation, metric_lines
+from schema_migrations import LATEST_VERSION, MigrationError, migrate, migration_status
+from db_routing import REPLICA, replica_reads
+import db_config
+import hmac
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 import json
-import requests
+import click
 
 app = Flask(__name__)
 # Use environment-provided secret and database for production deploys (Render)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'saraswati_stationary_secret_key_12345')
-database_url = os.environ.get('DATABASE_URL', 'sqlite:///stationery.db')
+database_url = db_config.normalize_url(os.environ.get('DATABASE_URL', 'sqlite:///stationery.db'))
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection pool (Postgres) and SQLite concurrency settings, see db_config
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_config.engine_options(database_url, app.config)
+
+# Optional read replica for reports, dashboards and catalog reads (see db_routing)
+replica_url = os.environ.get('DATABASE_REPLICA_URL')
+if replica_url:
+    replica_url = db_config.normalize_url(replica_url)
+    app.config['SQLALCHEMY_BINDS'] = {
+        REPLICA: {'url': replica_url, **db_config.engine_options(replica_url, app.config)}
+    }
+
 # Khalti Payment Configuration
 app.config['KHALTI_PUBLIC_KEY'] = os.environ.get('KHALTI_PUBLIC_KEY', 'test_public_key_xxx')
 app.config['KHALTI_SECRET_KEY'] = os.environ.get('KHALTI_SECRET_KEY', 'test_secret_key_xxx')
+app.config['KHALTI_BASE_URL'] = os.environ.get('KHALTI_BASE_URL', 'https://a.khalti.com/api/v2')
+app.config['KHALTI_CONNECT_TIMEOUT'] = float(os.environ.get('KHALTI_CONNECT_TIMEOUT', 3.05))
+app.config['KHALTI_READ_TIMEOUT'] = float(os.environ.get('KHALTI_READ_TIMEOUT', 10))
+app.config['KHALTI_LOOKUP_RETRIES'] = int(os.environ.get('KHALTI_LOOKUP_RETRIES', 2))
+app.config['PAYMENT_WORKER_THREAD'] = os.environ.get('PAYMENT_WORKER_THREAD', '1') == '1'
+app.config['PAYMENT_WORKER_INTERVAL'] = float(os.environ.get('PAYMENT_WORKER_INTERVAL', 2))
+
+# Product catalog cache (in-process LRU unless a shared Redis URL is given)
+app.config['CATALOG_CACHE_URL'] = os.environ.get('CATALOG_CACHE_URL')
+app.config['CATALOG_CACHE_TTL'] = int(os.environ.get('CATALOG_CACHE_TTL', 10))
+app.config['CATALOG_CACHE_SIZE'] = int(os.environ.get('CATALOG_CACHE_SIZE', 256))
+
+# Admin dashboard/report KPIs (see kpi_cache)
+app.config['KPI_CACHE_TTL'] = int(os.environ.get('KPI_CACHE_TTL', 30))
+
+# Checkout pricing rules and how long a checkout page's quote stays valid
+app.config['DELIVERY_FEES'] = json.loads(os.environ.get('DELIVERY_FEES', '{"standard": 0, "express": 150, "pickup": 0}'))
+app.config['POINTS_EARN_RATE'] = float(os.environ.get('POINTS_EARN_RATE', 10))  # NPR per point earned
+app.config['POINTS_REDEEM_MIN_BALANCE'] = int(os.environ.get('POINTS_REDEEM_MIN_BALANCE', 100))
+app.config['POINTS_REDEEM_MAX'] = int(os.environ.get('POINTS_REDEEM_MAX', 100))
+app.config['POINTS_PER_RUPEE'] = float(os.environ.get('POINTS_PER_RUPEE', 10))  # points per NPR of discount
+app.config['PRICING_QUOTE_TTL'] = int(os.environ.get('PRICING_QUOTE_TTL', 300))
+
+# Shopping carts: 'database' (shared by all workers) or 'memory' (tests)
+app.config['CART_STORE'] = os.environ.get('CART_STORE', 'database')
+
+# Bulk POS sale imports: rows per transaction and largest CSV accepted by the
+# admin page. Uploads are imported inside the request, so the limit keeps them
+# well inside the worker timeout (~15k rows/s); larger files go through
+# `flask import-sales` on the server
+app.config['SALE_IMPORT_CHUNK_SIZE'] = int(os.environ.get('SALE_IMPORT_CHUNK_SIZE', 5000))
+app.config['SALE_IMPORT_MAX_SIZE'] = int(os.environ.get('SALE_IMPORT_MAX_SIZE', 5 * 1024 * 1024))
+
+# POS terminal sync API: "terminal:token,terminal:token" and sales per batch
+app.config['POS_API_TOKENS'] = parse_tokens(os.environ.get('POS_API_TOKENS'))
+app.config['POS_BATCH_MAX'] = int(os.environ.get('POS_BATCH_MAX', 500))
+
+# Instrumentation: slow query threshold, optional per-request query budget
+# and a token that lets a Prometheus scraper read /metrics without logging in
+app.config['SLOW_QUERY_SECONDS'] = float(os.environ.get('SLOW_QUERY_SECONDS', 0.1))
+app.config['QUERY_BUDGET'] = int(os.environ['QUERY_BUDGET']) if os.environ.get('QUERY_BUDGET') else None
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+
+# Responses smaller than this many bytes are sent uncompressed
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
 
 # File upload configuration
 UPLOAD_FOLDER = 'static/uploads/products'
@@ -32,11 +121,20 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 Path(UPLOAD_FOLDER).mkdir(parents=True, exist_ok=True)
 
 db.init_app(app)
+db_config.init_app(app, db)
 
 login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
 
+khalti = KhaltiClient(app)
+catalog.init_app(app)
+kpi_cache.init_app(app)
+carts.init_app(app)
+pricing.init_app(app)
+StaticAssets(app)
+instrumentation.init_app(app)
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -50,42 +148,31 @@ def allowed_file(filename):
 
 
 def save_product_image(file, old_filename=None):
-    """Save uploaded product image and return filename"""
+    """Process an uploaded product image into its variants and return the hashed filename"""
     if not file or file.filename == '':
         return old_filename  # Return existing filename if no new file
     
     if not allowed_file(file.filename):
         raise ValueError('Only jpg, jpeg, png, and webp files are allowed')
     
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    filename = process_image(file.read(), ext, UPLOAD_FOLDER)
+
     # Delete old image if replacing
-    if old_filename and old_filename not in ['placeholder.png', 'placeholder.svg']:
-        old_path = os.path.join(UPLOAD_FOLDER, old_filename)
-        if os.path.exists(old_path):
-            try:
-                os.remove(old_path)
-            except:
-                pass  # Silently ignore if deletion fails
-    
-    # Generate filename with timestamp to prevent collisions
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-    filename = timestamp + secure_filename(file.filename)
-    
-    # Save file
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(filepath)
+    if old_filename != filename:
+        delete_product_image(old_filename)
     
     return filename
 
 
 def delete_product_image(filename):
-    """Delete product image file"""
-    if filename and filename != 'placeholder.svg' and filename != 'placeholder.png':
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-            except:
-                pass  # Silently ignore if deletion fails
+    """Delete a product image and its variants unless another product still uses it"""
+    if not filename or filename in ['placeholder.png', 'placeholder.svg']:
+        return
+    # Identical uploads share one content-hashed file
+    if Product.query.filter_by(image_filename=filename).count() > 1:
+        return
+    delete_image(filename, UPLOAD_FOLDER)
 
 
 @app.route('/')
@@ -95,20 +182,32 @@ def home():
 
 @app.route('/products')
 def products():
-    products = Product.query.all()
-    return render_template('products.html', products=products)
+    params = parse_search_args(request.args)
+    listing = catalog.get_listing(params)
+    filters = {key: value for key, value in request.args.items() if key != 'page' and value}
+    return conditional_page(listing.etag, None, lambda: render_template(
+        'products.html',
+        products=listing.products,
+        has_next=listing.has_next,
+        params=params,
+        filters=filters,
+        categories=catalog.get_categories()
+    ))
 
 
 @app.route('/product/<int:id>')
 def product_detail(id):
     """Display product detail page"""
-    product = Product.query.get_or_404(id)
-    return render_template('product_detail.html', product=product)
+    product = catalog.get_product(id)
+    if product is None:
+        abort(404)
+    return conditional_page(catalog.product_etag(product), product.updated_at,
+                            lambda: render_template('product_detail.html', product=product))
 
 
 @app.route('/add_to_cart/<int:product_id>', methods=['POST'])
 def add_to_cart(product_id):
-    """Add product to shopping cart (session-based)"""
+    """Add product to shopping cart (stored server-side, see cart_store)"""
     product = Product.query.get_or_404(product_id)
     
     # Check stock
@@ -118,28 +217,19 @@ def add_to_cart(product_id):
         flash('Product is out of stock', 'error')
         return redirect(url_for('product_detail', id=product_id))
     
-    # Initialize cart in session
-    if 'cart' not in session:
-        session['cart'] = {}
-    
-    quantity = int(request.form.get('quantity', 1))
-    product_id_str = str(product_id)
-    
-    # Add/update cart item
-    if product_id_str in session['cart']:
-        session['cart'][product_id_str]['quantity'] += quantity
-    else:
-        session['cart'][product_id_str] = {
-            'name': product.name,
-            'price': float(product.price),
-            'quantity': quantity,
-            'image_url': product.get_image_url()
-        }
-    
-    session.modified = True
+    try:
+        quantity = int(request.form.get('quantity', 1))
+    except ValueError:
+        quantity = 0
+    if quantity < 1:
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': False, 'message': 'Quantity must be at least 1'}), 400
+        flash('Quantity must be at least 1', 'error')
+        return redirect(url_for('product_detail', id=product_id))
+    carts.add(product_id, quantity)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({'success': True, 'cart_count': sum(item['quantity'] for item in session['cart'].values())})
+        return jsonify({'success': True, 'cart_count': sum(carts.items().values())})
     
     flash(f'{product.name} added to cart!', 'success')
     return redirect(url_for('cart'))
@@ -147,45 +237,46 @@ def add_to_cart(product_id):
 
 @app.route('/cart')
 def cart():
-    """Display shopping cart"""
+    """Display shopping cart with current prices and stock"""
     cart_items = []
-    subtotal = 0
     
-    if 'cart' in session:
-        for product_id, item in session['cart'].items():
-            item_subtotal = item['price'] * item['quantity']
-            subtotal += item_subtotal
-            cart_items.append({
-                'product_id': product_id,
-                'name': item['name'],
-                'price': item['price'],
-                'quantity': item['quantity'],
-                'subtotal': item_subtotal,
-                'image_url': item['image_url']
-            })
+    # Refresh every line from the Product table in one query
+    resolved_cart = resolve_cart(carts.items())
+    for line in resolved_cart:
+        if line.product is None:
+            carts.remove(line.product_id)  # product was deleted
+            continue
+        cart_items.append({
+            'product_id': line.product_id,
+            'name': line.name,
+            'price': line.price,
+            'quantity': line.quantity,
+            'subtotal': line.subtotal,
+            'image_url': line.product.get_image_url('thumb'),
+            'stock': line.product.stock
+        })
+    subtotal = sum(item['subtotal'] for item in cart_items)
     
-    # Delivery charges
-    delivery_charges = {
-        'standard': 0,
-        'express': 150,
-        'pickup': 0
-    }
+    # Same rules as checkout, so the preview matches what is charged
+    balance = None
+    if current_user.is_authenticated and current_user.loyalty_card:
+        balance = current_user.loyalty_card.points
+    discount = pricing.price([line for line in resolved_cart if line.product is not None],
+                             points_balance=balance).discount
     
     return render_template('cart.html', 
                          cart_items=cart_items, 
                          subtotal=subtotal,
-                         delivery_charges=delivery_charges)
+                         discount=discount,
+                         delivery_charges=dict(pricing.rules.delivery_fees))
 
 
 @app.route('/remove_from_cart/<int:product_id>')
 def remove_from_cart(product_id):
     """Remove product from cart"""
-    if 'cart' in session:
-        product_id_str = str(product_id)
-        if product_id_str in session['cart']:
-            del session['cart'][product_id_str]
-            session.modified = True
-            flash('Item removed from cart', 'success')
+    if product_id in carts.items():
+        carts.remove(product_id)
+        flash('Item removed from cart', 'success')
     
     return redirect(url_for('cart'))
 
@@ -194,16 +285,24 @@ def remove_from_cart(product_id):
 @login_required
 def checkout():
     """Checkout page"""
-    if not session.get('cart'):
+    quote, resolved_cart = quote_cart(carts.items(), 'standard', current_user)
+    if not resolved_cart:
         flash('Your cart is empty', 'warning')
         return redirect(url_for('cart'))
+    for line in resolved_cart.unavailable:
+        flash(f'Product {line.name} is no longer available', 'error')
+        return redirect(url_for('cart'))
+    
+    # The form posts the quote id back so the order is not priced twice
+    pricing.save(quote)
     
     # Pre-fill form for logged in users
     user_data = {
         'full_name': current_user.username,
         'email': current_user.email,
     }
-    return render_template('checkout.html', user_data=user_data)
+    return render_template('checkout.html', user_data=user_data, quote=quote,
+                           delivery_fees=dict(pricing.rules.delivery_fees))
 
 
 @app.route('/place_order', methods=['POST'])
@@ -211,7 +310,8 @@ def checkout():
 def place_order():
     """Create order from cart"""
     
-    if not session.get('cart'):
+    cart_items = carts.items()
+    if not cart_items:
         flash('Your cart is empty', 'error')
         return redirect(url_for('cart'))
     
@@ -231,42 +331,14 @@ def place_order():
             flash('All fields are required', 'error')
             return redirect(url_for('checkout'))
         
-        # Calculate totals
-        subtotal = 0
-        cart_for_db = []
-        
-        for product_id, item in session['cart'].items():
-            product = Product.query.get(int(product_id))
-            if not product or product.stock <= 0:
-                flash(f'Product {item["name"]} is no longer available', 'error')
-                return redirect(url_for('cart'))
-            
-            item_subtotal = item['price'] * item['quantity']
-            subtotal += item_subtotal
-            cart_for_db.append({
-                'product_id': product_id,
-                'product': product,
-                'item': item,
-                'subtotal': item_subtotal
-            })
-        
-        # Calculate charges
-        delivery_charges = {
-            'standard': 0,
-            'express': 150,
-            'pickup': 0
-        }
-        delivery_charge = delivery_charges.get(delivery_option, 0)
-        discount = 0
-        points_to_redeem = 0
-        
-        # Apply loyalty points discount if available
-        if current_user.loyalty_card and current_user.loyalty_card.points >= 100:
-            # User can redeem up to 100 points for discount (10 NPR max discount)
-            points_to_redeem = min(100, current_user.loyalty_card.points)
-            discount = points_to_redeem / 10  # 10 points = 1 NPR
-        
-        total = subtotal + delivery_charge - discount
+        # Load (and lock) every product in the cart with one query; the
+        # checkout page's quote is reused only if it still matches them
+        quote, resolved_cart = quote_cart(cart_items, delivery_option, current_user, lock=True,
+                                          quote_id=request.form.get('quote_id'))
+        for line in resolved_cart.unavailable:
+            db.session.rollback()
+            flash(f'Product {line.name} is no longer available', 'error')
+            return redirect(url_for('cart'))
         
         # Create order
         order = Order(
@@ -277,75 +349,66 @@ def place_order():
             address=address,
             city=city,
             postal_code=postal_code,
-            delivery_option=delivery_option,
+            delivery_option=quote.delivery_option,
             payment_method=payment_method,
-            subtotal=subtotal,
-            delivery_charge=delivery_charge,
-            discount=discount,
-            total=total,
+            subtotal=quote.subtotal,
+            delivery_charge=quote.delivery_charge,
+            discount=quote.discount,
+            total=quote.total,
             payment_status='completed' if payment_method == 'cod' else 'pending',
             order_status='pending',
-            points_redeemed=points_to_redeem
+            points_redeemed=quote.points_to_redeem
         )
         
         db.session.add(order)
         db.session.flush()  # Get order ID
         
         # Add order items
-        for item_data in cart_for_db:
+        for line in quote.lines:
             order_item = OrderItem(
                 order_id=order.id,
-                product_id=int(item_data['product_id']),
-                product_name=item_data['item']['name'],
-                product_price=item_data['item']['price'],
-                quantity=item_data['item']['quantity'],
-                subtotal=item_data['subtotal']
+                product_id=line.product_id,
+                product_name=line.name,
+                product_price=line.price,
+                quantity=line.quantity,
+                subtotal=line.subtotal
             )
             db.session.add(order_item)
-            
-            # Update stock
-            product = item_data['product']
-            product.stock -= item_data['item']['quantity']
+        
+        # Take stock atomically; fails the whole order if any line is short
+        reserve_stock(quote.lines)
         
         # Update loyalty points
-        points_earned = int(subtotal / 10)  # 1 point per 10 NPR
-        order.points_earned = points_earned
+        order.points_earned = quote.points_earned
         
         if current_user.loyalty_card:
             # Deduct redeemed points first
-            if points_to_redeem > 0:
-                current_user.loyalty_card.points -= points_to_redeem
-                # Log redemption transaction
-                redeem_transaction = PointsTransaction(
-                    user_id=current_user.id,
-                    points=points_to_redeem,
-                    type='redeem',
-                    description=f'Order #{order.id} - Rs. {discount:.2f} discount'
-                )
-                db.session.add(redeem_transaction)
+            if quote.points_to_redeem > 0:
+                redeem_points(current_user.id, quote.points_to_redeem,
+                              f'Order #{order.id} - Rs. {quote.discount:.2f} discount')
             
             # Add earned points
-            current_user.loyalty_card.points += points_earned
-            current_user.loyalty_card.update_tier()
-            
-            # Log points earned transaction
-            points_transaction = PointsTransaction(
-                user_id=current_user.id,
-                points=points_earned,
-                type='earn',
-                description=f'Order #{order.id} - Rs. {subtotal}'
-            )
-            db.session.add(points_transaction)
+            earn_points(current_user.id, quote.points_earned, f'Order #{order.id} - Rs. {quote.subtotal}')
         
+        record_order(order)
         db.session.commit()
         
         # Clear cart
-        session.pop('cart', None)
-        session.modified = True
+        carts.clear()
         
         flash(f'Order placed successfully! Order ID: {order.id}', 'success')
         return redirect(url_for('order_confirmation', order_id=order.id))
     
+    except InsufficientStock as e:
+        db.session.rollback()
+        flash(f'Sorry, there is not enough stock left for {e.name}', 'error')
+        return redirect(url_for('cart'))
+    
+    except InsufficientPoints:
+        db.session.rollback()
+        flash('Your points balance changed while placing the order. Please try again.', 'error')
+        return redirect(url_for('checkout'))
+    
     except Exception as e:
         db.session.rollback()
         flash(f'Error placing order: {str(e)}', 'error')
@@ -369,7 +432,9 @@ def order_confirmation(order_id):
 @login_required
 def my_orders():
     """User's order history"""
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
+    orders = Order.query.options(selectinload(Order.items)).filter_by(
+        user_id=current_user.id
+    ).order_by(Order.created_at.desc()).all()
     return render_template('my_orders.html', orders=orders)
 
 
@@ -378,7 +443,8 @@ def my_orders():
 def pay_with_khalti():
     """Initiate Khalti payment for cart"""
     
-    if not session.get('cart'):
+    cart_items = carts.items()
+    if not cart_items:
         flash('Your cart is empty', 'error')
         return redirect(url_for('cart'))
     
@@ -397,53 +463,36 @@ def pay_with_khalti():
             flash('All fields are required', 'error')
             return redirect(url_for('checkout'))
         
-        # Calculate totals
-        subtotal = 0
-        for product_id, item in session['cart'].items():
-            product = Product.query.get(int(product_id))
-            if not product or product.stock <= 0:
-                flash(f'Product {item["name"]} is no longer available', 'error')
-                return redirect(url_for('cart'))
-            subtotal += item['price'] * item['quantity']
-        
-        # Calculate charges
-        delivery_charges = {'standard': 0, 'express': 150, 'pickup': 0}
-        delivery_charge = delivery_charges.get(delivery_option, 0)
-        discount = 0
-        points_to_redeem = 0
-        
-        # Apply loyalty discount
-        if current_user.loyalty_card and current_user.loyalty_card.points >= 100:
-            points_to_redeem = min(100, current_user.loyalty_card.points)
-            discount = points_to_redeem / 10  # 10 points = 1 NPR
+        # Current prices; the checkout page's quote is reused if it matches them
+        quote, resolved_cart = quote_cart(cart_items, delivery_option, current_user,
+                                          quote_id=request.form.get('quote_id'))
+        for line in resolved_cart.unavailable:
+            flash(f'Product {line.name} is no longer available', 'error')
+            return redirect(url_for('cart'))
         
-        total = subtotal + delivery_charge - discount
-        
-        # Store checkout details in session for post-payment verification
-        session['checkout_data'] = {
+        # Checkout details, stored with the pending payment for verification
+        checkout_data = {
             'full_name': full_name,
             'email': email,
             'phone': phone,
             'address': address,
             'city': city,
             'postal_code': postal_code,
-            'delivery_option': delivery_option,
-            'subtotal': subtotal,
-            'delivery_charge': delivery_charge,
-            'discount': discount,
-            'total': total,
-            'points_to_redeem': points_to_redeem
+            'delivery_option': quote.delivery_option,
+            'quote_id': quote.quote_id,
+            'subtotal': quote.subtotal,
+            'delivery_charge': quote.delivery_charge,
+            'discount': quote.discount,
+            'total': quote.total,
+            'points_to_redeem': quote.points_to_redeem,
+            'points_earned': quote.points_earned
         }
-        session.modified = True
-        
-        # Khalti API endpoint
-        url = "https://a.khalti.com/api/v2/epayment/initiate/"
         
         # Prepare payload for Khalti
         payload = {
             "return_url": url_for('khalti_payment_success', _external=True),
             "website_url": url_for('home', _external=True),
-            "amount": int(total * 100),  # Convert to paisa (1 rupee = 100 paisa)
+            "amount": int(quote.total * 100),  # Convert to paisa (1 rupee = 100 paisa)
             "purchase_order_id": f"ORDER_{current_user.id}_{int(datetime.utcnow().timestamp())}",
             "purchase_order_name": f"Saraswati Stationery Order",
             "customer_info": {
@@ -453,24 +502,27 @@ def pay_with_khalti():
             }
         }
         
-        headers = {
-            "Authorization": f"Key {app.config['KHALTI_SECRET_KEY']}",
-            "Content-Type": "application/json",
-        }
-        
         # Call Khalti API
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code != 200:
+        try:
+            data = khalti.initiate(payload)
+        except KhaltiError:
             flash('Failed to initiate Khalti payment. Please try again.', 'error')
             return redirect(url_for('checkout'))
         
-        data = response.json()
-        
-        if 'payment_url' not in data:
+        if 'payment_url' not in data or 'pidx' not in data:
             flash('Payment gateway error. Please try again.', 'error')
             return redirect(url_for('checkout'))
         
+        create_pending_payment(
+            pidx=data['pidx'],
+            user_id=current_user.id,
+            purchase_order_id=payload['purchase_order_id'],
+            amount=payload['amount'],
+            checkout_data=checkout_data,
+            cart={str(line.product_id): {'name': line.name, 'price': line.price, 'quantity': line.quantity}
+                  for line in quote.lines}  # the order is priced as paid
+        )
+        
         # Redirect to Khalti payment page
         return redirect(data['payment_url'])
     
@@ -482,134 +534,40 @@ def pay_with_khalti():
 @app.route('/payment-success')
 @login_required
 def khalti_payment_success():
-    """Handle Khalti payment success - verify and create order"""
+    """Khalti redirect target - queue the payment for verification"""
     
-    # Get verification parameters from Khalti
+    # Khalti's query parameters are not trusted; the worker verifies via lookup
     pidx = request.args.get('pidx')
-    transaction_id = request.args.get('transaction_id')
-    amount = request.args.get('amount')
+    pending = PendingPayment.query.filter_by(pidx=pidx, user_id=current_user.id).first() if pidx else None
     
-    if not pidx:
+    if not pending:
         flash('Invalid payment response', 'error')
         return redirect(url_for('checkout'))
     
-    try:
-        # Verify payment with Khalti API - VERY IMPORTANT
-        verify_url = "https://a.khalti.com/api/v2/epayment/lookup/"
-        
-        verify_payload = {
-            "pidx": pidx
-        }
-        
-        headers = {
-            "Authorization": f"Key {app.config['KHALTI_SECRET_KEY']}",
-            "Content-Type": "application/json",
-        }
-        
-        verify_response = requests.post(verify_url, json=verify_payload, headers=headers)
-        
-        if verify_response.status_code != 200:
-            flash('Payment verification failed', 'error')
-            return redirect(url_for('checkout'))
-        
-        verify_data = verify_response.json()
-        
-        # Check if payment was successful
-        if verify_data.get('status') != 'Completed':
-            flash('Payment was not completed', 'error')
-            return redirect(url_for('checkout'))
-        
-        # Payment verified successfully! Now create order
-        checkout_data = session.get('checkout_data')
-        cart = session.get('cart', {})
-        
-        if not checkout_data or not cart:
-            flash('Session data missing. Please try again.', 'error')
-            return redirect(url_for('checkout'))
-        
-        # Create order
-        order = Order(
-            user_id=current_user.id,
-            full_name=checkout_data['full_name'],
-            email=checkout_data['email'],
-            phone=checkout_data['phone'],
-            address=checkout_data['address'],
-            city=checkout_data['city'],
-            postal_code=checkout_data['postal_code'],
-            delivery_option=checkout_data['delivery_option'],
-            payment_method='khalti',
-            subtotal=checkout_data['subtotal'],
-            delivery_charge=checkout_data['delivery_charge'],
-            discount=checkout_data['discount'],
-            total=checkout_data['total'],
-            payment_status='completed',
-            order_status='pending',
-            points_redeemed=checkout_data.get('points_to_redeem', 0)
-        )
-        
-        db.session.add(order)
-        db.session.flush()
-        
-        # Add order items
-        for product_id, item in cart.items():
-            product = Product.query.get(int(product_id))
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=int(product_id),
-                product_name=item['name'],
-                product_price=item['price'],
-                quantity=item['quantity'],
-                subtotal=item['price'] * item['quantity']
-            )
-            db.session.add(order_item)
-            
-            # Update stock
-            product.stock -= item['quantity']
-        
-        # Update loyalty points
-        points_earned = int(checkout_data['subtotal'] / 10)
-        order.points_earned = points_earned
-        points_redeemed = checkout_data.get('points_to_redeem', 0)
-        
-        if current_user.loyalty_card:
-            # Deduct redeemed points first
-            if points_redeemed > 0:
-                current_user.loyalty_card.points -= points_redeemed
-                # Log redemption transaction
-                redeem_transaction = PointsTransaction(
-                    user_id=current_user.id,
-                    points=points_redeemed,
-                    type='redeem',
-                    description=f'Khalti Order #{order.id} - Rs. {checkout_data["discount"]:.2f} discount'
-                )
-                db.session.add(redeem_transaction)
-            
-            # Add earned points
-            current_user.loyalty_card.points += points_earned
-            current_user.loyalty_card.update_tier()
-            
-            # Log earned points transaction
-            points_transaction = PointsTransaction(
-                user_id=current_user.id,
-                points=points_earned,
-                type='earn',
-                description=f'Khalti Order #{order.id} - Rs. {checkout_data["subtotal"]}'
-            )
-            db.session.add(points_transaction)
-        
-        db.session.commit()
-        
-        # Clear session data
-        session.pop('cart', None)
-        session.pop('checkout_data', None)
-        session.modified = True
-        
-        flash(f'Payment successful! Order ID: {order.id}', 'success')
-        return redirect(url_for('order_confirmation', order_id=order.id))
+    # Refreshing this page or a repeated redirect never re-processes the payment
+    if pending.status == 'completed' and pending.order_id:
+        return redirect(url_for('order_confirmation', order_id=pending.order_id))
     
-    except Exception as e:
-        flash(f'Error processing payment: {str(e)}', 'error')
-        return redirect(url_for('checkout'))
+    mark_returned(pending)
+    return render_template('payment_pending.html', pending=pending)
+
+
+@app.route('/payment-status/<pidx>')
+@login_required
+def khalti_payment_status(pidx):
+    """Polled by the confirming-payment page"""
+    pending = PendingPayment.query.filter_by(pidx=pidx, user_id=current_user.id).first_or_404()
+    
+    response = {'status': pending.status}
+    if pending.status == 'completed' and pending.order_id:
+        # Payment is final; the cart has been turned into an order
+        if 'cart_id' in session:
+            carts.clear()
+            flash(f'Payment successful! Order ID: {pending.order_id}', 'success')
+        response['redirect_url'] = url_for('order_confirmation', order_id=pending.order_id)
+    elif pending.status in ('failed', 'expired'):
+        response['message'] = 'We could not confirm your payment. If you were charged, please contact us.'
+    return jsonify(response)
 
 
 @app.route('/payment-failed')
@@ -701,7 +659,14 @@ def dashboard():
         db.session.add(loyalty_card)
         db.session.commit()
     
-    return render_template('user/dashboard.html', user=current_user)
+    # Most recent orders, in-store sales and points activity, one page at a time
+    activity = get_activity(current_user.id, cursor=request.args.get('cursor'))
+    
+    return render_template('user/dashboard.html',
+                         user=current_user,
+                         activity=activity.entries,
+                         next_cursor=activity.next_cursor,
+                         purchase_count=get_purchase_count(current_user.id))
 
 
 @app.route('/logout')
@@ -726,30 +691,72 @@ def add_sale():
         flash('User not found', 'error')
         return redirect(url_for('dashboard'))
 
-    # Record Sale
-    new_sale = Sale(user_id=user.id, amount=amount, items=items)
+    # Record Sale with its Loyalty Points (see pricing.PricingRules)
+    points_earned = pricing.points_earned(amount)
+    new_sale = Sale(user_id=user.id, amount=amount, items=items, points_earned=points_earned)
     db.session.add(new_sale)
+    db.session.flush()  # Populate sale date for the revenue rollup
 
-    # Update Loyalty Points (1 point per 10 NPR, for example)
-    points_earned = int(amount / 10)
-    user.loyalty_card.points += points_earned
-    user.loyalty_card.update_tier()
-
-    # Create Points Transaction Record
-    points_transaction = PointsTransaction(
-        user_id=user.id,
-        points=points_earned,
-        type='earn',
-        description=f'Sale of Rs. {amount} - {items}'
-    )
-    db.session.add(points_transaction)
+    earn_points(user.id, points_earned, f'Sale of Rs. {amount} - {items}')
 
+    record_sale(new_sale)
     db.session.commit()
 
     flash(f'Sale recorded! {points_earned} points added to {user.username}.', 'success')
     return redirect(url_for('dashboard'))
 
 
+@app.route('/admin/sales/import', methods=['POST'])
+@login_required
+def import_sales_csv():
+    """Import an end-of-day POS batch uploaded as CSV"""
+    if not current_user.is_admin:
+        abort(403)
+
+    # POS batches may be larger than the image upload limit
+    limit = app.config['SALE_IMPORT_MAX_SIZE']
+    request.max_content_length = limit
+    try:
+        upload = request.files.get('file')
+    except RequestEntityTooLarge:
+        flash(f'The file is larger than {limit / 2 ** 20:g} MB. Split it, or import it on the server '
+              f'with "flask import-sales".', 'error')
+        return redirect(url_for('admin_sales'))
+    if not upload or not upload.filename:
+        flash('Choose a CSV file to import', 'error')
+        return redirect(url_for('admin_sales'))
+
+    result = import_sales(upload.stream, chunk_size=app.config['SALE_IMPORT_CHUNK_SIZE'])
+    already = f' {result.duplicates} were already imported.' if result.duplicates else ''
+    flash(f'Imported {result.imported} of {result.rows} sales, {result.points} points issued.{already}',
+          'success' if result.imported else 'warning')
+    for error in result.errors[:10]:
+        flash(f'Line {error.line}: {error.message}', 'error')
+    if len(result.errors) > 10:
+        flash(f'{len(result.errors) - 10} more rows were not imported.', 'error')
+    return redirect(url_for('admin_sales'))
+
+
+@app.route('/api/pos/sales:batch', methods=['POST'])
+def pos_sales_batch():
+    """Record a batch of queued sales from a POS terminal (see pos_sync.py)"""
+    terminal = authenticate(request.headers.get('Authorization'), app.config['POS_API_TOKENS'])
+    if terminal is None:
+        return jsonify({'error': 'invalid or missing terminal token'}), 401
+
+    try:
+        result = submit_batch(request.get_json(silent=True), app.config['POS_BATCH_MAX'])
+    except BatchError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except BatchConflict as exc:
+        return jsonify({'error': str(exc)}), 409, {'Retry-After': '1'}
+
+    if result.created or result.errors:
+        app.logger.info('POS batch from %s: %d created, %d duplicates, %d errors',
+                        terminal, result.created, result.duplicates, result.errors)
+    return jsonify(result._asdict())
+
+
 @app.route('/admin/products')
 @login_required
 def admin_products():
@@ -871,120 +878,52 @@ def delete_product(id):
 
 @app.route('/admin/dashboard')
 @login_required
+@replica_reads
 def admin_dashboard():
     if not current_user.is_admin:
         abort(403)
 
-    from sqlalchemy import func
-    from datetime import datetime, timedelta
-    import json
+    metrics = get_dashboard_metrics()
 
-    # KPI Metrics
-    total_customers = User.query.filter_by(role='customer').count()
-    
-    # Count both manual sales and orders
-    total_sales_manual = Sale.query.count()
-    total_orders = Order.query.count()
-    total_sales = total_sales_manual + total_orders
-    
-    # Calculate revenue from both Sales and Orders
-    revenue_from_sales = db.session.query(func.sum(Sale.amount)).scalar() or 0
-    revenue_from_orders = db.session.query(func.sum(Order.total)).filter(
-        Order.payment_status == 'completed'
-    ).scalar() or 0
-    total_revenue = revenue_from_sales + revenue_from_orders
-    
-    active_cards = LoyaltyCard.query.count()
-
-    # Monthly Revenue (current month)
-    today = datetime.now().date()
-    first_day_of_month = today.replace(day=1)
-    
-    monthly_revenue_sales = db.session.query(func.sum(Sale.amount)).filter(
-        func.date(Sale.date) >= first_day_of_month
-    ).scalar() or 0
-    
-    monthly_revenue_orders = db.session.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) >= first_day_of_month,
-        Order.payment_status == 'completed'
-    ).scalar() or 0
-    
-    monthly_revenue = monthly_revenue_sales + monthly_revenue_orders
-    
-    # Points Issued Today (sum of points from sales and orders today)
-    today_sales = Sale.query.filter(
-        func.date(Sale.date) == today
-    ).all()
-    today_orders = Order.query.filter(
-        func.date(Order.created_at) == today,
-        Order.payment_status == 'completed'
-    ).all()
-    
-    points_issued_today = sum(int(sale.amount / 10) for sale in today_sales) + sum(order.points_earned for order in today_orders)
-
-    # Total Products & Low Stock
-    total_products = Product.query.count()
-    low_stock = Product.query.filter(Product.stock < 10).count()
-
-    # Sales Over Time (last 7 days) - Combined from Sales and Orders
-    sales_by_date = {}
-    for i in range(6, -1, -1):  # Last 7 days
-        date = today - timedelta(days=i)
-        
-        daily_sales = db.session.query(func.sum(Sale.amount)).filter(
-            func.date(Sale.date) == date
-        ).scalar() or 0
-        
-        daily_orders = db.session.query(func.sum(Order.total)).filter(
-            func.date(Order.created_at) == date,
-            Order.payment_status == 'completed'
-        ).scalar() or 0
-        
-        sales_by_date[date.strftime('%b %d')] = float(daily_sales + daily_orders)
-
-    # Loyalty Tier Distribution
-    silver_count = LoyaltyCard.query.filter_by(tier='Silver').count()
-    gold_count = LoyaltyCard.query.filter_by(tier='Gold').count()
-    platinum_count = LoyaltyCard.query.filter_by(tier='Platinum').count()
-
-    # Recent Sales
-    recent_sales = Sale.query.order_by(Sale.date.desc()).limit(5).all()
+    recent_sales = get_cached_recent_sales(5)
 
     return render_template(
         'admin/admin_dashboard.html',
-        total_customers=total_customers,
-        total_sales=total_sales,
-        total_revenue=total_revenue,
-        active_cards=active_cards,
-        monthly_revenue=monthly_revenue,
-        points_issued_today=points_issued_today,
-        total_products=total_products,
-        low_stock=low_stock,
-        sales_by_date=json.dumps(sales_by_date),
-        silver_count=silver_count,
-        gold_count=gold_count,
-        platinum_count=platinum_count,
+        total_customers=metrics['total_customers'],
+        total_sales=metrics['total_sales'],
+        total_revenue=metrics['total_revenue'],
+        active_cards=metrics['active_cards'],
+        monthly_revenue=metrics['monthly_revenue'],
+        points_issued_today=metrics['points_issued_today'],
+        total_products=metrics['total_products'],
+        low_stock=metrics['low_stock'],
+        sales_by_date=json.dumps(metrics['sales_by_date']),
+        silver_count=metrics['silver_count'],
+        gold_count=metrics['gold_count'],
+        platinum_count=metrics['platinum_count'],
         recent_sales=recent_sales
     )
 
 
 @app.route('/admin/customers')
 @login_required
+@replica_reads
 def admin_customers():
     if not current_user.is_admin:
         abort(403)
 
-    customers = User.query.filter_by(role='customer').all()
+    customers = User.query.options(joinedload(User.loyalty_card)).filter_by(role='customer').all()
     return render_template('admin/customers.html', customers=customers)
 
 
 @app.route('/admin/loyalty_cards')
 @login_required
+@replica_reads
 def admin_loyalty_cards():
     if not current_user.is_admin:
         abort(403)
 
-    loyalty_cards = LoyaltyCard.query.all()
+    loyalty_cards = LoyaltyCard.query.options(joinedload(LoyaltyCard.user)).all()
     return render_template('admin/loyalty_cards.html', loyalty_cards=loyalty_cards)
 
 
@@ -994,9 +933,26 @@ def admin_orders():
     if not current_user.is_admin:
         abort(403)
 
-    # Get all orders with user info
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-    return render_template('admin/orders.html', orders=orders)
+    date_from, date_to = parse_date_range(request.args)
+    status = request.args.get('status') or None
+    page = list_orders(
+        cursor=request.args.get('cursor'),
+        per_page=get_page_size(request.args),
+        status=status,
+        date_from=date_from,
+        date_to=date_to
+    )
+    stats = get_order_stats(date_from, date_to)
+
+    # Filters carried over into the "next page" link
+    filters = {k: request.args[k] for k in ('status', 'date_from', 'date_to', 'per_page') if request.args.get(k)}
+
+    return render_template('admin/orders.html',
+                         orders=page.rows,
+                         next_cursor=page.next_cursor,
+                         stats=stats,
+                         filters=filters,
+                         statuses=ORDER_STATUSES)
 
 
 @app.route('/admin/order/<int:order_id>/update', methods=['POST'])
@@ -1046,43 +1002,69 @@ def confirm_delivery(order_id):
 
 @app.route('/admin/sales')
 @login_required
+@replica_reads
 def admin_sales():
     if not current_user.is_admin:
         abort(403)
 
-    # Get both manual sales and orders
-    sales = Sale.query.order_by(Sale.date.desc()).all()
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-    
-    return render_template('admin/sales.html', sales=sales, orders=orders)
+    # Get both manual sales and orders, each paginated independently
+    date_from, date_to = parse_date_range(request.args)
+    per_page = get_page_size(request.args)
+    orders_page = list_orders(request.args.get('order_cursor'), per_page, date_from=date_from, date_to=date_to)
+    sales_page = list_sales(request.args.get('sale_cursor'), per_page, date_from=date_from, date_to=date_to)
+
+    filters = {k: request.args[k] for k in ('date_from', 'date_to', 'per_page') if request.args.get(k)}
+
+    return render_template('admin/sales.html',
+                         sales=sales_page.rows,
+                         orders=orders_page.rows,
+                         next_sale_cursor=sales_page.next_cursor,
+                         next_order_cursor=orders_page.next_cursor,
+                         order_stats=get_order_stats(date_from, date_to),
+                         sale_stats=get_sale_stats(date_from, date_to),
+                         import_max_mb=f"{app.config['SALE_IMPORT_MAX_SIZE'] / 2 ** 20:g}",
+                         filters=filters)
 
 
 @app.route('/admin/reports')
 @login_required
+@replica_reads
 def admin_reports():
     if not current_user.is_admin:
         abort(403)
 
-    from sqlalchemy import func
-    
-    # Calculate totals from both Sales and Orders
-    revenue_from_sales = db.session.query(func.sum(Sale.amount)).scalar() or 0
-    revenue_from_orders = db.session.query(func.sum(Order.total)).filter(
-        Order.payment_status == 'completed'
-    ).scalar() or 0
-    total_sales = revenue_from_sales + revenue_from_orders
-    
-    # Count transactions
-    manual_sales_count = Sale.query.count()
-    orders_count = Order.query.count()
-    total_transactions = manual_sales_count + orders_count
-    
-    total_customers = User.query.filter_by(role='customer').count()
+    totals = get_cached_report_totals()
     
     return render_template('admin/reports.html', 
-                          total_sales=total_sales,
-                          total_transactions=total_transactions,
-                          total_customers=total_customers)
+                          total_sales=totals['total_sales'],
+                          total_transactions=totals['total_transactions'],
+                          total_customers=totals['total_customers'])
+
+
+@app.route('/admin/export/<kind>')
+@login_required
+def admin_export(kind):
+    """Stream orders, sales, customers or the points ledger as CSV or JSONL"""
+    if not current_user.is_admin:
+        abort(403)
+
+    export = EXPORTS.get(kind)
+    if export is None:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400)
+    date_from, date_to = parse_date_range(request.args)
+    trailer = request.args.get('trailer') == '1'
+
+    return Response(
+        stream_with_context(stream_export(export, fmt, date_from, date_to, trailer=trailer)),
+        mimetype=FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename="{export_filename(export, fmt, date_from, date_to)}"',
+            'X-Accel-Buffering': 'no',  # let nginx pass chunks straight through
+        },
+    )
 
 
 @app.route('/admin/settings')
@@ -1094,9 +1076,168 @@ def admin_settings():
     return render_template('admin/settings.html')
 
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this process (admins, or a scraper with METRICS_TOKEN)"""
+    token = app.config['METRICS_TOKEN']
+    authorization = request.headers.get('Authorization', '')
+    scraper = token and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not scraper:
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        if not current_user.is_admin:
+            abort(403)
+
+    lines = [instrumentation.render_prometheus()]
+    khalti_stats = khalti.metrics()
+    lines += metric_lines('khalti_requests_total', 'counter', 'Calls made to the Khalti API.',
+                          [({'endpoint': name}, stats['calls']) for name, stats in khalti_stats.items()])
+    lines += metric_lines('khalti_errors_total', 'counter', 'Khalti calls that failed.',
+                          [({'endpoint': name}, stats['errors']) for name, stats in khalti_stats.items()])
+    lines += metric_lines('khalti_request_duration_seconds_total', 'counter', 'Time spent waiting for Khalti.',
+                          [({'endpoint': name}, f"{stats['total_seconds']:.6f}") for name, stats in khalti_stats.items()])
+    lines += metric_lines('catalog_cache_requests_total', 'counter', 'Catalog cache lookups, by result.',
+                          [({'result': 'hit'}, catalog.hits), ({'result': 'miss'}, catalog.misses)])
+    lines += metric_lines('kpi_cache_requests_total', 'counter', 'Admin KPI cache lookups, by group and result.',
+                          [({'group': group, 'result': 'hit'}, kpi_cache.hits[group]) for group in KPI_GROUPS]
+                          + [({'group': group, 'result': 'miss'}, kpi_cache.misses[group]) for group in KPI_GROUPS])
+    pools = db_config.pool_stats(app)
+    for key, kind, help_text in (
+        ('size', 'gauge', 'Configured connection pool size.'),
+        ('checked_out', 'gauge', 'Connections currently in use.'),
+        ('checked_in', 'gauge', 'Idle connections in the pool.'),
+        ('overflow', 'gauge', 'Connections opened beyond the pool size (negative: unused capacity).'),
+        ('connects', 'counter', 'New database connections opened.'),
+        ('checkouts', 'counter', 'Connections checked out of the pool.'),
+        ('invalidations', 'counter', 'Connections discarded after an error or failed ping.'),
+    ):
+        suffix = '_total' if kind == 'counter' else ''
+        lines += metric_lines(f'db_pool_{key}{suffix}', kind, help_text,
+                              [({'engine': name}, stats[key]) for name, stats in pools.items() if key in stats])
+    return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@app.cli.command('rebuild-revenue')
+def rebuild_revenue_command():
+    """Rebuild the DailyRevenue rollup from all sales and orders"""
+    rows = rebuild_daily_revenue()
+    print(f'Rebuilt {rows} daily revenue rows.')
+
+
+@app.cli.command('reconcile-points')
+@click.option('--dry-run', is_flag=True, help='Only report cards whose balance differs from the ledger')
+def reconcile_points_command(dry_run):
+    """Recompute every loyalty card balance and tier from the points ledger"""
+    if dry_run:
+        print(f'{count_drifted_cards()} loyalty cards differ from the ledger.')
+        return
+    drifted = reconcile_balances()
+    print(f'Reconciled loyalty cards; {drifted} balances were corrected.')
+
+
+
+@app.cli.command('migrate')
+@click.option('--to', 'target', type=int, default=None, help='Version to upgrade or downgrade to (default: latest)')
+@click.option('--status', is_flag=True, help='List migrations and whether they are applied')
+def migrate_command(target, status):
+    """Apply versioned schema migrations"""
+    if status:
+        for migration, applied in migration_status():
+            print(f'{migration.version:04d} {migration.name:30} {"applied" if applied else "pending"}')
+        return
+    try:
+        steps = migrate(target)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+    if not steps:
+        print('Database is up to date.')
+    else:
+        print(f'Database is at version {LATEST_VERSION if target is None else target}.')
+
+
+@app.cli.command('process-images')
+@click.option('--force', is_flag=True, help='Regenerate variants even if they already exist')
+def process_images_command(force):
+    """Generate sized and WebP variants for existing product images"""
+    processed = failed = 0
+    for product in Product.query.filter(Product.image_filename.isnot(None)).all():
+        old_filename = product.image_filename
+        path = os.path.join(UPLOAD_FOLDER, old_filename)
+        if old_filename.startswith('placeholder.') or not allowed_file(old_filename) or not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            product.image_filename = process_image(data, old_filename.rsplit('.', 1)[1].lower(), UPLOAD_FOLDER, force=force)
+        except ValueError as e:
+            print(f'Skipping product {product.id} ({old_filename}): {e}')
+            failed += 1
+            continue
+        db.session.commit()
+        processed += 1
+        # The original now lives under its hashed name
+        if product.image_filename != old_filename and not Product.query.filter_by(image_filename=old_filename).count():
+            os.remove(path)
+    print(f'Processed {processed} product images, {failed} failed.')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Create the product search index and repopulate it from the product table"""
+    ensure_search_index(rebuild=True)
+    catalog.invalidate()
+    print('Product search index rebuilt.')
+
+
+@app.cli.command('prune-carts')
+@click.option('--days', type=int, default=30, show_default=True, help='Remove carts idle for this many days')
+def prune_carts_command(days):
+    """Delete abandoned server-side carts"""
+    removed = prune_carts(days)
+    print(f'Removed {removed} cart lines idle for more than {days} days.')
+
+
+@app.cli.command('import-sales')
+@click.argument('csv_file', type=click.File('rb'))
+@click.option('--chunk-size', type=int, default=None, help='Rows per transaction (default: SALE_IMPORT_CHUNK_SIZE)')
+def import_sales_command(csv_file, chunk_size):
+    """Import point-of-sale sales from a CSV file (username,amount,items,date,client_id)"""
+    result = import_sales(csv_file, chunk_size=chunk_size or app.config['SALE_IMPORT_CHUNK_SIZE'])
+    for error in result.errors:
+        print(f'line {error.line}: {error.message}')
+    print(f'Imported {result.imported} of {result.rows} sales, {result.points} points issued, '
+          f'{result.duplicates} already imported, {len(result.errors)} errors.')
+
+
+@app.cli.command('payment-worker')
+@click.option('--once', is_flag=True, help='Verify the payments that are due and exit')
+@click.option('--interval', type=float, default=None, help='Seconds to wait when nothing is due')
+def payment_worker_command(once, interval):
+    """Verify pending Khalti payments and finalize completed ones"""
+    if once:
+        print(f'Checked {process_due_payments(khalti)} pending payments.')
+        return
+    worker = PaymentWorker(app, khalti, interval=interval or app.config['PAYMENT_WORKER_INTERVAL'])
+    worker.start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+def start_payment_worker():
+    """Verify Khalti payments in a background thread of this process"""
+    worker = PaymentWorker(app, khalti, interval=app.config['PAYMENT_WORKER_INTERVAL'])
+    worker.start()
+    return worker
+
+
 if __name__ == '__main__':
     if not os.path.exists('stationery.db'):
         with app.app_context():
-            db.create_all()
+            migrate()
             print("Database created.")
+    # With the reloader, only the child process that serves requests runs the worker
+    if app.config['PAYMENT_WORKER_THREAD'] and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_payment_worker()
     app.run(debug=True)
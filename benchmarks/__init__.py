@@ -0,0 +1,6 @@
+"""
+Load and stress scripts, run against a throwaway database.
+
+Each module is runnable with `python -m benchmarks.<name>` from the project
+root and never touches instance/stationery.db unless told to.
+"""
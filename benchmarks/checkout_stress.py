@@ -0,0 +1,124 @@
+"""
+Concurrent checkout stress test for the stock reservation.
+
+Spawns several worker processes that all buy the same product through
+/place_order at once, then checks that stock never went negative and that
+every unit sold is accounted for by an order item.
+
+Usage (from the project root):
+  python -m benchmarks.checkout_stress --workers 8 --attempts 40 --stock 100
+
+Pass --database-url to run against Postgres instead of a temporary SQLite file.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+PASSWORD = 'stress-test'
+FORM = {
+    'full_name': 'Stress Tester',
+    'email': 'stress@example.com',
+    'phone': '9800000000',
+    'address': 'Test Street',
+    'city': 'Kathmandu',
+    'postal_code': '44600',
+    'delivery_option': 'standard',
+    'payment_method': 'cod',
+}
+
+
+def seed(stock, workers):
+    """Create one product and one customer per worker; returns the product id"""
+    from werkzeug.security import generate_password_hash
+    from app import app
+    from models import db, User, LoyaltyCard, Product
+
+    with app.app_context():
+        db.create_all()
+        product = Product(name='Stress Test Pen', price=50.0, stock=stock, category='Pens')
+        db.session.add(product)
+        password = generate_password_hash(PASSWORD)
+        for i in range(workers):
+            user = User(username=f'stress_{i}', email=f'stress_{i}@example.com', password=password)
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(LoyaltyCard(user_id=user.id))
+        db.session.commit()
+        return product.id
+
+
+def worker(index, product_id, attempts, quantity, start_at):
+    """Log in as one customer and hammer /place_order for the product"""
+    from app import app
+
+    client = app.test_client()
+    client.post('/login', data={'username': f'stress_{index}', 'password': PASSWORD})
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+
+    for _ in range(attempts):
+        # Start every attempt from a cart holding just this product
+        client.get(f'/remove_from_cart/{product_id}')
+        client.post(f'/add_to_cart/{product_id}', data={'quantity': quantity})
+        client.post('/place_order', data=FORM)
+
+
+def check(product_id, initial_stock):
+    """Compare final stock with the units recorded on order items"""
+    from sqlalchemy import func
+    from app import app
+    from models import db, Product, OrderItem
+
+    with app.app_context():
+        stock = db.session.get(Product, product_id).stock
+        sold = db.session.query(func.coalesce(func.sum(OrderItem.quantity), 0)).filter(
+            OrderItem.product_id == product_id
+        ).scalar()
+    return stock, sold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=40, help='checkouts per worker')
+    parser.add_argument('--quantity', type=int, default=3, help='units per checkout')
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='checkout-stress-'), 'stress.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    print(f'Database: {os.environ["DATABASE_URL"]}')
+
+    product_id = seed(args.stock, args.workers)
+
+    # Spawned children re-import app with the same DATABASE_URL
+    ctx = multiprocessing.get_context('spawn')
+    start_at = time.time() + 2
+    processes = [
+        ctx.Process(target=worker, args=(i, product_id, args.attempts, args.quantity, start_at))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    stock, sold = check(product_id, args.stock)
+    requested = args.workers * args.attempts * args.quantity
+    print(f'Requested {requested} units, sold {sold}, stock left {stock} (started with {args.stock})')
+
+    ok = stock >= 0 and stock + sold == args.stock
+    print('OK' if ok else 'FAILED: stock is inconsistent')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Concurrent write throughput on SQLite, before and after the db_config tuning.
+
+Several worker processes (like gunicorn workers) record POS sales the way
+/admin/add_sale does (sale row, points ledger entry, card balance, revenue
+rollup) while reader processes keep loading customer dashboards. Each mode
+runs on a fresh database file:
+
+  before  rollback journal, synchronous=FULL, 5 s busy timeout (the old
+          sqlite3 defaults)
+  after   WAL, synchronous=NORMAL, SQLITE_BUSY_TIMEOUT (db_config defaults)
+
+and reports committed writes per second, reads per second and failed
+transactions ("database is locked").
+
+Usage (from the project root):
+  python -m benchmarks.concurrent_writes --writers 4 --readers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+MODES = {
+    'before': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_BUSY_TIMEOUT': '5000'},
+    'after': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'SQLITE_BUSY_TIMEOUT': '5000'},
+}
+CUSTOMERS = 50
+
+
+def _configure(database_url, mode):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['PAYMENT_WORKER_THREAD'] = '0'
+    os.environ['SLOW_QUERY_SECONDS'] = '60'  # lock waits are expected here, do not log them
+    os.environ.update(MODES[mode])
+
+
+def seed(database_url, mode):
+    _configure(database_url, mode)
+    from app import app
+    from models import db, User, LoyaltyCard
+    from schema_migrations import migrate
+
+    with app.app_context():
+        migrate(log=lambda message: None)
+        for i in range(CUSTOMERS):
+            user = User(username=f'writer_{i}', email=f'writer_{i}@example.com', password='-')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(LoyaltyCard(user_id=user.id))
+        db.session.commit()
+
+
+def writer(database_url, mode, index, start_at, stop_at, results):
+    """Record sales until stop_at; puts (writes, failures)"""
+    _configure(database_url, mode)
+    from sqlalchemy.exc import OperationalError
+    from app import app
+    from models import db, User, Sale
+    from points_ledger import earn_points
+    from revenue_rollup import record_sale
+
+    writes = failures = 0
+    with app.app_context():
+        while time.time() < start_at:
+            time.sleep(0.001)
+        i = 0
+        while time.time() < stop_at:
+            i += 1
+            try:
+                user = User.query.filter_by(username=f'writer_{(index * 7 + i) % CUSTOMERS}').first()
+                sale = Sale(user_id=user.id, amount=250.0, items='Benchmark pens')
+                db.session.add(sale)
+                db.session.flush()
+                earn_points(user.id, 25, 'Sale of Rs. 250.0 - Benchmark pens')
+                record_sale(sale, 25)
+                db.session.commit()
+                writes += 1
+            except OperationalError:
+                db.session.rollback()
+                failures += 1
+    results.put(('write', writes, failures))
+
+
+def reader(database_url, mode, index, start_at, stop_at, results):
+    """Load a customer's card, recent sales and ledger until stop_at"""
+    _configure(database_url, mode)
+    from sqlalchemy.exc import OperationalError
+    from app import app
+    from models import db, LoyaltyCard, Sale, PointsTransaction
+
+    reads = failures = 0
+    with app.app_context():
+        while time.time() < start_at:
+            time.sleep(0.001)
+        i = 0
+        while time.time() < stop_at:
+            i += 1
+            user_id = (index * 11 + i) % CUSTOMERS + 1
+            try:
+                LoyaltyCard.query.filter_by(user_id=user_id).first()
+                Sale.query.filter_by(user_id=user_id).order_by(Sale.date.desc()).limit(10).all()
+                PointsTransaction.query.filter_by(user_id=user_id).order_by(
+                    PointsTransaction.created_at.desc()).limit(10).all()
+                db.session.rollback()  # end the read transaction like a request would
+                reads += 1
+            except OperationalError:
+                db.session.rollback()
+                failures += 1
+    results.put(('read', reads, failures))
+
+
+def run(mode, writers, readers, seconds):
+    path = os.path.join(tempfile.mkdtemp(prefix=f'concurrent-{mode}-'), 'bench.db')
+    database_url = f'sqlite:///{path}'
+    context = multiprocessing.get_context('spawn')  # each process imports the app with its own settings
+
+    process = context.Process(target=seed, args=(database_url, mode))
+    process.start()
+    process.join()
+
+    results = context.Queue()
+    start_at = time.time() + 3  # give every process time to import the app
+    stop_at = start_at + seconds
+    processes = [context.Process(target=writer, args=(database_url, mode, i, start_at, stop_at, results))
+                 for i in range(writers)]
+    processes += [context.Process(target=reader, args=(database_url, mode, i, start_at, stop_at, results))
+                  for i in range(readers)]
+    for process in processes:
+        process.start()
+    totals = {'write': [0, 0], 'read': [0, 0]}
+    for _ in processes:
+        kind, done, failed = results.get()
+        totals[kind][0] += done
+        totals[kind][1] += failed
+    for process in processes:
+        process.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f'{args.writers} writers, {args.readers} readers, {args.seconds:g}s per mode')
+    print(f'{"mode":8} {"writes/s":>10} {"reads/s":>10} {"failed writes":>14} {"failed reads":>13}')
+    for mode in MODES:
+        totals = run(mode, args.writers, args.readers, args.seconds)
+        print(f'{mode:8} {totals["write"][0] / args.seconds:10.1f} {totals["read"][0] / args.seconds:10.1f} '
+              f'{totals["write"][1]:14} {totals["read"][1]:13}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
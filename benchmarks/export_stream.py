@@ -0,0 +1,104 @@
+"""
+Time to first byte and memory of the streaming admin exports.
+
+Generates a synthetic dataset (benchmarks.synthetic_data) in a temporary
+SQLite file, then downloads every export through the Flask test client
+without buffering, the way a browser receives it. For each export it
+reports rows, bytes, time to the first data chunk, total time, and the
+peak Python memory allocated while streaming (tracemalloc, measured in a
+second pass). Unless --no-baseline is given, the peak for loading the same
+rows with .all() is shown next to it. Downloads ask for the end-of-export
+trailer (?trailer=1), and each must end with the one for the rows it holds.
+
+Run it at two sizes to see that the streaming peak does not grow with the
+table:
+  python -m benchmarks.export_stream --orders 10000
+  python -m benchmarks.export_stream --orders 500000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+KINDS = ['orders', 'sales', 'customers', 'points']
+
+
+def download(client, kind, fmt):
+    """(rows, bytes, seconds to first data chunk, total seconds, ends with its trailer)"""
+    from data_export import export_trailer
+
+    started = time.perf_counter()
+    response = client.get(f'/admin/export/{kind}?format={fmt}&trailer=1', buffered=False)
+    first = None
+    last = ''
+    size = lines = 0
+    for index, chunk in enumerate(response.response):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode()
+        if first is None and (index > 0 or fmt == 'jsonl'):
+            first = time.perf_counter() - started
+        size += len(chunk)
+        lines += chunk.count('\n')
+        last = chunk
+    response.close()
+    rows = lines - 2 if fmt == 'csv' else lines - 1  # header and trailer
+    return rows, size, first or 0.0, time.perf_counter() - started, last == export_trailer(fmt, rows)
+
+
+def peak_mib(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--sales', type=int, default=50000)
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--no-baseline', action='store_true', help='skip the .all() comparison')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='export-stream-'), 'export.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['PAYMENT_WORKER_THREAD'] = '0'
+    os.environ['SLOW_QUERY_SECONDS'] = '60'
+
+    from app import app
+    from benchmarks.synthetic_data import PASSWORD, generate
+    from data_export import EXPORTS, export_statement
+    from models import db
+
+    with app.app_context():
+        generate(users=args.users, orders=args.orders, sales=args.sales,
+                 log=lambda message: print(message, file=sys.stderr))
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'load_admin', 'password': PASSWORD})
+
+    print(f'{"export":10} {"rows":>9} {"MiB":>8} {"first ms":>9} {"total s":>8} {"rows/s":>9} '
+          f'{"complete":>8} {"peak MiB":>9} {".all() MiB":>11}')
+    all_complete = True
+    for kind in KINDS:
+        rows, size, first, total, complete = download(client, kind, args.format)
+        all_complete = all_complete and complete
+        streaming_peak = peak_mib(lambda: download(client, kind, args.format))
+        baseline = ''
+        if not args.no_baseline:
+            def load_all():
+                with app.app_context():
+                    db.session.execute(export_statement(EXPORTS[kind])).all()
+            baseline = f'{peak_mib(load_all):11.1f}'
+        print(f'{kind:10} {rows:9} {size / 2 ** 20:8.1f} {first * 1000:9.1f} {total:8.2f} '
+              f'{rows / total:9.0f} {str(complete):>8} {streaming_peak:9.1f} {baseline}')
+    return 0 if all_complete else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Load test for the POS sync API (/api/pos/sales:batch).
+
+Starts one gunicorn worker on a local port over a database of synthetic
+customers (benchmarks.synthetic_data), then several simulated terminals
+push batches of new sales at once. A share of the batches is sent twice,
+as a terminal does when a response is lost, and must come back as
+duplicates, and a batch answered 409 is resent after its Retry-After like
+a terminal would. Reports sales absorbed per second and per-batch latency, then
+checks that every sale was recorded exactly once and that card balances
+still match the points ledger.
+
+Usage (from the project root):
+  python -m benchmarks.pos_sync_load --terminals 4 --batches 50 --batch-size 100
+  python -m benchmarks.pos_sync_load --database-url postgresql://... --workers 2
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks.route_load import percentile, start_gunicorn
+
+TOKEN = 'pos-load-test'
+
+
+def make_batch(rng, size, users):
+    return {'sales': [
+        {'id': str(uuid.uuid4()), 'username': f'load_{rng.randrange(users)}',
+         'amount': round(rng.uniform(20, 5000), 2), 'items': f'{rng.randint(1, 9)}x Notebooks'}
+        for _ in range(size)
+    ]}
+
+
+def run_terminals(base_url, terminals, batches, batch_size, users, replay_rate, seed):
+    """Push batches from `terminals` threads; returns (latencies, counts, wall seconds)"""
+    import requests
+
+    latencies = []
+    counts = {'created': 0, 'duplicates': 0, 'errors': 0, 'failed_requests': 0, 'replays': 0, 'conflicts': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(terminals + 1)
+
+    def terminal(index):
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        session.headers['Authorization'] = f'Bearer {TOKEN}'
+        barrier.wait()
+        for _ in range(batches):
+            batch = make_batch(rng, batch_size, users)
+            sends = 2 if rng.random() < replay_rate else 1
+            for attempt in range(sends):
+                started = time.perf_counter()
+                response = session.post(f'{base_url}/api/pos/sales:batch', json=batch, timeout=120)
+                while response.status_code == 409:
+                    with lock:
+                        counts['conflicts'] += 1
+                    time.sleep(float(response.headers.get('Retry-After', 1)))
+                    response = session.post(f'{base_url}/api/pos/sales:batch', json=batch, timeout=120)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    counts['replays'] += attempt
+                    if response.status_code != 200:
+                        counts['failed_requests'] += 1
+                        continue
+                    body = response.json()
+                    for key in ('created', 'duplicates', 'errors'):
+                        counts[key] += body[key]
+
+    threads = [threading.Thread(target=terminal, args=(i,)) for i in range(terminals)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, counts, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='defaults to a new temporary SQLite file')
+    parser.add_argument('--users', type=int, default=10000, help='synthetic customers to create')
+    parser.add_argument('--terminals', type=int, default=4, help='concurrent terminals')
+    parser.add_argument('--batches', type=int, default=50, help='batches per terminal')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--replay-rate', type=float, default=0.1, help='share of batches sent twice')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='pos-sync-'), 'pos.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['PAYMENT_WORKER_THREAD'] = '0'
+    os.environ['SLOW_QUERY_SECONDS'] = '60'
+    os.environ['POS_API_TOKENS'] = f'load:{TOKEN}'
+    os.environ['POS_BATCH_MAX'] = str(max(args.batch_size, 1))
+
+    from app import app
+    from models import db, Sale
+    from points_ledger import count_drifted_cards
+    from benchmarks.synthetic_data import generate
+
+    with app.app_context():
+        generate(users=args.users, products=10, orders=0, sales=0, seed=args.seed,
+                 log=lambda message: print(message, file=sys.stderr))
+        db.session.remove()
+
+    server = start_gunicorn(args.port, args.workers, TOKEN)
+    try:
+        latencies, counts, wall = run_terminals(f'http://127.0.0.1:{args.port}', args.terminals, args.batches,
+                                                args.batch_size, args.users, args.replay_rate, args.seed)
+    finally:
+        server.terminate()
+        server.wait()
+
+    with app.app_context():
+        recorded = db.session.query(Sale).filter(Sale.client_id.isnot(None)).count()
+        drifted = count_drifted_cards()
+
+    expected = args.terminals * args.batches * args.batch_size
+    report = {
+        'database': os.environ['DATABASE_URL'].split('@')[-1],
+        'gunicorn_workers': args.workers,
+        'terminals': args.terminals,
+        'batch_size': args.batch_size,
+        'requests': len(latencies),
+        'replayed_batches': counts['replays'],
+        'failed_requests': counts['failed_requests'],
+        'conflicts_retried': counts['conflicts'],
+        'sales_created': counts['created'],
+        'duplicates_reported': counts['duplicates'],
+        'item_errors': counts['errors'],
+        'sales_per_second': round(counts['created'] / wall, 1),
+        'batch_p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'batch_p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'batch_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'sales_recorded': recorded,
+        'recorded_once': recorded == expected == counts['created'],
+        'cards_drifted': drifted,
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if report['recorded_once'] and drifted == 0 and not counts['failed_requests'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Microbenchmark for the checkout pricing engine.
+
+Seeds a catalog in a temporary SQLite database, builds random carts and
+times three ways of pricing all of them:
+
+  per-cart   resolve_cart() + PricingEngine.price() for each cart, as a
+             checkout does (one product query per cart)
+  batch      PricingEngine.quote_many(), one product query for every cart
+  price      PricingEngine.price() alone on already resolved lines (the
+             pure rules, no database)
+
+and reports carts per second and queries for each, e.g. to size a
+promotion simulation over many customers' carts.
+
+Usage (from the project root):
+  python -m benchmarks.pricing_engine --carts 5000 --products 2000 --lines 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def seed(products):
+    from app import app
+    from models import db, Product
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(
+            Product(name=f'Bench Pen {i}', price=round(random.uniform(10, 500), 2), stock=1000, category='Pens')
+            for i in range(products)
+        )
+        db.session.commit()
+
+
+def make_carts(count, products, lines):
+    """[(cart items, points balance)] with 1..lines random products each"""
+    return [
+        ({random.randint(1, products): random.randint(1, 5) for _ in range(random.randint(1, lines))},
+         random.choice([None, 0, 50, 150, 900]))
+        for _ in range(count)
+    ]
+
+
+def run(label, func, count, queries):
+    queries.clear()
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f'{label:10} {elapsed * 1000:9.1f} ms {count / elapsed:10.0f} carts/s {len(queries):8} queries')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--carts', type=int, default=5000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=4, help='most distinct products per cart')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    directory = tempfile.mkdtemp(prefix='pricing-engine-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, "bench.db")}'
+    os.environ['PAYMENT_WORKER_THREAD'] = '0'
+    os.environ['SLOW_QUERY_SECONDS'] = '60'
+    seed(args.products)
+
+    from sqlalchemy import event
+    from app import app
+    from checkout import resolve_cart
+    from models import db
+    from pricing import pricing
+
+    carts = make_carts(args.carts, args.products, args.lines)
+    queries = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: queries.append(1))
+
+        def per_cart():
+            for items, balance in carts:
+                pricing.price(resolve_cart(items).lines, 'standard', balance)
+
+        def batch():
+            pricing.quote_many(carts)
+
+        resolved = [(resolve_cart(items).lines, balance) for items, balance in carts]
+        db.session.expunge_all()
+
+        def price_only():
+            for lines, balance in resolved:
+                pricing.price(lines, 'standard', balance)
+
+        print(f'{args.carts} carts, up to {args.lines} lines, {args.products} products')
+        slow = run('per-cart', per_cart, args.carts, queries)
+        db.session.expunge_all()
+        fast = run('batch', batch, args.carts, queries)
+        run('price', price_only, args.carts, queries)
+        print(f'batch speedup: {slow / fast:.1f}x')
+
+        # Both paths must agree on every total
+        db.session.expunge_all()
+        expected = [pricing.price(resolve_cart(items).lines, 'standard', balance).total for items, balance in carts]
+        got = [quote.total for quote in pricing.quote_many(carts)]
+        mismatches = sum(1 for a, b in zip(expected, got) if abs(a - b) > 1e-6)
+        print(f'total mismatches: {mismatches}')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Before/after benchmark for the query path indexes (migration 0003).
+
+Seeds a throwaway database, then runs the app's hot queries twice: once with
+the indexes reverted (`migrate --to 2`) and once fully migrated, printing
+each query's plan and median timing side by side.
+
+Usage (from the project root):
+  python -m benchmarks.query_plans --users 2000 --rows 100000
+
+Pass --database-url to run against Postgres instead of a temporary SQLite file.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def seed(users, rows, batch=5000):
+    """Bulk-insert customers with cards, orders, sales and ledger rows"""
+    from app import app
+    from models import db, User, LoyaltyCard, Order, Sale, PointsTransaction, Product
+    from schema_migrations import migrate
+
+    rng = random.Random(7)
+    now = datetime.utcnow()
+
+    def when():
+        return now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+
+    with app.app_context():
+        migrate(log=lambda message: None)
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'bench_{i}', 'email': f'bench_{i}@example.com', 'password': 'x', 'role': 'customer'}
+            for i in range(users)
+        ])
+        db.session.execute(LoyaltyCard.__table__.insert(), [
+            {'user_id': i + 1, 'points': rng.randint(0, 1500), 'tier': rng.choice(['Silver', 'Gold', 'Platinum'])}
+            for i in range(users)
+        ])
+        db.session.execute(Product.__table__.insert(), [
+            {'name': f'Bench Product {i}', 'price': 100, 'stock': rng.randint(0, 200), 'category': 'Bench'}
+            for i in range(2000)
+        ])
+        for start in range(0, rows, batch):
+            size = min(batch, rows - start)
+            db.session.execute(Order.__table__.insert(), [
+                {
+                    'user_id': rng.randint(1, users), 'email': 'e', 'phone': '1', 'full_name': 'n',
+                    'address': 'a', 'city': 'c', 'postal_code': '1', 'subtotal': 500, 'total': 500,
+                    'payment_status': rng.choice(['pending', 'completed', 'completed', 'failed']),
+                    'order_status': rng.choice(['pending', 'processing', 'shipped', 'delivered', 'delivered']),
+                    'created_at': when(),
+                }
+                for _ in range(size)
+            ])
+            db.session.execute(Sale.__table__.insert(), [
+                {'user_id': rng.randint(1, users), 'amount': 250, 'items': 'pens', 'date': when()}
+                for _ in range(size)
+            ])
+            db.session.execute(PointsTransaction.__table__.insert(), [
+                {'user_id': rng.randint(1, users), 'points': 25, 'type': 'earn', 'created_at': when()}
+                for _ in range(size)
+            ])
+            db.session.commit()
+
+
+def hot_queries():
+    """(label, statement) pairs mirroring what the routes run"""
+    from sqlalchemy import func, select
+    from models import Order, Sale, PointsTransaction, LoyaltyCard, Product
+
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    return [
+        ('my_orders', select(Order).where(Order.user_id == 42).order_by(Order.created_at.desc())),
+        ('admin orders by status', select(Order).where(Order.order_status == 'pending')
+            .order_by(Order.created_at.desc(), Order.id.desc()).limit(51)),
+        ('completed revenue, last 7 days', select(func.sum(Order.total))
+            .where(Order.payment_status == 'completed', Order.created_at >= week_ago)),
+        ('customer sales feed', select(Sale).where(Sale.user_id == 42).order_by(Sale.date.desc()).limit(21)),
+        ('customer points feed', select(PointsTransaction).where(PointsTransaction.user_id == 42)
+            .order_by(PointsTransaction.created_at.desc()).limit(21)),
+        ('recent sales', select(Sale).order_by(Sale.date.desc()).limit(5)),
+        ('tier counts', select(LoyaltyCard.tier, func.count()).group_by(LoyaltyCard.tier)),
+        ('low stock count', select(func.count()).select_from(Product).where(Product.stock < 10)),
+    ]
+
+
+def explain(conn, statement):
+    from sqlalchemy import text
+
+    sql = str(statement.compile(conn, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+    return [row[0] for row in conn.execute(text(f'EXPLAIN {sql}'))]
+
+
+def measure(repeat):
+    """{label: (plan lines, median ms)} for every hot query"""
+    from app import app
+    from models import db
+
+    results = {}
+    with app.app_context(), db.engine.connect() as conn:
+        for label, statement in hot_queries():
+            conn.execute(statement).all()  # warm up
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(statement).all()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[label] = (explain(conn, statement), statistics.median(timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=100000, help='orders, sales and ledger rows each')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='query-plans-'), 'plans.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    print(f'Database: {os.environ["DATABASE_URL"]}')
+
+    from app import app
+    from schema_migrations import migrate
+
+    seed(args.users, args.rows)
+    with app.app_context():
+        migrate(2, log=lambda message: None)
+    before = measure(args.repeat)
+    with app.app_context():
+        migrate(log=lambda message: None)
+    after = measure(args.repeat)
+
+    for label, (plan_before, ms_before) in before.items():
+        plan_after, ms_after = after[label]
+        print(f'\n{label}: {ms_before:.2f} ms -> {ms_after:.2f} ms')
+        print('  before: ' + '\n          '.join(plan_before))
+        print('  after:  ' + '\n          '.join(plan_after))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Check which database each route reads from with a read replica configured.
+
+Seeds a primary database, copies it to a replica (two SQLite files by
+default), then requests the storefront, checkout and admin pages and counts
+the statements each engine executed per route. Report and dashboard routes
+and catalog cache misses should read from the replica; checkout, points and
+order writes must stay on the primary.
+
+Usage (from the project root):
+  python -m benchmarks.replica_routing
+  python -m benchmarks.replica_routing --database-url postgresql://.../shop \\
+      --replica-url postgresql://.../shop_replica
+
+Given URLs, the primary is seeded and the replica is expected to be
+replicating from it; nothing is copied.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+PASSWORD = 'replica-check'
+FORM = {
+    'full_name': 'Replica Tester', 'email': 'replica@example.com', 'phone': '9800000000',
+    'address': 'Test Street', 'city': 'Kathmandu', 'postal_code': '44600',
+    'delivery_option': 'standard', 'payment_method': 'cod',
+}
+ROUTES = [
+    ('customer', 'GET', '/products'),
+    ('customer', 'GET', '/product/1'),
+    ('customer', 'POST', '/add_to_cart/1'),
+    ('customer', 'POST', '/place_order'),
+    ('customer', 'GET', '/my_orders'),
+    ('admin', 'GET', '/admin/dashboard'),
+    ('admin', 'GET', '/admin/reports'),
+    ('admin', 'GET', '/admin/sales'),
+    ('admin', 'GET', '/admin/customers'),
+    ('admin', 'GET', '/admin/orders'),
+]
+
+
+def seed():
+    from werkzeug.security import generate_password_hash
+    from app import app
+    from models import db, User, LoyaltyCard, Product
+    from schema_migrations import migrate
+
+    with app.app_context():
+        migrate(log=lambda message: None)
+        password = generate_password_hash(PASSWORD)
+        customer = User(username='replica_customer', email='c@example.com', password=password)
+        db.session.add(User(username='replica_admin', email='a@example.com', password=password, role='admin'))
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add(LoyaltyCard(user_id=customer.id, points=100))
+        for i in range(10):
+            db.session.add(Product(name=f'Replica Pen {i}', price=40 + i, stock=100, category='Pens'))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--replica-url')
+    args = parser.parse_args()
+    if bool(args.database_url) != bool(args.replica_url):
+        parser.error('pass both --database-url and --replica-url, or neither')
+
+    os.environ['PAYMENT_WORKER_THREAD'] = '0'
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+        os.environ['DATABASE_REPLICA_URL'] = args.replica_url
+        seed()
+    else:
+        directory = tempfile.mkdtemp(prefix='replica-routing-')
+        primary, replica = os.path.join(directory, 'primary.db'), os.path.join(directory, 'replica.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{primary}'
+        os.environ['DATABASE_REPLICA_URL'] = f'sqlite:///{replica}'
+        # Seed with WAL off so the primary is a single self-contained file to copy
+        os.environ['SQLITE_JOURNAL_MODE'] = 'DELETE'
+        from models import db
+        seed()
+        from app import app
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+        shutil.copyfile(primary, replica)
+        print(f'Primary: {primary}\nReplica: {replica} (copied)')
+
+    from sqlalchemy import event
+    from app import app
+    from models import db
+
+    statements = Counter()
+    with app.app_context():
+        engines = dict(db.engines)
+    for bind, engine in engines.items():
+        name = bind or 'primary'
+        event.listen(engine, 'before_cursor_execute',
+                     lambda *a, name=name: statements.update([name]))
+
+    clients = {'customer': app.test_client(), 'admin': app.test_client()}
+    clients['customer'].post('/login', data={'username': 'replica_customer', 'password': PASSWORD})
+    clients['admin'].post('/login', data={'username': 'replica_admin', 'password': PASSWORD})
+
+    print(f'{"route":24} {"status":>6} {"primary":>8} {"replica":>8}')
+    for who, method, path in ROUTES:
+        statements.clear()
+        if method == 'POST':
+            response = clients[who].post(path, data=FORM if path == '/place_order' else {'quantity': 1})
+        else:
+            response = clients[who].get(path)
+        response.close()
+        print(f'{method + " " + path:24} {response.status_code:6} {statements["primary"]:8} {statements["replica"]:8}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Route-level load benchmark.
+
+Drives key routes with concurrent clients, each logged in as its own
+synthetic customer (see benchmarks.synthetic_data), and reports latency
+percentiles, throughput, errors and SQL statements per request as JSON.
+
+Two modes:
+  in-process  Flask test clients in threads; query counts come from the
+              app's instrumentation directly (default)
+  --gunicorn  starts `gunicorn wsgi:app` on a local port and drives it over
+              HTTP; queries per request are read from /metrics, which
+              reflects whichever worker answers the scrape
+
+Usage (from the project root):
+  python -m benchmarks.synthetic_data --users 100000 --orders 1000000   # prints the DB URL
+  python -m benchmarks.route_load --database-url sqlite:////tmp/.../synthetic.db \\
+      --clients 8 --requests 200 --output run.json
+  python -m benchmarks.route_load --database-url ... --gunicorn --workers 4
+
+Without --database-url a small dataset is generated in a temporary file first.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.synthetic_data import PASSWORD
+
+ROUTES = ['/products', '/cart', '/place_order', '/admin/dashboard', '/admin/orders', '/my_orders']
+
+# Route -> Flask endpoint, to match instrumentation and /metrics labels
+ENDPOINTS = {
+    '/products': 'products', '/cart': 'cart', '/place_order': 'place_order',
+    '/admin/dashboard': 'admin_dashboard', '/admin/orders': 'admin_orders', '/my_orders': 'my_orders',
+}
+
+CHECKOUT_FORM = {
+    'full_name': 'Load Tester', 'email': 'load@example.com', 'phone': '9800000000',
+    'address': 'Synthetic Street', 'city': 'Kathmandu', 'postal_code': '44600',
+    'delivery_option': 'standard', 'payment_method': 'cod',
+}
+
+
+class InProcessClient:
+    """Flask test client with the same small interface as HttpClient"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        response.close()
+        return response.status_code
+
+    def post(self, path, data):
+        response = self.client.post(path, data=data)
+        response.close()
+        return response.status_code
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def get(self, path):
+        return self.session.get(self.base_url + path, allow_redirects=False, timeout=60).status_code
+
+    def post(self, path, data):
+        return self.session.post(self.base_url + path, data=data, allow_redirects=False, timeout=60).status_code
+
+
+def run_route(make_client, route, clients, requests_per_client, users, product_ids, seed):
+    """Hit one route from `clients` threads; returns (latencies in s, errors, wall seconds)"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        client = make_client()
+        username = 'load_admin' if route.startswith('/admin') else f'load_{rng.randrange(users)}'
+        client.post('/login', {'username': username, 'password': PASSWORD})
+        barrier.wait()
+        for _ in range(requests_per_client):
+            if route in ('/cart', '/place_order'):
+                client.post(f'/add_to_cart/{rng.choice(product_ids)}', {'quantity': 1})
+            started = time.perf_counter()
+            status = client.post(route, CHECKOUT_FORM) if route == '/place_order' else client.get(route)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def scrape_queries(base_url, token):
+    """{endpoint: (db_queries_total, requests)} from /metrics"""
+    import requests
+    text = requests.get(base_url + '/metrics', headers={'Authorization': f'Bearer {token}'}, timeout=30).text
+    queries, counts = {}, {}
+    for match in re.finditer(r'^db_queries_total\{endpoint="([^"]+)"\} (\S+)$', text, re.M):
+        queries[match.group(1)] = float(match.group(2))
+    for match in re.finditer(r'^db_queries_per_request_count\{endpoint="([^"]+)"\} (\S+)$', text, re.M):
+        counts[match.group(1)] = float(match.group(2))
+    return {endpoint: (queries.get(endpoint, 0), counts.get(endpoint, 0)) for endpoint in queries}
+
+
+def start_gunicorn(port, workers, token):
+    env = dict(os.environ, METRICS_TOKEN=token, PAYMENT_WORKER_THREAD='0')
+    process = subprocess.Popen(
+        ['gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    import requests
+    for _ in range(100):
+        try:
+            requests.get(f'http://127.0.0.1:{port}/login', timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='database seeded by benchmarks.synthetic_data')
+    parser.add_argument('--users', type=int, default=None, help='number of load_<n> customers (default: count them)')
+    parser.add_argument('--routes', nargs='+', default=ROUTES)
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients per route')
+    parser.add_argument('--requests', type=int, default=50, help='requests per client per route')
+    parser.add_argument('--gunicorn', action='store_true', help='run against a local gunicorn instead of in-process')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='route-load-'), 'load.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['PAYMENT_WORKER_THREAD'] = '0'
+
+    from app import app
+    from models import db, User, Product
+    from instrumentation import instrumentation
+
+    with app.app_context():
+        if not args.database_url:
+            from benchmarks.synthetic_data import generate
+            generate(users=1000, orders=10000, sales=5000, log=lambda message: print(message, file=sys.stderr))
+        users = args.users or User.query.filter(User.username.like('load\\_%', escape='\\'), User.role == 'customer').count()
+        product_ids = [product_id for (product_id,) in db.session.query(Product.id).filter(Product.stock > 1000)]
+
+    server = None
+    token = 'route-load'
+    if args.gunicorn:
+        server = start_gunicorn(args.port, args.workers, token)
+        base_url = f'http://127.0.0.1:{args.port}'
+        make_client = lambda: HttpClient(base_url)
+    else:
+        make_client = lambda: InProcessClient(app)
+
+    report = {
+        'mode': 'gunicorn' if args.gunicorn else 'in-process',
+        'database': os.environ['DATABASE_URL'].split('@')[-1],
+        'clients': args.clients,
+        'requests_per_client': args.requests,
+        'routes': {},
+    }
+    try:
+        for route in args.routes:
+            endpoint = ENDPOINTS.get(route, route)
+            before = scrape_queries(base_url, token) if server else None
+            instrumentation.reset()
+            latencies, errors, wall = run_route(make_client, route, args.clients, args.requests,
+                                                users, product_ids, args.seed)
+            if server:
+                after = scrape_queries(base_url, token)
+                queries = after.get(endpoint, (0, 0))[0] - (before or {}).get(endpoint, (0, 0))[0]
+                served = after.get(endpoint, (0, 0))[1] - (before or {}).get(endpoint, (0, 0))[1]
+            else:
+                queries = instrumentation.db_queries[endpoint]
+                served = instrumentation.latency[endpoint].count if endpoint in instrumentation.latency else 0
+            report['routes'][route] = {
+                'requests': len(latencies),
+                'errors': errors,
+                'p50_ms': round(statistics.median(latencies) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+                'throughput_rps': round(len(latencies) / wall, 1),
+                'queries_per_request': round(queries / served, 2) if served else None,
+            }
+            print(f'{route}: {report["routes"][route]}', file=sys.stderr)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Throughput of the bulk POS sale import.
+
+Generates synthetic customers (benchmarks.synthetic_data) in a temporary
+SQLite database, writes a POS batch CSV with a sprinkling of bad rows
+(unknown users, bad amounts, bad dates) and imports it with
+sale_import.import_sales. For comparison, a sample of rows is also recorded
+one at a time the way add_sale does it (user lookup, Sale, earn_points,
+rollup, commit per row).
+
+With --client-ids every row gets a client_id and the file is imported a
+second time, which must record nothing new.
+
+Afterwards every card balance must still match its ledger and the revenue
+rollup must match a full rebuild.
+
+Usage (from the project root):
+  python -m benchmarks.sale_import --rows 100000 --users 10000
+  python -m benchmarks.sale_import --rows 100000 --client-ids
+  python -m benchmarks.sale_import --database-url postgresql://... --rows 50000
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+def make_csv(rows, users, bad_every, seed, client_ids=False):
+    """CSV text for `rows` sales; every bad_every-th row is invalid"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    out = io.StringIO()
+    out.write('username,amount,items,date,client_id\n' if client_ids else 'username,amount,items,date\n')
+    bad = ['nobody_{n},100,Pens,', 'load_{n},abc,Pens,', 'load_{n},-5,Pens,', 'load_{n},50,Pens,yesterday']
+    for n in range(rows):
+        client_id = f',{uuid.UUID(int=rng.getrandbits(128), version=4)}' if client_ids else ''
+        if bad_every and n % bad_every == bad_every - 1:
+            out.write(bad[(n // bad_every) % len(bad)].format(n=n) + client_id + '\n')
+            continue
+        day = (now - timedelta(days=rng.randint(0, 6))).strftime('%Y-%m-%d %H:%M:%S')
+        out.write(f'load_{rng.randrange(users)},{rng.randint(20, 5000)}.{rng.randint(0, 99):02d},'
+                  f'"{rng.randint(1, 9)}x Notebooks, 1x Pen",{day}{client_id}\n')
+    return out.getvalue()
+
+
+def per_row(sample, users, seed):
+    """Record `sample` sales the add_sale way; returns seconds"""
+    from models import db, User, Sale
+    from points_ledger import earn_points
+    from pricing import pricing
+    from revenue_rollup import record_sale
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    for _ in range(sample):
+        user = User.query.filter_by(username=f'load_{rng.randrange(users)}').first()
+        amount = rng.randint(20, 5000)
+        points = pricing.points_earned(amount)
+        sale = Sale(user_id=user.id, amount=amount, items='1x Pen', points_earned=points)
+        db.session.add(sale)
+        db.session.flush()
+        earn_points(user.id, points, f'Sale of Rs. {amount} - 1x Pen')
+        record_sale(sale)
+        db.session.commit()
+    return time.perf_counter() - started
+
+
+def rollup_totals():
+    from sqlalchemy import func
+    from models import db, DailyRevenue
+    return db.session.query(
+        DailyRevenue.day, DailyRevenue.source, DailyRevenue.transactions,
+        func.round(DailyRevenue.revenue, 2), DailyRevenue.points_issued
+    ).order_by(DailyRevenue.day, DailyRevenue.source).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--bad-every', type=int, default=100, help='make every Nth row invalid (0: none)')
+    parser.add_argument('--per-row-sample', type=int, default=500, help='rows to record one at a time')
+    parser.add_argument('--client-ids', action='store_true', help='add a client_id column and import twice')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='defaults to a new temporary SQLite file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='sale-import-'), 'import.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['PAYMENT_WORKER_THREAD'] = '0'
+    os.environ['SLOW_QUERY_SECONDS'] = '60'
+
+    from app import app
+    from benchmarks.synthetic_data import generate
+    from points_ledger import count_drifted_cards
+    from revenue_rollup import rebuild_daily_revenue
+    from sale_import import import_sales
+
+    with app.app_context():
+        generate(users=args.users, products=10, orders=0, sales=0, seed=args.seed, log=lambda message: None)
+        csv_text = make_csv(args.rows, args.users, args.bad_every, args.seed, args.client_ids)
+        csv_bytes = csv_text.encode()
+        print(f'CSV: {len(csv_bytes) / 2 ** 20:.1f} MiB')
+
+        started = time.perf_counter()
+        result = import_sales(io.BytesIO(csv_bytes), chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - started
+        print(f'bulk import: {result.imported} of {result.rows} rows in {elapsed:.2f}s '
+              f'({result.rows / elapsed:,.0f} rows/s), {len(result.errors)} errors, {result.points} points')
+        for error in result.errors[:4]:
+            print(f'  line {error.line}: {error.message}')
+
+        rerun_ok = True
+        if args.client_ids:
+            started = time.perf_counter()
+            again = import_sales(io.BytesIO(csv_bytes), chunk_size=args.chunk_size)
+            elapsed = time.perf_counter() - started
+            rerun_ok = again.imported == 0 and again.duplicates == result.imported
+            print(f're-import:   {again.imported} new, {again.duplicates} duplicates in {elapsed:.2f}s '
+                  f'({again.rows / elapsed:,.0f} rows/s)')
+
+        if args.per_row_sample:
+            seconds = per_row(args.per_row_sample, args.users, args.seed)
+            print(f'per-row:     {args.per_row_sample} rows in {seconds:.2f}s '
+                  f'({args.per_row_sample / seconds:,.0f} rows/s)')
+
+        drifted = count_drifted_cards()
+        before = rollup_totals()
+        rebuild_daily_revenue()
+        rollup_ok = before == rollup_totals()
+        print(f'cards drifted from ledger: {drifted}, rollup matches rebuild: {rollup_ok}')
+    return 0 if drifted == 0 and rollup_ok and rerun_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Product search latency benchmark.
+
+Seeds a throwaway database with synthetic products, builds the search index
+and times search_products() for a mix of queries and filters, bypassing the
+catalog cache so every run hits the database.
+
+Usage (from the project root):
+  python -m benchmarks.search_latency --products 100000 --repeat 50
+
+Pass --database-url to run against Postgres instead of a temporary SQLite file.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+WORDS = ['pen', 'pencil', 'notebook', 'marker', 'eraser', 'ruler', 'stapler', 'folder', 'highlighter',
+         'sketchbook', 'crayon', 'glue', 'scissors', 'envelope', 'diary', 'planner', 'ink', 'refill']
+COLOURS = ['red', 'blue', 'black', 'green', 'yellow', 'pastel', 'neon', 'matte', 'glossy']
+CATEGORIES = ['Pens', 'Pencils', 'Notebooks', 'Art Supplies', 'Office', 'Paper', 'Desk']
+# Descriptions mostly use a long tail of words, like real copy does
+FILLER = [f'{a}{b}{c}' for a in 'bcdfgklmnprst' for b in ('a', 'e', 'i', 'o', 'u', 'ai', 'ou') for c in 'lmnrstxz']
+
+QUERIES = [
+    {'q': 'pen'},
+    {'q': 'blue notebook'},
+    {'q': 'highlighters'},
+    {'q': 'glossy marker', 'in_stock': '1'},
+    {'q': 'pencil', 'category': 'Pencils', 'max_price': '200'},
+    {'q': 'refill', 'page': '5'},
+    {'q': 'pen', 'page': '20'},  # deep pages read every match before them
+    {'category': 'Office', 'min_price': '100'},
+    {},
+]
+
+
+def seed(count, batch=5000):
+    """Insert `count` random products in bulk"""
+    from app import app
+    from models import db, Product
+    from product_search import ensure_search_index
+
+    rng = random.Random(42)
+    with app.app_context():
+        db.create_all()
+        ensure_search_index()
+        for start in range(0, count, batch):
+            db.session.execute(Product.__table__.insert(), [
+                {
+                    'name': f'{rng.choice(COLOURS).title()} {rng.choice(WORDS).title()} {i}',
+                    'price': round(rng.uniform(10, 2000), 2),
+                    'stock': rng.choice([0, 3, 25, 100]),
+                    'category': rng.choice(CATEGORIES),
+                    'description': ' '.join([rng.choice(WORDS)] + [rng.choice(FILLER) for _ in range(15)]),
+                }
+                for i in range(start, min(start + batch, count))
+            ])
+            db.session.commit()
+
+
+def run(repeat):
+    """Time every query `repeat` times; returns {label: (p50_ms, p95_ms, rows)}"""
+    from werkzeug.datastructures import MultiDict
+    from app import app
+    from product_search import parse_search_args, search_products
+
+    results = {}
+    with app.app_context():
+        for args in QUERIES:
+            params = parse_search_args(MultiDict(args))
+            search_products(params)  # warm up
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                page = search_products(params)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            label = '&'.join(f'{key}={value}' for key, value in args.items()) or '(no filters)'
+            results[label] = (statistics.median(timings), timings[int(len(timings) * 0.95) - 1], len(page.products))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='search-latency-'), 'search.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    print(f'Database: {os.environ["DATABASE_URL"]}')
+
+    started = time.perf_counter()
+    seed(args.products)
+    print(f'Seeded {args.products} products in {time.perf_counter() - started:.1f}s')
+
+    print(f'{"query":45} {"p50 ms":>8} {"p95 ms":>8} {"rows":>5}')
+    for label, (p50, p95, rows) in run(args.repeat).items():
+        print(f'{label:45} {p50:8.2f} {p95:8.2f} {rows:5}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Synthetic production-scale dataset for load tests.
+
+Creates customers with loyalty cards, products, online orders with items,
+POS sales and the matching points ledger with bulk Core inserts (no ORM
+objects), then rebuilds the revenue rollup. Card balances and tiers agree
+with the ledger, so `flask reconcile-points --dry-run` reports no drift.
+
+Usage (from the project root):
+  python -m benchmarks.synthetic_data --users 100000 --orders 1000000 --sales 500000
+  python -m benchmarks.synthetic_data --database-url postgresql://... --users 10000
+
+Every synthetic customer is called load_<n> with the password printed at the
+end; an admin called load_admin is created too.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PASSWORD = 'load-test'
+CATEGORIES = ['Pens', 'Pencils', 'Notebooks', 'Art Supplies', 'Office', 'Paper', 'Desk']
+WORDS = ['Gel', 'Ball', 'Fountain', 'Mechanical', 'Spiral', 'Ruled', 'Sketch', 'Sticky', 'Neon', 'Matte']
+
+
+def _next_id(table):
+    from sqlalchemy import func, select
+    from models import db
+    return (db.session.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _insert(table, rows):
+    from models import db
+    if rows:
+        db.session.execute(table.insert(), rows)
+
+
+def generate(users=10000, products=2000, orders=100000, items_per_order=3, sales=50000,
+             days=365, batch=10000, seed=1, log=print):
+    """Bulk-insert the dataset into the app's database; returns row counts"""
+    from werkzeug.security import generate_password_hash
+    from models import db, User, LoyaltyCard, Product, Order, OrderItem, Sale, PointsTransaction, tier_for_points
+    from revenue_rollup import rebuild_daily_revenue
+    from schema_migrations import migrate
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    password = generate_password_hash(PASSWORD)  # one hash, shared by every synthetic user
+
+    def when():
+        return now - timedelta(seconds=rng.randint(0, days * 86400))
+
+    migrate(log=lambda message: None)
+    counts = {}
+
+    started = time.perf_counter()
+    user_start = _next_id(User.__table__)
+    _insert(User.__table__, [{'username': 'load_admin', 'email': 'load_admin@example.com',
+                              'password': password, 'role': 'admin', 'created_at': now}])
+    user_start += 1
+    for start in range(0, users, batch):
+        _insert(User.__table__, [
+            {'username': f'load_{i}', 'email': f'load_{i}@example.com', 'password': password,
+             'role': 'customer', 'created_at': when()}
+            for i in range(start, min(start + batch, users))
+        ])
+    db.session.commit()
+    user_ids = range(user_start, user_start + users)
+    counts['users'] = users
+    log(f'users: {users} in {time.perf_counter() - started:.1f}s')
+
+    started = time.perf_counter()
+    product_start = _next_id(Product.__table__)
+    catalog = []
+    for i in range(products):
+        price = round(rng.uniform(10, 1500), 2)
+        catalog.append((product_start + i, f'{rng.choice(WORDS)} {rng.choice(CATEGORIES)[:-1]} {i}', price))
+    _insert(Product.__table__, [
+        {'id': product_id, 'name': name, 'price': price, 'stock': 1_000_000, 'category': rng.choice(CATEGORIES),
+         'description': f'{name} for everyday use.'}
+        for product_id, name, price in catalog
+    ])
+    db.session.commit()
+    counts['products'] = products
+    log(f'products: {products} in {time.perf_counter() - started:.1f}s')
+
+    balances = dict.fromkeys(user_ids, 0)
+
+    started = time.perf_counter()
+    order_id = _next_id(Order.__table__)
+    for start in range(0, orders, batch):
+        order_rows, item_rows, ledger_rows = [], [], []
+        for _ in range(min(batch, orders - start)):
+            user_id = rng.choice(user_ids)
+            created_at = when()
+            lines = rng.sample(catalog, k=rng.randint(1, items_per_order * 2 - 1))
+            subtotal = 0.0
+            for product_id, name, price in lines:
+                quantity = rng.randint(1, 3)
+                subtotal += price * quantity
+                item_rows.append({'order_id': order_id, 'product_id': product_id, 'product_name': name,
+                                  'product_price': price, 'quantity': quantity, 'subtotal': price * quantity})
+            completed = rng.random() < 0.8
+            points = int(subtotal / 10) if completed else 0
+            order_rows.append({
+                'id': order_id, 'user_id': user_id, 'email': f'load_{user_id}@example.com', 'phone': '9800000000',
+                'full_name': f'Load Customer {user_id}', 'address': 'Synthetic Street', 'city': 'Kathmandu',
+                'postal_code': '44600', 'subtotal': subtotal, 'delivery_charge': 0, 'discount': 0,
+                'total': subtotal, 'payment_method': rng.choice(['cod', 'khalti']),
+                'payment_status': 'completed' if completed else rng.choice(['pending', 'failed']),
+                'order_status': rng.choice(['pending', 'processing', 'shipped', 'delivered', 'delivered']),
+                'points_earned': points, 'points_redeemed': 0, 'created_at': created_at, 'updated_at': created_at,
+            })
+            if points:
+                balances[user_id] += points
+                ledger_rows.append({'user_id': user_id, 'points': points, 'type': 'earn',
+                                    'description': f'Order #{order_id}', 'created_at': created_at})
+            order_id += 1
+        _insert(Order.__table__, order_rows)
+        _insert(OrderItem.__table__, item_rows)
+        _insert(PointsTransaction.__table__, ledger_rows)
+        db.session.commit()
+    counts['orders'] = orders
+    log(f'orders: {orders} with items in {time.perf_counter() - started:.1f}s')
+
+    started = time.perf_counter()
+    for start in range(0, sales, batch):
+        sale_rows, ledger_rows = [], []
+        for _ in range(min(batch, sales - start)):
+            user_id = rng.choice(user_ids)
+            date = when()
+            amount = round(rng.uniform(20, 3000), 2)
+            points = int(amount / 10)
+            balances[user_id] += points
+            sale_rows.append({'user_id': user_id, 'amount': amount, 'items': 'POS sale', 'date': date,
+                              'points_earned': points})
+            ledger_rows.append({'user_id': user_id, 'points': points, 'type': 'earn',
+                                'description': f'Purchase Rs. {amount}', 'created_at': date})
+        _insert(Sale.__table__, sale_rows)
+        _insert(PointsTransaction.__table__, ledger_rows)
+        db.session.commit()
+    counts['sales'] = sales
+    log(f'sales: {sales} in {time.perf_counter() - started:.1f}s')
+
+    started = time.perf_counter()
+    cards = [{'user_id': user_id, 'points': points, 'tier': tier_for_points(points)}
+             for user_id, points in balances.items()]
+    for start in range(0, len(cards), batch):
+        _insert(LoyaltyCard.__table__, cards[start:start + batch])
+    db.session.commit()
+    counts['rollup_rows'] = rebuild_daily_revenue()
+    log(f'loyalty cards and revenue rollup in {time.perf_counter() - started:.1f}s')
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--items-per-order', type=int, default=3, help='average order lines')
+    parser.add_argument('--sales', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=365, help='spread timestamps over this many days')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='defaults to a new temporary SQLite file')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='synthetic-'), 'synthetic.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    print(f'Database: {os.environ["DATABASE_URL"]}')
+
+    from app import app
+    with app.app_context():
+        generate(users=args.users, products=args.products, orders=args.orders,
+                 items_per_order=args.items_per_order, sales=args.sales, days=args.days, seed=args.seed)
+    print(f'Customers log in as load_<n> (admin: load_admin) with password {PASSWORD!r}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Bytes-on-the-wire benchmark for compression and static asset caching.
+
+Renders the main pages against a small throwaway database and, for each
+one, totals the HTML plus the local static files it references: once as an
+old client without compression would fetch them ("before") and once with
+Accept-Encoding: gzip, br ("after"). It also counts the requests a repeat
+view needs: before, every asset has to be revalidated; after, fingerprinted
+assets are served from the browser cache until they change.
+
+Usage (from the project root):
+  python -m benchmarks.wire_size
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+PASSWORD = 'wire-size'
+PUBLIC_PAGES = ['/', '/about', '/login', '/products', '/product/1']
+CUSTOMER_PAGES = ['/my_orders', '/dashboard', '/cart']
+ADMIN_PAGES = ['/admin/dashboard', '/admin/orders', '/admin/products']
+
+ASSET_URL = re.compile(r'''(?:src|href)=["'](/static/[^"']+)["']''')
+
+
+def seed():
+    from werkzeug.security import generate_password_hash
+    from app import app
+    from models import db, User, LoyaltyCard, Product
+    from schema_migrations import migrate
+
+    with app.app_context():
+        migrate(log=lambda message: None)
+        password = generate_password_hash(PASSWORD)
+        customer = User(username='wire_customer', email='c@example.com', password=password)
+        db.session.add(User(username='wire_admin', email='a@example.com', password=password, role='admin'))
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add(LoyaltyCard(user_id=customer.id, points=120))
+        for i in range(24):
+            db.session.add(Product(name=f'Wire Pen {i}', price=50 + i, stock=20, category='Pens',
+                                   description='A smooth gel pen for everyday writing. ' * 4))
+        db.session.commit()
+
+
+def fetch(client, url, compressed):
+    headers = {'Accept-Encoding': 'gzip, br'} if compressed else {'Accept-Encoding': 'identity'}
+    response = client.get(url, headers=headers)
+    size = len(response.get_data())
+    cache_control = response.headers.get('Cache-Control', '')
+    html = response.get_data(as_text=True) if not compressed and response.mimetype == 'text/html' else ''
+    response.close()
+    return size, cache_control, html
+
+
+def measure(client, page):
+    """(before_bytes, after_bytes, before_repeat_requests, after_repeat_requests)"""
+    before_html, _, html = fetch(client, page, compressed=False)
+    after_html, _, _ = fetch(client, page, compressed=True)
+    before, after = before_html, after_html
+    repeat_before = repeat_after = 1
+    for url in sorted(set(ASSET_URL.findall(html))):
+        url = url.replace('&amp;', '&')
+        plain, _, _ = fetch(client, url, compressed=False)
+        packed, cache_control, _ = fetch(client, url, compressed=True)
+        before += plain
+        after += packed
+        repeat_before += 1
+        if 'immutable' not in cache_control:
+            repeat_after += 1
+    return before, after, repeat_before, repeat_after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='wire-size-'), 'wire.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    seed()
+
+    from app import app
+    app.config['PAYMENT_WORKER_THREAD'] = False
+    clients = {'anonymous': app.test_client(), 'customer': app.test_client(), 'admin': app.test_client()}
+    clients['customer'].post('/login', data={'username': 'wire_customer', 'password': PASSWORD})
+    clients['admin'].post('/login', data={'username': 'wire_admin', 'password': PASSWORD})
+
+    print(f'{"page":20} {"before":>10} {"after":>10} {"saved":>6}   {"repeat-view requests":>20}')
+    totals = [0, 0]
+    for who, pages in (('anonymous', PUBLIC_PAGES), ('customer', CUSTOMER_PAGES), ('admin', ADMIN_PAGES)):
+        for page in pages:
+            before, after, repeat_before, repeat_after = measure(clients[who], page)
+            totals[0] += before
+            totals[1] += after
+            saved = 100 * (1 - after / before) if before else 0
+            print(f'{page:20} {before:10,} {after:10,} {saved:5.0f}%   {repeat_before:>9} -> {repeat_after}')
+    print(f'{"total":20} {totals[0]:10,} {totals[1]:10,} {100 * (1 - totals[1] / totals[0]):5.0f}%')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
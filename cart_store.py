@@ -0,0 +1,184 @@
+"""
+Server-side shopping carts.
+
+The session cookie only holds a random cart id; the lines (product id and
+quantity) live in a CartStore. Names, prices, images and stock are never
+stored with the cart: every cart view and checkout re-reads them for all
+lines with one query (checkout.resolve_cart), so customers always see and
+pay current prices.
+
+Stores:
+  DatabaseCartStore  cart_item table, shared by every worker (default)
+  MemoryCartStore    per-process dict, for tests and single-process runs
+
+Set CART_STORE=memory to use the in-memory store. Abandoned database carts
+are removed with `flask --app app prune-carts`.
+"""
+import secrets
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+
+from flask import session
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, CartItem
+
+
+def _check_quantity(quantity):
+    if not isinstance(quantity, int) or quantity < 1:
+        raise ValueError(f'quantity must be a whole number of at least 1, got {quantity!r}')
+
+
+class CartStore(ABC):
+    """Interface every cart store implements; carts map product id -> quantity"""
+
+    @abstractmethod
+    def get(self, cart_id):
+        """{product_id: quantity} for a cart, empty if it does not exist"""
+
+    @abstractmethod
+    def add(self, cart_id, product_id, quantity):
+        """Add quantity (at least 1) of a product, creating the line if needed"""
+
+    @abstractmethod
+    def remove(self, cart_id, product_id):
+        """Drop a product's line from a cart"""
+
+    @abstractmethod
+    def clear(self, cart_id):
+        """Empty a cart"""
+
+
+class MemoryCartStore(CartStore):
+    def __init__(self):
+        self._carts = {}
+        self._lock = threading.Lock()
+
+    def get(self, cart_id):
+        with self._lock:
+            return dict(self._carts.get(cart_id, {}))
+
+    def add(self, cart_id, product_id, quantity):
+        _check_quantity(quantity)
+        with self._lock:
+            lines = self._carts.setdefault(cart_id, {})
+            lines[product_id] = lines.get(product_id, 0) + quantity
+
+    def remove(self, cart_id, product_id):
+        with self._lock:
+            self._carts.get(cart_id, {}).pop(product_id, None)
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+
+class DatabaseCartStore(CartStore):
+    """Carts in the cart_item table; each change is committed right away"""
+
+    def get(self, cart_id):
+        rows = db.session.query(CartItem.product_id, CartItem.quantity).filter(
+            CartItem.cart_id == cart_id
+        ).order_by(CartItem.id)
+        return {product_id: quantity for product_id, quantity in rows}
+
+    def add(self, cart_id, product_id, quantity):
+        _check_quantity(quantity)
+        table = CartItem.__table__
+        now = datetime.utcnow()
+        dialect = db.session.get_bind().dialect.name
+
+        # One statement, so two quick clicks cannot race on the unique key
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite_insert if dialect == 'sqlite' else pg_insert
+            stmt = insert(table).values(cart_id=cart_id, product_id=product_id, quantity=quantity, updated_at=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['cart_id', 'product_id'],
+                set_={'quantity': table.c.quantity + stmt.excluded.quantity, 'updated_at': now}
+            )
+            db.session.execute(stmt)
+        else:
+            result = db.session.execute(
+                update(table)
+                .where(table.c.cart_id == cart_id, table.c.product_id == product_id)
+                .values(quantity=table.c.quantity + quantity, updated_at=now)
+            )
+            if result.rowcount == 0:
+                db.session.execute(table.insert().values(
+                    cart_id=cart_id, product_id=product_id, quantity=quantity, updated_at=now
+                ))
+        db.session.commit()
+
+    def remove(self, cart_id, product_id):
+        db.session.execute(delete(CartItem).where(CartItem.cart_id == cart_id, CartItem.product_id == product_id))
+        db.session.commit()
+
+    def clear(self, cart_id):
+        db.session.execute(delete(CartItem).where(CartItem.cart_id == cart_id))
+        db.session.commit()
+
+    def prune(self, older_than):
+        """Delete carts untouched for `older_than` (a timedelta); returns lines removed"""
+        stale = select(CartItem.cart_id).group_by(CartItem.cart_id).having(
+            func.max(CartItem.updated_at) < datetime.utcnow() - older_than
+        )
+        result = db.session.execute(delete(CartItem).where(CartItem.cart_id.in_(stale)))
+        db.session.commit()
+        return result.rowcount
+
+
+class Carts:
+    """The current visitor's cart, addressed by the id in their session"""
+
+    def __init__(self, app=None, store=None):
+        self.store = store
+        if app is not None:
+            self.init_app(app, store)
+
+    def init_app(self, app, store=None):
+        """Pick the store from CART_STORE ('database' or 'memory') unless one is given"""
+        if store is None:
+            kind = app.config.get('CART_STORE', 'database')
+            if kind not in ('database', 'memory'):
+                raise ValueError(f"CART_STORE must be 'database' or 'memory', not {kind!r}")
+            store = MemoryCartStore() if kind == 'memory' else DatabaseCartStore()
+        self.store = store
+        app.extensions['carts'] = self
+
+    def _cart_id(self, create=False):
+        cart_id = session.get('cart_id')
+        if cart_id is None and create:
+            cart_id = session['cart_id'] = secrets.token_hex(16)
+        return cart_id
+
+    def items(self):
+        """{product_id: quantity} for the current cart"""
+        cart_id = self._cart_id()
+        return self.store.get(cart_id) if cart_id else {}
+
+    def add(self, product_id, quantity=1):
+        self.store.add(self._cart_id(create=True), product_id, quantity)
+
+    def remove(self, product_id):
+        cart_id = self._cart_id()
+        if cart_id:
+            self.store.remove(cart_id, product_id)
+
+    def clear(self):
+        cart_id = session.pop('cart_id', None)
+        if cart_id:
+            self.store.clear(cart_id)
+
+
+carts = Carts()
+
+
+def prune_carts(days=30):
+    """Remove database carts nobody touched for `days` days"""
+    store = carts.store
+    if not isinstance(store, DatabaseCartStore):
+        return 0
+    return store.prune(timedelta(days=days))
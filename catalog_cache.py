@@ -0,0 +1,288 @@
+"""
+Cached product catalog for the storefront.
+
+/products (search result pages) and /product/<id> are served from
+plain-data snapshots of the Product table kept in a pluggable cache backend: an in-process LRU with a
+TTL by default, or a shared Redis-compatible store when CATALOG_CACHE_URL
+is set. Snapshots carry validators so clients can revalidate with 304s: a
+product page an ETag/Last-Modified from its Product.updated_at, a result page
+only an ETag over the ids and updated_at of the products on it (deleting a
+product, or one dropping off the page, moves no updated_at, so a
+Last-Modified taken from them would go on answering 304 for the old page).
+
+A committed change to a Product (admin add/edit/delete, stock taken at
+checkout) clears the cache of the process that committed it. With Redis
+that is every process. With the in-process LRU, other gunicorn workers keep
+serving their snapshots (and 304s for them) until CATALOG_CACHE_TTL
+expires, which is why the default TTL is only 10 seconds; set
+CATALOG_CACHE_URL when running several workers and a longer TTL is wanted.
+Checkout always re-reads prices and stock, so stale pages never affect
+what is charged.
+
+Cache misses read from the replica when DATABASE_REPLICA_URL is set (see
+db_routing); a snapshot loaded before the replica caught up with a change
+is served until the TTL expires.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from flask import make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db_routing import use_replica
+from models import db, Product
+from product_search import get_categories, search_products
+
+try:
+    import redis
+except ImportError:  # optional, only needed for a shared cache
+    redis = None
+
+Listing = namedtuple('Listing', ['products', 'has_next', 'etag'])
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """Shared cache on any Redis-compatible client (get/setex/incr)
+
+    Entries are JSON and namespaced by a generation counter, so clear() is a
+    single INCR that every web process sees at once.
+    """
+
+    def __init__(self, client, prefix='catalog', ttl=60):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key):
+        generation = self.client.get(f'{self.prefix}:generation') or b'0'
+        if isinstance(generation, bytes):
+            generation = generation.decode()
+        return f'{self.prefix}:{generation}:{key}'
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.setex(self._key(key), self.ttl, json.dumps(value))
+
+    def clear(self):
+        self.client.incr(f'{self.prefix}:generation')
+
+
+class ProductSnapshot:
+    """Read-only copy of a Product row, safe to share between requests"""
+
+    FIELDS = ('id', 'name', 'price', 'stock', 'category', 'description', 'image_filename', 'updated_at')
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(**{name: getattr(product, name) for name in cls.FIELDS})
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.FIELDS}
+        if self.updated_at:
+            data['updated_at'] = self.updated_at.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        if data.get('updated_at'):
+            data['updated_at'] = datetime.fromisoformat(data['updated_at'])
+        return cls(**data)
+
+    def stock_status(self):
+        return Product.stock_status(self)
+
+    def get_image_url(self, size=None):
+        return Product.get_image_url(self, size)
+
+    def get_image_srcset(self, fmt=None):
+        return Product.get_image_srcset(self, fmt)
+
+
+def shared_cache_client(app):
+    """The Redis client for CATALOG_CACHE_URL, or None when it is not set
+
+    Made once per app, so the catalog, KPI and quote caches share one
+    client and its connection pool.
+    """
+    if 'cache_client' not in app.extensions:
+        url = app.config.get('CATALOG_CACHE_URL')
+        if url and redis is None:
+            raise RuntimeError('CATALOG_CACHE_URL is set but the redis package is not installed')
+        app.extensions['cache_client'] = redis.Redis.from_url(url) if url else None
+    return app.extensions['cache_client']
+
+
+def _make_etag(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()[:20]
+
+
+class CatalogCache:
+    def __init__(self, app=None):
+        self.backend = LRUCache()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, client=None):
+        """Pick the backend from CATALOG_CACHE_URL / CATALOG_CACHE_TTL
+
+        `client` can be any object with Redis' get/setex/incr methods (a local
+        stand-in in development) and takes precedence over the URL.
+        """
+        ttl = int(app.config.get('CATALOG_CACHE_TTL', 10))
+        if client is None:
+            client = shared_cache_client(app)
+        if client is not None:
+            self.backend = RedisCache(client, ttl=ttl)
+        else:
+            self.backend = LRUCache(maxsize=int(app.config.get('CATALOG_CACHE_SIZE', 256)), ttl=ttl)
+        app.extensions['catalog_cache'] = self
+
+    def _cached(self, key, load):
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        with use_replica():
+            value = load()
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    def get_listing(self, params):
+        """One page of search results for SearchParams, as a Listing"""
+        def load():
+            results = search_products(params)
+            rows = [ProductSnapshot.from_product(p).to_dict() for p in results.products]
+            return {
+                'products': rows,
+                'has_next': results.has_next,
+                'etag': _make_etag([params, results.has_next, [(row['id'], row['updated_at']) for row in rows]]),
+            }
+
+        data = self._cached('products:' + json.dumps(params), load)
+        return Listing([ProductSnapshot.from_dict(p) for p in data['products']], data['has_next'], data['etag'])
+
+    def get_categories(self):
+        """Cached list of product categories"""
+        return self._cached('categories', get_categories)
+
+    def get_product(self, product_id):
+        """One product snapshot, or None if it does not exist"""
+        def load():
+            product = db.session.get(Product, product_id)
+            return ProductSnapshot.from_product(product).to_dict() if product else None
+
+        data = self._cached(f'product:{product_id}', load)
+        return ProductSnapshot.from_dict(data) if data else None
+
+    def product_etag(self, product):
+        return _make_etag([product.id, product.updated_at.isoformat() if product.updated_at else None])
+
+    def invalidate(self):
+        self.backend.clear()
+
+
+catalog = CatalogCache()
+
+
+def conditional_page(etag, last_modified, render):
+    """Answer 304 if the client's copy is current, else render() with validators
+
+    Pages include the navbar for the logged-in user, so the ETag is scoped to
+    the user and responses vary on the session cookie. Pending flash messages
+    always get a fresh render so they are not swallowed by a 304.
+    """
+    user_key = current_user.get_id() if current_user.is_authenticated else 'anon'
+    response = make_response()
+    response.set_etag(f'{etag}-{user_key}')
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+
+    if '_flashes' not in session:
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    response.set_data(render())
+    return response
+
+
+# Invalidate after any commit that touched a Product, whether through the ORM
+# unit of work (admin routes) or a bulk UPDATE (stock reservation).
+
+@event.listens_for(Session, 'after_flush')
+def _track_product_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Product):
+            session.info['catalog_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_product_update(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is Product:
+            orm_execute_state.session.info['catalog_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('catalog_changed', False):
+        catalog.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,87 @@
+"""
+Cart resolution for the checkout flows.
+
+resolve_cart loads every product in a cart with a single IN query
+(optionally taking row locks) and returns a ResolvedCart that the cart page,
+place_order, pay_with_khalti and the Khalti payment worker reuse instead of
+looking products up one cart line at a time. Lines are priced from the
+Product rows, except in the snapshot a Khalti payment was made for.
+"""
+from collections import namedtuple
+
+from models import Product
+
+CartLine = namedtuple('CartLine', ['product_id', 'product', 'name', 'price', 'quantity', 'subtotal'])
+
+
+class ResolvedCart:
+    """Cart lines joined with their Product rows"""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    @property
+    def subtotal(self):
+        return sum(line.subtotal for line in self.lines)
+
+    @property
+    def count(self):
+        """Number of items, counting quantities"""
+        return sum(line.quantity for line in self.lines)
+
+    def snapshot(self):
+        """{product_id: {'name', 'price', 'quantity'}}, to price a paid order later"""
+        return {
+            str(line.product_id): {'name': line.name, 'price': line.price, 'quantity': line.quantity}
+            for line in self.lines
+        }
+
+    @property
+    def unavailable(self):
+        """Lines whose product was deleted, has too little stock left, or that ask for less than one unit"""
+        return [line for line in self.lines
+                if not line.product or line.quantity < 1 or line.product.stock < line.quantity]
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+
+def resolve_cart(cart, lock=False):
+    """Load all products for a cart in one query
+
+    `cart` maps product ids to a quantity (priced at the current Product
+    price) or to a ResolvedCart.snapshot() entry, whose name and price are
+    kept. With lock=True the rows are selected FOR UPDATE so stock can be
+    changed safely within the current transaction. SQLite has no row locks
+    and SQLAlchemy omits the clause there.
+    """
+    product_ids = [int(product_id) for product_id in cart]
+    products = {}
+    if product_ids:
+        query = Product.query.filter(Product.id.in_(product_ids)).order_by(Product.id)
+        if lock:
+            # Lock in id order so concurrent checkouts cannot deadlock
+            query = query.with_for_update()
+        products = {product.id: product for product in query}
+
+    lines = []
+    for product_id, item in cart.items():
+        product = products.get(int(product_id))
+        if isinstance(item, dict):
+            name, price, quantity = item['name'], item['price'], item['quantity']
+        else:
+            name = product.name if product else f'#{product_id}'
+            price = float(product.price) if product else 0.0
+            quantity = item
+        lines.append(CartLine(
+            product_id=int(product_id),
+            product=product,
+            name=name,
+            price=price,
+            quantity=quantity,
+            subtotal=price * quantity
+        ))
+    return ResolvedCart(lines)
@@ -0,0 +1,136 @@
+"""
+Dashboard KPI queries for the admin dashboard.
+
+Every metric on the admin dashboard is computed here with a handful of
+grouped/conditional SQL aggregates instead of one query per number.
+Revenue figures are read from the DailyRevenue rollup (see revenue_rollup.py)
+rather than by scanning the Sale and Order tables. The dashboard and reports
+read them through kpi_cache, so steady-state page loads hit the database
+only when a write has changed the numbers.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, select
+
+from kpi_cache import kpi_cache
+from models import db, User, LoyaltyCard, Product, Sale, DailyRevenue
+
+TIERS = ('Silver', 'Gold', 'Platinum')
+LOW_STOCK_THRESHOLD = 10
+
+RecentSale = namedtuple('RecentSale', ['date', 'username', 'items', 'amount'])
+
+
+def get_counts():
+    """Customer, product, low stock and loyalty card counts in one statement"""
+    row = db.session.execute(select(
+        select(func.count(User.id)).where(User.role == 'customer').scalar_subquery(),
+        select(func.count(Product.id)).scalar_subquery(),
+        select(func.count(Product.id)).where(Product.stock < LOW_STOCK_THRESHOLD).scalar_subquery(),
+        select(func.count(LoyaltyCard.id)).scalar_subquery(),
+    )).one()
+    return {
+        'total_customers': row[0],
+        'total_products': row[1],
+        'low_stock': row[2],
+        'active_cards': row[3],
+    }
+
+
+def get_revenue_totals(today):
+    """Transaction count, revenue, month revenue and today's points from the rollup"""
+    month_start = today.replace(day=1)
+    row = db.session.query(
+        func.coalesce(func.sum(DailyRevenue.transactions), 0),
+        func.coalesce(func.sum(DailyRevenue.revenue), 0),
+        func.coalesce(func.sum(case((DailyRevenue.day >= month_start, DailyRevenue.revenue), else_=0)), 0),
+        func.coalesce(func.sum(case((DailyRevenue.day == today, DailyRevenue.points_issued), else_=0)), 0),
+    ).one()
+    return {'transactions': row[0], 'revenue': row[1], 'monthly_revenue': row[2], 'points_today': row[3]}
+
+
+def get_daily_revenue(today, days=7):
+    """Combined sale + completed order revenue per day, oldest day first"""
+    first_day = today - timedelta(days=days - 1)
+    rows = db.session.query(DailyRevenue.day, func.sum(DailyRevenue.revenue)).filter(
+        DailyRevenue.day >= first_day,
+        DailyRevenue.day <= today
+    ).group_by(DailyRevenue.day).all()
+    totals = {day: amount or 0 for day, amount in rows}
+
+    series = {}
+    for i in range(days):
+        day = first_day + timedelta(days=i)
+        series[day.strftime('%b %d')] = float(totals.get(day, 0))
+    return series
+
+
+def get_report_totals():
+    """All-time revenue, transaction count and customer count for the reports page"""
+    totals = db.session.query(
+        func.coalesce(func.sum(DailyRevenue.revenue), 0),
+        func.coalesce(func.sum(DailyRevenue.transactions), 0),
+    ).one()
+    total_customers = db.session.query(func.count(User.id)).filter(User.role == 'customer').scalar()
+    return {
+        'total_sales': totals[0],
+        'total_transactions': totals[1],
+        'total_customers': total_customers,
+    }
+
+
+def get_recent_sales(limit=5):
+    """Latest POS sales with the customer's username, newest first"""
+    rows = db.session.query(Sale.date, User.username, Sale.items, Sale.amount).outerjoin(
+        User, Sale.user_id == User.id
+    ).order_by(Sale.date.desc()).limit(limit).all()
+    return [RecentSale(*row) for row in rows]
+
+
+def get_tier_counts():
+    """Number of loyalty cards in each tier"""
+    rows = db.session.query(LoyaltyCard.tier, func.count(LoyaltyCard.id)).group_by(LoyaltyCard.tier).all()
+    counts = dict.fromkeys(TIERS, 0)
+    for tier, count in rows:
+        if tier in counts:
+            counts[tier] = count
+    return counts
+
+
+def get_dashboard_metrics(today=None):
+    """Collect every KPI shown on the admin dashboard"""
+    today = today or datetime.now().date()
+
+    revenue = kpi_cache.get('revenue', today.isoformat(), lambda: {
+        **get_revenue_totals(today), 'daily': get_daily_revenue(today)
+    })
+    tiers = kpi_cache.get('tiers', 'all', get_tier_counts)
+
+    metrics = dict(kpi_cache.get('counts', 'all', get_counts))
+    metrics.update({
+        'total_sales': revenue['transactions'],
+        'total_revenue': revenue['revenue'],
+        'monthly_revenue': revenue['monthly_revenue'],
+        'points_issued_today': int(revenue['points_today']),
+        'sales_by_date': revenue['daily'],
+        'silver_count': tiers['Silver'],
+        'gold_count': tiers['Gold'],
+        'platinum_count': tiers['Platinum'],
+    })
+    return metrics
+
+
+def get_cached_report_totals():
+    """get_report_totals() through the KPI cache"""
+    return kpi_cache.get('report_totals', 'all', get_report_totals)
+
+
+def get_cached_recent_sales(limit=5):
+    """get_recent_sales() through the KPI cache, as RecentSale tuples"""
+    rows = kpi_cache.get('recent_sales', str(limit), lambda: [
+        [sale.date.isoformat() if sale.date else None, sale.username, sale.items, sale.amount]
+        for sale in get_recent_sales(limit)
+    ])
+    return [RecentSale(datetime.fromisoformat(date) if date else None, username, items, amount)
+            for date, username, items, amount in rows]
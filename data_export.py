@@ -0,0 +1,173 @@
+"""
+Streaming CSV/JSONL exports of orders, sales, customers and the points ledger.
+
+Each export is a single SELECT of plain columns (no ORM objects) executed
+with yield_per, which on Postgres opens a server-side cursor: rows are
+fetched and written out one batch at a time, so memory stays flat however
+large the table is and the first bytes leave as soon as the first batch is
+read. Exports run against the read replica when one is configured.
+
+Orders are exported one row per order item, with the order's columns
+repeated on each of its items (orders without items get one row with empty
+item columns). All exports accept the same date_from/date_to range as the
+admin listings.
+
+A stream that is cut off (worker restart, dropped connection) still looks
+like a valid file. Scripts that need to tell the two apart can ask for a
+trailer carrying the number of rows written (trailer=True, ?trailer=1 on the
+download URL); a file requested with one but ending without it is incomplete:
+
+    CSV:   # end of export, 1234 rows
+    JSONL: {"_end_of_export": true, "rows": 1234}
+
+It is off by default because it is not a data row: CSV readers and JSONL
+loaders would take it for one.
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from db_routing import use_replica
+from models import db, User, LoyaltyCard, Sale, Order, OrderItem, PointsTransaction
+from pagination import filter_date_range
+
+BATCH_SIZE = 1000
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+# name -> (column label, expression) pairs, FROM clause and the column date ranges apply to
+Export = namedtuple('Export', ['name', 'columns', 'from_clause', 'order_by', 'date_column'])
+
+EXPORTS = {export.name: export for export in (
+    Export(
+        'orders',
+        (
+            ('order_id', Order.id), ('created_at', Order.created_at), ('user_id', Order.user_id),
+            ('username', User.username), ('email', Order.email), ('payment_method', Order.payment_method),
+            ('payment_status', Order.payment_status), ('order_status', Order.order_status),
+            ('delivery_option', Order.delivery_option), ('subtotal', Order.subtotal),
+            ('delivery_charge', Order.delivery_charge), ('discount', Order.discount), ('total', Order.total),
+            ('points_earned', Order.points_earned), ('points_redeemed', Order.points_redeemed),
+            ('item_id', OrderItem.id), ('product_id', OrderItem.product_id),
+            ('product_name', OrderItem.product_name), ('product_price', OrderItem.product_price),
+            ('quantity', OrderItem.quantity), ('item_subtotal', OrderItem.subtotal),
+        ),
+        Order.__table__.join(User.__table__, User.id == Order.user_id)
+                       .outerjoin(OrderItem.__table__, OrderItem.order_id == Order.id),
+        (Order.id, OrderItem.id),
+        Order.created_at,
+    ),
+    Export(
+        'sales',
+        (
+            ('sale_id', Sale.id), ('date', Sale.date), ('user_id', Sale.user_id), ('username', User.username),
+            ('amount', Sale.amount), ('points_earned', Sale.points_earned), ('items', Sale.items),
+            ('client_id', Sale.client_id),
+        ),
+        Sale.__table__.join(User.__table__, User.id == Sale.user_id),
+        (Sale.id,),
+        Sale.date,
+    ),
+    Export(
+        'customers',
+        (
+            ('user_id', User.id), ('username', User.username), ('email', User.email), ('role', User.role),
+            ('created_at', User.created_at), ('points', LoyaltyCard.points), ('tier', LoyaltyCard.tier),
+        ),
+        User.__table__.outerjoin(LoyaltyCard.__table__, LoyaltyCard.user_id == User.id),
+        (User.id,),
+        User.created_at,
+    ),
+    Export(
+        'points',
+        (
+            ('transaction_id', PointsTransaction.id), ('created_at', PointsTransaction.created_at),
+            ('user_id', PointsTransaction.user_id), ('username', User.username),
+            ('type', PointsTransaction.type), ('points', PointsTransaction.points),
+            ('description', PointsTransaction.description),
+        ),
+        PointsTransaction.__table__.join(User.__table__, User.id == PointsTransaction.user_id),
+        (PointsTransaction.id,),
+        PointsTransaction.created_at,
+    ),
+)}
+
+
+def export_statement(export, date_from=None, date_to=None):
+    """The SELECT behind an export, restricted to the date range"""
+    stmt = select(*(column.label(label) for label, column in export.columns)).select_from(export.from_clause)
+    return filter_date_range(stmt.order_by(*export.order_by), export.date_column, date_from, date_to)
+
+
+def export_filename(export, fmt, date_from=None, date_to=None):
+    parts = [export.name]
+    if date_from:
+        parts.append(f'from-{date_from:%Y-%m-%d}')
+    if date_to:
+        parts.append(f'before-{date_to:%Y-%m-%d}')
+    return f'{"_".join(parts)}.{fmt}'
+
+
+def _csv_value(value):
+    # Spreadsheets run text starting with these as a formula (tab and carriage
+    # return can precede one)
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + value
+    return value
+
+
+def export_trailer(fmt, rows):
+    """Last line of a complete export"""
+    if fmt == 'csv':
+        return f'# end of export, {rows} rows\r\n'
+    return json.dumps({'_end_of_export': True, 'rows': rows}) + '\n'
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def stream_export(export, fmt, date_from=None, date_to=None, batch_size=BATCH_SIZE, trailer=False):
+    """Generator of CSV or JSONL text chunks, one per batch of rows
+
+    Needs an app context for as long as it is consumed; in a view wrap it
+    with flask.stream_with_context. With trailer=True the last chunk is
+    export_trailer().
+    """
+    labels = [label for label, _ in export.columns]
+    stmt = export_statement(export, date_from, date_to).execution_options(yield_per=batch_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(labels)
+        yield buffer.getvalue()
+
+    count = 0
+    with use_replica():
+        result = db.session.execute(stmt)
+        try:
+            for rows in result.partitions():
+                count += len(rows)
+                buffer.seek(0)
+                buffer.truncate()
+                if fmt == 'csv':
+                    writer.writerows([_csv_value(value) for value in row] for row in rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps(dict(zip(labels, row)), default=_json_value))
+                        buffer.write('\n')
+                yield buffer.getvalue()
+        finally:
+            result.close()
+    if trailer:
+        yield export_trailer(fmt, count)
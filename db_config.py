@@ -0,0 +1,125 @@
+"""
+Backend-specific database engine settings.
+
+Postgres gets a sized connection pool that is checked with a cheap ping
+before use (Render and managed databases drop idle connections) and recycled
+periodically. SQLite connections switch the database to WAL journal mode,
+so readers no longer block the writer and concurrent gunicorn workers stop
+failing with "database is locked"; a busy timeout makes writers wait for
+each other instead, and synchronous=NORMAL avoids an fsync per commit, which
+is safe with WAL.
+
+All settings come from app.config (see app.py for the environment variables):
+
+  DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+  SQLITE_JOURNAL_MODE, SQLITE_BUSY_TIMEOUT (ms), SQLITE_SYNCHRONOUS
+
+pool_stats() reports the state of every engine's pool for /metrics.
+"""
+import threading
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+SQLITE_SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+_lock = threading.Lock()
+_pool_events = Counter()  # (engine name, event) -> count
+
+
+def normalize_url(url):
+    """Accept the postgres:// scheme that Heroku/Render hand out"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URL"""
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        # The busy timeout is set by the connect hook so it applies in ms
+        return {}
+    options = {
+        'pool_pre_ping': True,
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+    }
+    if backend == 'postgresql':
+        options['connect_args'] = {'connect_timeout': 10}
+    return options
+
+
+def init_app(app, db):
+    """Install the connection hooks on every engine Flask-SQLAlchemy created"""
+    app.config.setdefault('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT', 5000)
+    app.config.setdefault('SQLITE_SYNCHRONOUS', 'NORMAL')
+    if app.config['SQLITE_SYNCHRONOUS'].upper() not in SQLITE_SYNCHRONOUS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(sorted(SQLITE_SYNCHRONOUS))}")
+
+    with app.app_context():
+        engines = dict(db.engines)
+    for bind, engine in engines.items():
+        name = bind or 'default'
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _sqlite_pragmas(app.config))
+        _track_pool(engine, name)
+    app.extensions['db_config'] = engines
+
+
+def _sqlite_pragmas(config):
+    journal_mode = config['SQLITE_JOURNAL_MODE']
+    busy_timeout = int(config['SQLITE_BUSY_TIMEOUT'])
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+            if journal_mode:
+                # In-memory databases stay in "memory" mode; that is fine
+                cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+            cursor.execute(f'PRAGMA synchronous = {synchronous}')
+        finally:
+            cursor.close()
+
+    return on_connect
+
+
+def _track_pool(engine, name):
+    def counter(kind):
+        def listener(*args):
+            with _lock:
+                _pool_events[(name, kind)] += 1
+        return listener
+
+    for kind in ('connect', 'checkout', 'invalidate'):
+        event.listen(engine, kind, counter(kind))
+
+
+def pool_stats(app):
+    """Per-engine pool gauges and event counters
+
+    Returns {engine name: {'size', 'checked_in', 'checked_out', 'overflow',
+    'connects', 'checkouts', 'invalidations'}}; gauges a pool class does not
+    support (e.g. SQLite in-memory pools) are omitted.
+    """
+    stats = {}
+    for bind, engine in app.extensions.get('db_config', {}).items():
+        name = bind or 'default'
+        pool = engine.pool
+        entry = {}
+        for key, method in (('size', 'size'), ('checked_in', 'checkedin'),
+                            ('checked_out', 'checkedout'), ('overflow', 'overflow')):
+            if hasattr(pool, method):
+                entry[key] = getattr(pool, method)()
+        with _lock:
+            entry['connects'] = _pool_events[(name, 'connect')]
+            entry['checkouts'] = _pool_events[(name, 'checkout')]
+            entry['invalidations'] = _pool_events[(name, 'invalidate')]
+        stats[name] = entry
+    return stats
@@ -0,0 +1,74 @@
+"""
+Read-replica routing for the ORM session.
+
+With DATABASE_REPLICA_URL set, app.py configures a second engine as the
+'replica' bind. Code running under use_replica(), including views decorated
+with @replica_reads, sends plain SELECTs to the replica. Everything else
+stays on the primary:
+
+  - flushes and INSERT/UPDATE/DELETE statements
+  - SELECT ... FOR UPDATE (stock reservation, points balances)
+  - raw text() SQL, whose intent the session cannot see
+  - any read after the session wrote in the current transaction, so a
+    request always sees its own changes
+
+Without a replica the helpers are no-ops and every statement goes to the
+primary. Replicas lag behind, so only pages that tolerate slightly stale
+data (reports, dashboards, the cached catalog) should read from them.
+"""
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+REPLICA = 'replica'
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that can send reads to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA]
+        if self._flushing or not isinstance(clause, Select):
+            self.info['wrote_primary'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        return (
+            g.get('_use_replica', False)
+            and REPLICA in self._db.engines
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+            and not self._flushing
+            and not self.info.get('wrote_primary')
+        )
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+@event.listens_for(RoutingSession, 'after_rollback')
+def _end_transaction(session):
+    session.info.pop('wrote_primary', None)
+
+
+@contextmanager
+def use_replica():
+    """Route plain reads in this block to the replica, if one is configured"""
+    previous = g.get('_use_replica', False)
+    g._use_replica = True
+    try:
+        yield
+    finally:
+        g._use_replica = previous
+
+
+def replica_reads(view):
+    """View decorator: the view's reads (and its template's) use the replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return view(*args, **kwargs)
+    return wrapper
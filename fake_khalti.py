@@ -0,0 +1,110 @@
+"""
+Local stand-in for the Khalti ePayment API, for development and load tests.
+
+Implements /epayment/initiate/ and /epayment/lookup/ with in-memory
+payments, plus a /pay/<pidx> page that "completes" the payment and
+redirects back to the shop's return_url. Latency and failures can be
+injected to exercise the client's timeouts and retries.
+
+Usage:
+  python fake_khalti.py --port 8001 --delay 0.2 --fail-rate 0.1
+  KHALTI_BASE_URL=http://127.0.0.1:8001/api/v2 python app.py
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+from flask import Flask, jsonify, redirect, request
+from werkzeug.serving import make_server
+
+
+def create_fake_khalti(delay=0.0, fail_rate=0.0, auto_complete=True):
+    """Build the fake Khalti Flask app"""
+    fake = Flask('fake_khalti')
+    fake.config.update(DELAY=delay, FAIL_RATE=fail_rate, AUTO_COMPLETE=auto_complete)
+    payments = {}
+    lock = threading.Lock()
+    fake.payments = payments
+
+    @fake.before_request
+    def inject_faults():
+        if fake.config['DELAY']:
+            time.sleep(fake.config['DELAY'])
+        if request.path.startswith('/api/') and random.random() < fake.config['FAIL_RATE']:
+            return jsonify({'detail': 'Injected failure'}), 503
+        if request.path.startswith('/api/') and not request.headers.get('Authorization', '').startswith('Key '):
+            return jsonify({'detail': 'Authentication credentials were not provided.'}), 401
+
+    @fake.route('/api/v2/epayment/initiate/', methods=['POST'])
+    def initiate():
+        data = request.get_json(silent=True) or {}
+        missing = [key for key in ('return_url', 'amount', 'purchase_order_id') if key not in data]
+        if missing:
+            return jsonify({key: ['This field is required.'] for key in missing}), 400
+
+        pidx = uuid.uuid4().hex
+        with lock:
+            payments[pidx] = {
+                'pidx': pidx,
+                'total_amount': data['amount'],
+                'status': 'Completed' if fake.config['AUTO_COMPLETE'] else 'Pending',
+                'transaction_id': uuid.uuid4().hex[:20],
+                'fee': 0,
+                'refunded': False,
+                'purchase_order_id': data['purchase_order_id'],
+                'return_url': data['return_url'],
+            }
+        return jsonify({
+            'pidx': pidx,
+            'payment_url': request.host_url.rstrip('/') + f'/pay/{pidx}',
+            'expires_in': 1800,
+        })
+
+    @fake.route('/api/v2/epayment/lookup/', methods=['POST'])
+    def lookup():
+        pidx = (request.get_json(silent=True) or {}).get('pidx')
+        with lock:
+            payment = payments.get(pidx)
+        if not payment:
+            return jsonify({'detail': 'Not found.', 'error_key': 'validation_error'}), 404
+        return jsonify({key: value for key, value in payment.items() if key != 'return_url'})
+
+    @fake.route('/pay/<pidx>')
+    def pay(pidx):
+        with lock:
+            payment = payments.get(pidx)
+            if not payment:
+                return 'Unknown payment', 404
+            payment['status'] = 'Completed'
+        query = urlencode({
+            'pidx': pidx,
+            'transaction_id': payment['transaction_id'],
+            'amount': payment['total_amount'],
+            'status': 'Completed',
+            'purchase_order_id': payment['purchase_order_id'],
+        })
+        return redirect(f"{payment['return_url']}?{query}")
+
+    return fake
+
+
+def start_fake_khalti(host='127.0.0.1', port=0, **options):
+    """Serve the fake in a background thread; returns (server, base_url)"""
+    server = make_server(host, port, create_fake_khalti(**options), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_port}/api/v2'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local fake Khalti API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to sleep per request')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of API calls answered with 503')
+    args = parser.parse_args()
+
+    create_fake_khalti(delay=args.delay, fail_rate=args.fail_rate).run(host=args.host, port=args.port, threaded=True)
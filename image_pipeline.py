@@ -0,0 +1,135 @@
+"""
+Product image pipeline.
+
+An upload is stored once under the hash of its contents (<hash>.<ext>) and
+resized at upload time into thumb/card/detail variants, each as WebP plus a
+JPEG or PNG fallback (<hash>-<size>.webp, <hash>-<size>.jpg). Because a
+file's name changes whenever its contents do, every variant can be cached by
+browsers forever. Templates pick a size with Product.get_image_url(size) or
+let the browser choose with Product.get_image_srcset().
+"""
+import hashlib
+import io
+import os
+import re
+
+from flask import url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+UPLOAD_PATH = 'uploads/products'  # relative to the static folder
+PLACEHOLDER = 'placeholder.svg'
+
+# Longest edge, in pixels; images are never upscaled
+SIZES = {'thumb': 160, 'card': 480, 'detail': 1200}
+
+JPEG_OPTIONS = {'quality': 82, 'optimize': True, 'progressive': True}
+PNG_OPTIONS = {'optimize': True}
+WEBP_OPTIONS = {'quality': 80, 'method': 4}
+
+# Refuse decompression bombs well below Pillow's own limit
+Image.MAX_IMAGE_PIXELS = 40_000_000
+
+HASHED_NAME = re.compile(r'^(?P<digest>[0-9a-f]{16})\.(?P<ext>jpg|png|webp)$')
+HASHED_FILE = re.compile(r'^[0-9a-f]{16}(-(thumb|card|detail))?\.(jpg|png|webp)$')
+
+
+def is_hashed_file(filename):
+    """True for originals and variants written by the pipeline (their content never changes)"""
+    return bool(HASHED_FILE.match(os.path.basename(filename or '')))
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _fallback_ext(original_ext):
+    """PNG uploads keep PNG variants (transparency); everything else becomes JPEG"""
+    return 'png' if original_ext == 'png' else 'jpg'
+
+
+def variant_name(filename, size, fmt=None):
+    """File name of one variant of a hashed upload, or None for legacy files"""
+    match = HASHED_NAME.match(filename or '')
+    if not match:
+        return None
+    ext = fmt or _fallback_ext(match.group('ext'))
+    return f"{match.group('digest')}-{size}.{ext}"
+
+
+def image_url(filename, size=None):
+    """URL of an upload at the given size, falling back to the original or placeholder"""
+    if not filename:
+        filename = PLACEHOLDER
+    elif size:
+        filename = variant_name(filename, size) or filename
+    return url_for('static', filename=f'{UPLOAD_PATH}/{filename}')
+
+
+def image_srcset(filename, fmt=None):
+    """srcset listing every size of an upload ('' for legacy files and placeholders)"""
+    if not variant_name(filename, 'thumb'):
+        return ''
+    return ', '.join(
+        f"{url_for('static', filename=f'{UPLOAD_PATH}/{variant_name(filename, size, fmt)}')} {width}w"
+        for size, width in SIZES.items()
+    )
+
+
+def _save(image, path, fmt):
+    if fmt == 'webp':
+        image.save(path, 'WEBP', **WEBP_OPTIONS)
+    elif fmt == 'png':
+        image.save(path, 'PNG', **PNG_OPTIONS)
+    else:
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+            image = background
+        image.save(path, 'JPEG', **JPEG_OPTIONS)
+
+
+def process_image(data, ext, folder, force=False):
+    """Store an image's original and all its variants; returns the hashed file name
+
+    Raises ValueError if the data is not a readable image.
+    """
+    ext = 'jpg' if ext == 'jpeg' else ext
+    filename = f'{content_hash(data)}.{ext}'
+    outputs = [variant_name(filename, size, fmt)
+               for size in SIZES for fmt in ('webp', _fallback_ext(ext))]
+    if not force and all(os.path.exists(os.path.join(folder, name)) for name in [filename] + outputs):
+        return filename  # same contents already processed
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ValueError('The uploaded file is not a valid image')
+
+    # Apply the camera's EXIF rotation; re-encoding below drops the metadata
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+
+    with open(os.path.join(folder, filename), 'wb') as f:
+        f.write(data)
+    for size, edge in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        for fmt in ('webp', _fallback_ext(ext)):
+            _save(resized, os.path.join(folder, variant_name(filename, size, fmt)), fmt)
+    return filename
+
+
+def delete_image(filename, folder):
+    """Remove an upload and all of its variants"""
+    if not filename or filename.startswith('placeholder.'):
+        return
+    names = [filename] + [variant_name(filename, size, fmt)
+                          for size in SIZES for fmt in ('webp', 'jpg', 'png')]
+    for name in names:
+        if not name:
+            continue
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass  # already gone
@@ -0,0 +1,193 @@
+"""
+Per-request timing and SQL instrumentation.
+
+Flask request hooks time every request and SQLAlchemy cursor events count
+the statements it issues and the time spent in the database. The numbers are
+aggregated per endpoint in this process and rendered in the Prometheus text
+format by the admin-only /metrics route:
+
+  http_requests_total, http_request_duration_seconds (histogram),
+  db_queries_total, db_query_duration_seconds_total,
+  db_queries_per_request (histogram), db_slow_query_seconds (recent samples)
+
+Requests that issue more statements than their budget (QUERY_BUDGET, or the
+stricter per-route budgets in query_counter) are logged as warnings with the
+most repeated statement, which is usually the N+1 culprit. Each gunicorn
+worker keeps its own numbers, so a scrape reflects the worker that served it.
+"""
+import threading
+import time
+from collections import Counter, deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from query_counter import ROUTE_QUERY_BUDGETS
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', ' ').replace('"', '\\"')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class Instrumentation:
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()  # (endpoint, method, status) -> count
+            self.latency = {}  # endpoint -> Histogram
+            self.query_counts = {}  # endpoint -> Histogram
+            self.db_queries = Counter()  # endpoint -> statements
+            self.db_seconds = Counter()  # endpoint -> seconds
+            self.slow_queries = deque(maxlen=20)
+
+    def init_app(self, app):
+        """Register the request hooks and start listening to every engine"""
+        app.config.setdefault('SLOW_QUERY_SECONDS', 0.1)
+        app.config.setdefault('QUERY_BUDGET', None)
+        self.app = app
+        app.before_request(self._start_request)
+        app.after_request(self._capture_status)
+        app.teardown_request(self._finish_request)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.extensions['instrumentation'] = self
+
+    def _start_request(self):
+        g._instrumentation = {'started': time.perf_counter(), 'queries': 0, 'db_seconds': 0.0,
+                              'statements': Counter(), 'status': 500}
+
+    def _capture_status(self, response):
+        stats = g.get('_instrumentation')
+        if stats is not None:
+            stats['status'] = response.status_code
+        return response
+
+    def _finish_request(self, exc=None):
+        stats = g.pop('_instrumentation', None)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats['started']
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            self.requests[(endpoint, request.method, stats['status'])] += 1
+            self.latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.query_counts.setdefault(endpoint, Histogram(QUERY_COUNT_BUCKETS)).observe(stats['queries'])
+            self.db_queries[endpoint] += stats['queries']
+            self.db_seconds[endpoint] += stats['db_seconds']
+
+        budget = ROUTE_QUERY_BUDGETS.get(request.path, self.app.config['QUERY_BUDGET'])
+        if budget is not None and stats['queries'] > budget:
+            statement, repeats = stats['statements'].most_common(1)[0]
+            self.app.logger.warning(
+                '%s %s issued %d queries (budget %d); most repeated (%dx): %s',
+                request.method, request.path, stats['queries'], budget, repeats, statement[:300]
+            )
+
+    def record_query(self, statement, seconds):
+        """Account one executed statement to the current request"""
+        endpoint = None
+        if has_request_context():
+            stats = g.get('_instrumentation')
+            if stats is not None:
+                stats['queries'] += 1
+                stats['db_seconds'] += seconds
+                stats['statements'][statement] += 1
+            endpoint = request.endpoint
+        if seconds >= self.app.config['SLOW_QUERY_SECONDS']:
+            with self._lock:
+                self.slow_queries.append((endpoint or 'background', statement, seconds))
+            self.app.logger.warning('Slow query (%.3fs) in %s: %s', seconds, endpoint or 'background', statement[:500])
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines += ['# HELP http_requests_total Requests handled, by endpoint, method and status.',
+                      '# TYPE http_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+            lines += self._histogram_lines('http_request_duration_seconds',
+                                           'Request latency in seconds, by endpoint.', self.latency)
+            lines += self._histogram_lines('db_queries_per_request',
+                                           'SQL statements issued per request, by endpoint.', self.query_counts)
+
+            lines += ['# HELP db_queries_total SQL statements executed during requests, by endpoint.',
+                      '# TYPE db_queries_total counter']
+            for endpoint, count in sorted(self.db_queries.items()):
+                lines.append(f'db_queries_total{_labels(endpoint=endpoint)} {count}')
+            lines += ['# HELP db_query_duration_seconds_total Time spent executing SQL, by endpoint.',
+                      '# TYPE db_query_duration_seconds_total counter']
+            for endpoint, seconds in sorted(self.db_seconds.items()):
+                lines.append(f'db_query_duration_seconds_total{_labels(endpoint=endpoint)} {seconds:.6f}')
+
+            lines += ['# HELP db_slow_query_seconds Most recent statements slower than SLOW_QUERY_SECONDS.',
+                      '# TYPE db_slow_query_seconds gauge']
+            slowest = {}
+            for endpoint, statement, seconds in self.slow_queries:
+                key = (endpoint, statement[:200])
+                slowest[key] = max(seconds, slowest.get(key, 0))
+            for (endpoint, statement), seconds in slowest.items():
+                lines.append(f'db_slow_query_seconds{_labels(endpoint=endpoint, statement=statement)} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram_lines(name, help_text, histograms):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for endpoint, histogram in sorted(histograms.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le=bound)} {count}')
+            lines.append(f'{name}_bucket{_labels(endpoint=endpoint, le="+Inf")} {histogram.count}')
+            lines.append(f'{name}_sum{_labels(endpoint=endpoint)} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{_labels(endpoint=endpoint)} {histogram.count}')
+        return lines
+
+
+instrumentation = Instrumentation()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['_query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('_query_started', None)
+    if started is not None and instrumentation.app is not None:
+        instrumentation.record_query(statement, time.perf_counter() - started)
+
+
+def metric_lines(name, kind, help_text, samples):
+    """Prometheus lines for extra metrics: samples are (labels dict, value)"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    lines += [f'{name}{_labels(**labels) if labels else ""} {value}' for labels, value in samples]
+    return lines
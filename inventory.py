@@ -0,0 +1,43 @@
+"""
+Stock reservation for checkout.
+
+Stock is decremented with a conditional UPDATE (stock = stock - :q WHERE
+stock >= :q) so the database itself refuses to oversell, even when several
+gunicorn workers check out the same product at once. If any line cannot be
+reserved, InsufficientStock is raised and the caller rolls back the whole
+order. A line for less than one unit is refused with ValueError; taking a
+negative quantity would put stock back and price the order below zero.
+"""
+from sqlalchemy import update
+
+from models import db, Product
+
+
+class InsufficientStock(Exception):
+    """Raised when a cart line asks for more units than are left"""
+
+    def __init__(self, product_id, name, quantity):
+        self.product_id = product_id
+        self.name = name
+        self.quantity = quantity
+        super().__init__(f'Not enough stock for {name} (requested {quantity})')
+
+
+def reserve_stock(lines):
+    """Atomically take stock for every cart line, or raise InsufficientStock
+
+    `lines` are CartLine tuples from checkout.resolve_cart. Rows are updated
+    in product id order so concurrent reservations lock in the same order.
+    """
+    for line in lines:
+        if line.quantity < 1:
+            raise ValueError(f'Invalid quantity {line.quantity} for {line.name}')
+    for line in sorted(lines, key=lambda line: line.product_id):
+        result = db.session.execute(
+            update(Product)
+            .where(Product.id == line.product_id, Product.stock >= line.quantity)
+            .values(stock=Product.stock - line.quantity)
+        )
+        if result.rowcount != 1:
+            raise InsufficientStock(line.product_id, line.name, line.quantity)
+
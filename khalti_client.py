@@ -0,0 +1,109 @@
+"""
+HTTP client for the Khalti ePayment API.
+
+One KhaltiClient is created per worker process. It keeps a pooled
+requests.Session so payments reuse TLS connections to Khalti, bounds every
+call with connect/read timeouts, retries the idempotent lookup call with
+exponential backoff, and records per-endpoint latency.
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = 'https://a.khalti.com/api/v2'
+
+
+class KhaltiError(Exception):
+    """Raised when Khalti cannot be reached or answers with an error"""
+
+    def __init__(self, message, status_code=None):
+        self.status_code = status_code
+        super().__init__(message)
+
+
+class KhaltiClient:
+    def __init__(self, app=None):
+        self.session = None
+        self.base_url = DEFAULT_BASE_URL
+        self.timeout = (3.05, 10)
+        self.lookup_retries = 2
+        self.retry_backoff = 0.5
+        self._metrics = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure from KHALTI_* settings and build the pooled session"""
+        self.base_url = app.config.get('KHALTI_BASE_URL', DEFAULT_BASE_URL).rstrip('/')
+        self.timeout = (
+            float(app.config.get('KHALTI_CONNECT_TIMEOUT', 3.05)),
+            float(app.config.get('KHALTI_READ_TIMEOUT', 10)),
+        )
+        self.lookup_retries = int(app.config.get('KHALTI_LOOKUP_RETRIES', 2))
+        self.retry_backoff = float(app.config.get('KHALTI_RETRY_BACKOFF', 0.5))
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f"Key {app.config['KHALTI_SECRET_KEY']}",
+            'Content-Type': 'application/json',
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(app.config.get('KHALTI_POOL_SIZE', 10)))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        app.extensions['khalti'] = self
+
+    def initiate(self, payload):
+        """Start a payment; returns Khalti's response (pidx, payment_url, ...)
+
+        Not retried: a repeated initiate would create a second payment.
+        """
+        return self._post('epayment/initiate', payload)
+
+    def lookup(self, pidx):
+        """Fetch the status of a payment, retrying transient failures"""
+        attempt = 0
+        while True:
+            try:
+                return self._post('epayment/lookup', {'pidx': pidx})
+            except KhaltiError as e:
+                retryable = e.status_code is None or e.status_code >= 500
+                if not retryable or attempt >= self.lookup_retries:
+                    raise
+            time.sleep(self.retry_backoff * (2 ** attempt))
+            attempt += 1
+
+    def _post(self, endpoint, payload):
+        url = f'{self.base_url}/{endpoint}/'
+        started = time.perf_counter()
+        status_code = None
+        try:
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+            status_code = response.status_code
+            if status_code != 200:
+                raise KhaltiError(f'Khalti {endpoint} returned HTTP {status_code}', status_code)
+            try:
+                return response.json()
+            except ValueError:
+                raise KhaltiError(f'Khalti {endpoint} returned invalid JSON', status_code)
+        except requests.RequestException as e:
+            raise KhaltiError(f'Khalti {endpoint} request failed: {e}')
+        finally:
+            self._record(endpoint, time.perf_counter() - started, status_code == 200)
+
+    def _record(self, endpoint, seconds, ok):
+        with self._lock:
+            stats = self._metrics.setdefault(endpoint, {
+                'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            })
+            stats['calls'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+    def metrics(self):
+        """Snapshot of per-endpoint call counts, errors and latency"""
+        with self._lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._metrics.items()}
@@ -0,0 +1,108 @@
+"""
+Short-lived cache for the admin dashboard and reports KPIs.
+
+Each group of numbers (counts, revenue, tiers, report totals, recent sales)
+is cached separately for KPI_CACHE_TTL seconds and remembers which tables it
+is computed from. Committed changes to those tables invalidate only the
+affected groups: a product edit only drops the counts, a new customer
+leaves revenue and recent sales cached, and an order status update drops
+nothing. Changes are detected from ORM flushes
+and bulk INSERT/UPDATE/DELETE statements, the same way catalog_cache does.
+
+Entries live in an in-process LRU by default; with CATALOG_CACHE_URL set
+they share the catalog's Redis so every worker sees an invalidation at once
+(otherwise other workers catch up when their TTL expires).
+"""
+import threading
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from catalog_cache import LRUCache, RedisCache, shared_cache_client
+
+# KPI group -> tables it is computed from
+GROUPS = {
+    'counts': ('user', 'product', 'loyalty_card'),
+    'revenue': ('daily_revenue',),
+    'tiers': ('loyalty_card',),
+    'report_totals': ('daily_revenue', 'user'),
+    'recent_sales': ('sale',),
+}
+
+
+class KpiCache:
+    def __init__(self):
+        self.backends = {}
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, client=None):
+        """Create one backend per KPI group (Redis if configured, else LRU)"""
+        ttl = int(app.config.get('KPI_CACHE_TTL', 30))
+        if client is None:
+            client = shared_cache_client(app)
+        for group in GROUPS:
+            if client is not None:
+                self.backends[group] = RedisCache(client, prefix=f'kpi:{group}', ttl=ttl)
+            else:
+                self.backends[group] = LRUCache(maxsize=32, ttl=ttl)
+        app.extensions['kpi_cache'] = self
+
+    def get(self, group, key, load):
+        """Cached load() for one key of a KPI group; load() must return plain data"""
+        backend = self.backends.get(group)
+        if backend is None:  # init_app not called (scripts, migrations)
+            return load()
+        value = backend.get(key)
+        with self._lock:
+            if value is not None:
+                self.hits[group] += 1
+            else:
+                self.misses[group] += 1
+        if value is None:
+            value = load()
+            backend.set(key, value)
+        return value
+
+    def invalidate_tables(self, tables):
+        """Drop every group computed from any of the given tables"""
+        for group, sources in GROUPS.items():
+            if group in self.backends and not tables.isdisjoint(sources):
+                self.backends[group].clear()
+
+
+kpi_cache = KpiCache()
+
+
+def _changed_tables(session):
+    return session.info.setdefault('kpi_changed_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    tables = {obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+              if hasattr(obj, '__table__')}
+    if tables:
+        _changed_tables(session).update(tables)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and hasattr(table, 'name'):
+            _changed_tables(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    tables = session.info.pop('kpi_changed_tables', None)
+    if tables:
+        kpi_cache.invalidate_tables(tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('kpi_changed_tables', None)
@@ -2,7 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 
-db = SQLAlchemy()
+from image_pipeline import image_srcset, image_url
+from db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -11,6 +14,8 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(150), nullable=False)
     role = db.Column(db.String(50), default='customer') # 'admin' or 'customer'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_user_role', 'role'),)
     
     # Relationships
     sales = db.relationship('Sale', backref='user', lazy=True)
@@ -26,6 +31,25 @@ class Sale(db.Model):
     amount = db.Column(db.Float, nullable=False) # In NPR
     items = db.Column(db.String(500), nullable=True) # Description of items
     date = db.Column(db.DateTime, default=datetime.utcnow)
+    client_id = db.Column(db.String(36), nullable=True)  # UUID from a POS terminal, makes resubmits no-ops
+    points_earned = db.Column(db.Integer, default=0)  # credited at the earn rate in force when the sale was recorded
+
+    __table_args__ = (
+        db.Index('ix_sale_user_id_date', 'user_id', 'date'),
+        db.Index('ix_sale_date', 'date'),
+        db.Index('uq_sale_client_id', 'client_id', unique=True),
+    )
+
+# Minimum balance for each tier, highest first
+TIER_THRESHOLDS = (('Platinum', 1000), ('Gold', 500), ('Silver', 0))
+
+
+def tier_for_points(points):
+    for tier, minimum in TIER_THRESHOLDS:
+        if points >= minimum:
+            return tier
+    return TIER_THRESHOLDS[-1][0]
+
 
 class LoyaltyCard(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -33,13 +57,10 @@ class LoyaltyCard(db.Model):
     points = db.Column(db.Integer, default=0)
     tier = db.Column(db.String(50), default='Silver') # Silver, Gold, Platinum
 
+    __table_args__ = (db.Index('ix_loyalty_card_tier', 'tier'),)
+
     def update_tier(self):
-        if self.points >= 1000:
-            self.tier = 'Platinum'
-        elif self.points >= 500:
-            self.tier = 'Gold'
-        else:
-            self.tier = 'Silver'
+        self.tier = tier_for_points(self.points)
 
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,6 +73,11 @@ class Product(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
+    __table_args__ = (
+        db.Index('ix_product_stock', 'stock'),
+        db.Index('ix_product_category_price', 'category', 'price'),
+    )
+
     def stock_status(self):
         if self.stock == 0:
             return "Out of Stock"
@@ -59,11 +85,13 @@ class Product(db.Model):
             return "Low Stock"
         return "In Stock"
     
-    def get_image_url(self):
-        """Returns the image URL or a placeholder"""
-        if self.image_filename:
-            return f"/static/uploads/products/{self.image_filename}"
-        return "/static/uploads/products/placeholder.svg"
+    def get_image_url(self, size=None):
+        """Returns the image URL (optionally a 'thumb'/'card'/'detail' variant) or a placeholder"""
+        return image_url(self.image_filename, size)
+
+    def get_image_srcset(self, fmt=None):
+        """srcset over all variants, as WebP if fmt='webp'; empty for legacy images"""
+        return image_srcset(self.image_filename, fmt)
 
 
 class PointsTransaction(db.Model):
@@ -73,6 +101,8 @@ class PointsTransaction(db.Model):
     type = db.Column(db.String(20), nullable=False)  # 'earn' or 'redeem'
     description = db.Column(db.String(200), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_points_transaction_user_id_created_at', 'user_id', 'created_at'),)
     
     # Relationship
     user = db.relationship('User', backref='points_transactions')
@@ -127,6 +157,13 @@ class Order(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_order_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_order_payment_status_created_at', 'payment_status', 'created_at'),
+        db.Index('ix_order_order_status_created_at', 'order_status', 'created_at'),
+        db.Index('ix_order_created_at', 'created_at'),
+    )
     
     # Relationships
     user = db.relationship('User', backref='orders')
@@ -145,7 +182,70 @@ class OrderItem(db.Model):
     product_price = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     subtotal = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.Index('ix_order_item_order_id', 'order_id'),)
     
     # Relationships
     product = db.relationship('Product', backref='order_items')
 
+
+
+class DailyRevenue(db.Model):
+    """Per-day revenue rollup, maintained alongside every Sale and Order write"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # 'sale' or 'order'
+    transactions = db.Column(db.Integer, nullable=False, default=0)  # every sale/order placed
+    revenue = db.Column(db.Float, nullable=False, default=0)  # completed payments only
+    points_issued = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('day', 'source', name='uq_daily_revenue_day_source'),)
+
+    def __repr__(self):
+        return f'<DailyRevenue {self.day} {self.source}>'
+
+
+class PendingPayment(db.Model):
+    """A Khalti payment awaiting verification; finalized into an Order exactly once"""
+    id = db.Column(db.Integer, primary_key=True)
+    pidx = db.Column(db.String(100), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    purchase_order_id = db.Column(db.String(100), nullable=False)
+    amount = db.Column(db.Integer, nullable=False)  # In paisa, as sent to Khalti
+
+    # Snapshot of the checkout form/totals and the cart, as JSON
+    checkout_data = db.Column(db.Text, nullable=False)
+    cart = db.Column(db.Text, nullable=False)
+
+    status = db.Column(db.String(20), default='initiated')  # 'initiated', 'verifying', 'completed', 'failed', 'expired'
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(500), nullable=True)
+    next_check_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_pending_payment_status_next_check_at', 'status', 'next_check_at'),)
+
+    order = db.relationship('Order')
+
+    def __repr__(self):
+        return f'<PendingPayment {self.pidx} {self.status}>'
+
+
+class CartItem(db.Model):
+    """One line of a server-side shopping cart (see cart_store.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    cart_id = db.Column(db.String(32), nullable=False)  # random id kept in the session cookie
+    product_id = db.Column(db.Integer, nullable=False)  # no FK: deleted products drop out at checkout
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('cart_id', 'product_id', name='uq_cart_item_cart_id_product_id'),
+        db.Index('ix_cart_item_updated_at', 'updated_at'),  # pruning abandoned carts
+    )
+
+    def __repr__(self):
+        return f'<CartItem {self.cart_id} {self.product_id} x{self.quantity}>'
@@ -0,0 +1,88 @@
+"""
+Keyset (seek) pagination helpers for admin listing pages.
+
+Pages are ordered newest first on (timestamp, id) and the cursor is the
+position of the last row shown, so fetching page N costs the same as
+fetching page 1 no matter how large the table grows.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+Page = namedtuple('Page', ['rows', 'next_cursor'])
+
+
+def encode_cursor(timestamp, row_id):
+    """Serialize a (timestamp, id) position into a URL-safe cursor"""
+    return f'{timestamp.isoformat()}_{row_id}'
+
+
+def decode_cursor(cursor):
+    """Parse a cursor string, returning None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        return None
+
+
+def get_page_size(args, default=DEFAULT_PAGE_SIZE):
+    """Read ?per_page=, clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        per_page = int(args.get('per_page', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def parse_date_range(args):
+    """Read ?date_from=/?date_to= (YYYY-MM-DD) as a half-open datetime range"""
+    def parse(name):
+        value = args.get(name)
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            return None
+
+    date_from = parse('date_from')
+    date_to = parse('date_to')
+    if date_to:
+        date_to += timedelta(days=1)  # include the whole end day
+    return date_from, date_to
+
+
+def filter_date_range(query, column, date_from, date_to):
+    """Restrict a query to date_from <= column < date_to"""
+    if date_from:
+        query = query.filter(column >= date_from)
+    if date_to:
+        query = query.filter(column < date_to)
+    return query
+
+
+def keyset_paginate(query, timestamp_col, id_col, cursor=None, per_page=DEFAULT_PAGE_SIZE):
+    """Return one page of rows after the cursor, newest first"""
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, row_id = position
+        query = query.filter(or_(
+            timestamp_col < timestamp,
+            and_(timestamp_col == timestamp, id_col < row_id)
+        ))
+
+    rows = query.order_by(timestamp_col.desc(), id_col.desc()).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, timestamp_col.key), getattr(last, id_col.key))
+    return Page(rows, next_cursor)
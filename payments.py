@@ -0,0 +1,235 @@
+"""
+Background verification and finalization of Khalti payments.
+
+pay_with_khalti stores the checkout as a PendingPayment keyed by Khalti's
+pidx. The redirect back from Khalti only marks it as 'verifying'; a
+PaymentWorker (a thread inside the web process, or `flask payment-worker`
+as its own process) calls the lookup API and turns completed payments into
+orders. Finalization claims the row with a conditional UPDATE in the same
+transaction that creates the order, so a refreshed redirect, a Khalti retry
+or two workers racing can never create the same order twice.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from models import db, Order, OrderItem, PendingPayment
+from checkout import resolve_cart
+from inventory import InsufficientStock, reserve_stock
+from khalti_client import KhaltiError
+from points_ledger import earn_points, redeem_points
+from pricing import pricing
+from revenue_rollup import record_order
+
+OPEN_STATUSES = ('initiated', 'verifying')
+FAILED_KHALTI_STATUSES = ('Expired', 'User canceled', 'Refunded', 'Partially Refunded')
+
+# Give up on payments Khalti never confirms (its payment links expire after 30 minutes)
+MAX_PAYMENT_AGE = timedelta(hours=1)
+# Payments the customer has not returned from yet are checked less eagerly
+INITIATED_FIRST_CHECK = timedelta(seconds=30)
+MAX_BACKOFF_SECONDS = 300
+
+
+def create_pending_payment(pidx, user_id, purchase_order_id, amount, checkout_data, cart):
+    """Record a payment handed off to Khalti"""
+    pending = PendingPayment(
+        pidx=pidx,
+        user_id=user_id,
+        purchase_order_id=purchase_order_id,
+        amount=amount,
+        checkout_data=json.dumps(checkout_data),
+        cart=json.dumps(cart),
+        status='initiated',
+        next_check_at=datetime.utcnow() + INITIATED_FIRST_CHECK
+    )
+    db.session.add(pending)
+    db.session.commit()
+    return pending
+
+
+def mark_returned(pending):
+    """The customer came back from Khalti; verify this payment next"""
+    if pending.status == 'initiated':
+        pending.status = 'verifying'
+        pending.next_check_at = datetime.utcnow()
+        db.session.commit()
+
+
+def _claim(pending):
+    """Atomically move an open payment to 'completed'; False if someone else did"""
+    result = db.session.execute(
+        update(PendingPayment)
+        .where(PendingPayment.id == pending.id, PendingPayment.status.in_(OPEN_STATUSES))
+        .values(status='completed', updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount == 1
+
+
+def finalize_payment(pending):
+    """Create the order for a verified payment, exactly once
+
+    Returns the order, or None if the payment was already finalized.
+    """
+    if not _claim(pending):
+        db.session.rollback()
+        return None
+
+    checkout_data = json.loads(pending.checkout_data)
+    cart = json.loads(pending.cart)
+
+    order = Order(
+        user_id=pending.user_id,
+        full_name=checkout_data['full_name'],
+        email=checkout_data['email'],
+        phone=checkout_data['phone'],
+        address=checkout_data['address'],
+        city=checkout_data['city'],
+        postal_code=checkout_data['postal_code'],
+        delivery_option=checkout_data['delivery_option'],
+        payment_method='khalti',
+        subtotal=checkout_data['subtotal'],
+        delivery_charge=checkout_data['delivery_charge'],
+        discount=checkout_data['discount'],
+        total=checkout_data['total'],
+        payment_status='completed',
+        order_status='pending',
+        points_redeemed=checkout_data.get('points_to_redeem', 0)
+    )
+    db.session.add(order)
+    db.session.flush()
+
+    # Add order items
+    resolved_cart = resolve_cart(cart, lock=True)
+    for line in resolved_cart:
+        db.session.add(OrderItem(
+            order_id=order.id,
+            product_id=line.product_id,
+            product_name=line.name,
+            product_price=line.price,
+            quantity=line.quantity,
+            subtotal=line.subtotal
+        ))
+
+    # Take stock atomically; fails the whole order if any line is short
+    reserve_stock(resolved_cart.lines)
+
+    # Update loyalty points
+    points_earned = checkout_data.get('points_earned')
+    if points_earned is None:  # checkouts stored before quotes existed
+        points_earned = pricing.points_earned(checkout_data['subtotal'])
+    order.points_earned = points_earned
+    points_redeemed = checkout_data.get('points_to_redeem', 0)
+
+    # The discount is already paid for, so the redemption is honoured even
+    # if the balance moved meanwhile
+    if points_redeemed > 0:
+        redeem_points(pending.user_id, points_redeemed,
+                      f'Khalti Order #{order.id} - Rs. {checkout_data["discount"]:.2f} discount',
+                      require_balance=False)
+    earn_points(pending.user_id, points_earned,
+                f'Khalti Order #{order.id} - Rs. {checkout_data["subtotal"]}')
+
+    record_order(order)
+    pending.order_id = order.id
+    db.session.commit()
+    return order
+
+
+def _mark_failed(pending, status, error):
+    pending.status = status
+    pending.last_error = error[:500]
+    db.session.commit()
+
+
+def _reschedule(pending, error=None):
+    """Check again after a backoff, or expire a payment older than MAX_PAYMENT_AGE"""
+    if datetime.utcnow() - pending.created_at > MAX_PAYMENT_AGE:
+        _mark_failed(pending, 'expired', f'Not confirmed after {MAX_PAYMENT_AGE}' + (f': {error}' if error else ''))
+        return
+    pending.attempts = (pending.attempts or 0) + 1
+    pending.last_error = error[:500] if error else None
+    delay = min(2 ** pending.attempts, MAX_BACKOFF_SECONDS)
+    pending.next_check_at = datetime.utcnow() + timedelta(seconds=delay)
+    db.session.commit()
+
+
+def verify_payment(client, pending):
+    """Look a payment up with Khalti and finalize, fail or reschedule it"""
+    try:
+        data = client.lookup(pending.pidx)
+    except KhaltiError as e:
+        if e.status_code == 404:
+            _mark_failed(pending, 'failed', 'Unknown pidx at Khalti')
+        else:
+            _reschedule(pending, str(e))
+        return
+
+    status = data.get('status')
+    if status == 'Completed':
+        if data.get('total_amount') is not None and int(data['total_amount']) != pending.amount:
+            _mark_failed(pending, 'failed', f'Amount mismatch: paid {data["total_amount"]}, expected {pending.amount}')
+            return
+        try:
+            finalize_payment(pending)
+        except InsufficientStock as e:
+            db.session.rollback()
+            _mark_failed(pending, 'failed', f'{e.name} sold out before the payment was confirmed; refund required')
+    elif status in FAILED_KHALTI_STATUSES:
+        _mark_failed(pending, 'failed', f'Khalti status: {status}')
+    else:
+        _reschedule(pending, f'Khalti status: {status}')
+
+
+def process_due_payments(client, limit=20):
+    """Verify open payments whose next check is due; returns how many were checked
+
+    A payment that fails with an unexpected error is logged and rescheduled
+    (or expired, once too old) without holding up the rest of the batch.
+    """
+    due = PendingPayment.query.filter(
+        PendingPayment.status.in_(OPEN_STATUSES),
+        PendingPayment.next_check_at <= datetime.utcnow()
+    ).order_by(PendingPayment.next_check_at).limit(limit).all()
+
+    for pending in due:
+        pidx = pending.pidx
+        try:
+            verify_payment(client, pending)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Unexpected error while verifying payment %s', pidx)
+            _reschedule(pending, 'Unexpected error while verifying payment')
+    return len(due)
+
+
+class PaymentWorker(threading.Thread):
+    """Daemon thread that keeps verifying pending payments"""
+
+    def __init__(self, app, client, interval=2.0):
+        super().__init__(name='payment-worker', daemon=True)
+        self.app = app
+        self.client = client
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            checked = 0
+            with self.app.app_context():
+                try:
+                    checked = process_due_payments(self.client)
+                except Exception:
+                    self.app.logger.exception('Payment verification failed')
+                finally:
+                    db.session.remove()
+            # Keep going straight away while there is a backlog
+            if not checked:
+                self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
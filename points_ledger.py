@@ -0,0 +1,104 @@
+"""
+Loyalty points ledger.
+
+Every balance change writes a PointsTransaction row and adjusts
+LoyaltyCard.points with a single in-database UPDATE (points = points + :delta),
+recomputing the tier in the same statement. Concurrent POS sales and online
+orders for the same customer therefore can no longer lose updates.
+"""
+from sqlalchemy import case, func, select, update
+
+from models import db, LoyaltyCard, PointsTransaction, TIER_THRESHOLDS
+
+
+class InsufficientPoints(Exception):
+    """Raised when a redemption would take a balance below zero"""
+
+    def __init__(self, user_id, points):
+        self.user_id = user_id
+        self.points = points
+        super().__init__(f'User {user_id} does not have {points} points to redeem')
+
+
+def tier_case(points_expr):
+    """SQL CASE expression mapping a points expression to its tier"""
+    whens = [(points_expr >= minimum, tier) for tier, minimum in TIER_THRESHOLDS[:-1]]
+    return case(*whens, else_=TIER_THRESHOLDS[-1][0])
+
+
+def _adjust_balance(user_id, delta, require_balance=False):
+    """Apply delta to the card in one UPDATE; returns (points, tier) or None if no card"""
+    new_points = func.coalesce(LoyaltyCard.points, 0) + delta
+    stmt = update(LoyaltyCard).where(LoyaltyCard.user_id == user_id)
+    if require_balance:
+        stmt = stmt.where(new_points >= 0)
+    stmt = stmt.values(points=new_points, tier=tier_case(new_points))
+
+    if db.session.get_bind().dialect.update_returning:
+        row = db.session.execute(
+            stmt.returning(LoyaltyCard.points, LoyaltyCard.tier),
+            execution_options={'synchronize_session': 'fetch'}
+        ).first()
+        return tuple(row) if row else None
+
+    result = db.session.execute(stmt, execution_options={'synchronize_session': 'fetch'})
+    if result.rowcount == 0:
+        return None
+    return tuple(db.session.execute(
+        select(LoyaltyCard.points, LoyaltyCard.tier).where(LoyaltyCard.user_id == user_id)
+    ).one())
+
+
+def earn_points(user_id, points, description):
+    """Credit points and log an 'earn' transaction; returns (points, tier) or None"""
+    balance = _adjust_balance(user_id, points)
+    if balance is not None:
+        db.session.add(PointsTransaction(user_id=user_id, points=points, type='earn', description=description))
+    return balance
+
+
+def redeem_points(user_id, points, description, require_balance=True):
+    """Debit points and log a 'redeem' transaction; returns (points, tier) or None
+
+    Raises InsufficientPoints if require_balance is set and the balance is too
+    low at the moment of the update.
+    """
+    balance = _adjust_balance(user_id, -points, require_balance=require_balance)
+    if balance is None:
+        if require_balance and db.session.query(LoyaltyCard.id).filter_by(user_id=user_id).first():
+            raise InsufficientPoints(user_id, points)
+        return None
+    db.session.add(PointsTransaction(user_id=user_id, points=points, type='redeem', description=description))
+    return balance
+
+
+def ledger_balance_subquery():
+    """Correlated subquery: sum of a card owner's earn minus redeem transactions"""
+    signed = case((PointsTransaction.type == 'redeem', -PointsTransaction.points), else_=PointsTransaction.points)
+    return (
+        select(func.coalesce(func.sum(signed), 0))
+        .where(PointsTransaction.user_id == LoyaltyCard.user_id)
+        .scalar_subquery()
+    )
+
+
+def count_drifted_cards():
+    """Number of cards whose balance no longer matches their ledger"""
+    return db.session.query(func.count(LoyaltyCard.id)).filter(
+        func.coalesce(LoyaltyCard.points, 0) != ledger_balance_subquery()
+    ).scalar()
+
+
+def reconcile_balances():
+    """Recompute every card's points and tier from the ledger in two bulk UPDATEs"""
+    drifted = count_drifted_cards()
+    db.session.execute(
+        update(LoyaltyCard).values(points=ledger_balance_subquery()),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        update(LoyaltyCard).values(tier=tier_case(LoyaltyCard.points)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return drifted
@@ -0,0 +1,131 @@
+"""
+Batched, idempotent sale submission for in-store POS terminals.
+
+Terminals queue sales while offline and push them to
+POST /api/pos/sales:batch when they reconnect:
+
+    Authorization: Bearer <terminal token>
+    {"sales": [{"id": "<uuid4>", "username": "sita", "amount": 1250.0,
+                "items": "5x Notebooks", "date": "2026-10-17T18:42:00"}, ...]}
+
+Every sale carries a UUID generated on the terminal and stored as
+Sale.client_id under a unique index, so a batch resent after a timeout only
+records the sales that did not make it the first time; the rest come back as
+'duplicate'. A batch is written in one transaction with the same bulk
+inserts and grouped point updates as the CSV import (sale_import), and the
+response has one result per submitted sale, in order:
+
+    {"results": [{"id": ..., "status": "created", "points": 125},
+                 {"id": ..., "status": "duplicate"},
+                 {"id": ..., "status": "error", "error": "unknown user 'ram'"}],
+     "created": 1, "duplicates": 1, "errors": 1}
+
+If the batch keeps colliding with a concurrent submission of the same sales,
+the API answers 409 with Retry-After; resending the batch is always safe.
+
+Tokens are configured with POS_API_TOKENS ("terminal:token,terminal:token").
+"""
+import hmac
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from sale_import import existing_client_ids, parse_client_id, parse_sale, write_sales
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+ERROR = 'error'
+
+BatchResult = namedtuple('BatchResult', ['results', 'created', 'duplicates', 'errors'])
+
+
+class BatchError(Exception):
+    """Raised when a request body is not a batch of sales at all"""
+
+
+class BatchConflict(Exception):
+    """Raised when concurrent submissions of the same sales keep colliding; retry the batch"""
+
+
+def parse_tokens(value):
+    """{token: terminal} from "terminal:token,terminal:token" """
+    tokens = {}
+    for entry in (value or '').split(','):
+        terminal, _, token = entry.strip().rpartition(':')
+        if token:
+            tokens[token] = terminal or 'pos'
+    return tokens
+
+
+def authenticate(authorization, tokens):
+    """Terminal name for an "Authorization: Bearer <token>" header, or None"""
+    scheme, _, presented = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not presented:
+        return None
+    terminal = None
+    for token, name in tokens.items():
+        # Compare against every token so timing does not reveal which matched
+        if hmac.compare_digest(presented.encode(), token.encode()):
+            terminal = name
+    return terminal
+
+
+def submit_batch(payload, max_sales):
+    """Record a batch of sales from a terminal; returns a BatchResult
+
+    Raises BatchError if the payload is malformed or holds more than
+    max_sales sales, and BatchConflict if it could not be written.
+    """
+    sales = payload.get('sales') if isinstance(payload, dict) else None
+    if not isinstance(sales, list) or not sales:
+        raise BatchError('expected {"sales": [...]} with at least one sale')
+    if len(sales) > max_sales:
+        raise BatchError(f'a batch holds at most {max_sales} sales, got {len(sales)}')
+
+    results = [None] * len(sales)
+    pending = []
+    seen = set()
+    for index, item in enumerate(sales):
+        raw_id = item.get('id') if isinstance(item, dict) else None
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('expected an object')
+            client_id = parse_client_id(raw_id)
+            sale = parse_sale(item)._replace(client_id=client_id)
+        except ValueError as exc:
+            results[index] = {'id': raw_id, 'status': ERROR, 'error': str(exc)}
+            continue
+        if client_id in seen:  # repeated within the batch
+            results[index] = {'id': raw_id, 'status': DUPLICATE}
+            continue
+        seen.add(client_id)
+        pending.append((index, sale))
+
+    # A concurrent resend of the same batch can win the race for the unique
+    # index; the second attempt then finds its sales and reports duplicates
+    for attempt in range(2):
+        existing = existing_client_ids([sale.client_id for _, sale in pending])
+        to_write = [(index, sale) for index, sale in pending if sale.client_id not in existing]
+        try:
+            written, errors = write_sales(to_write, {}, datetime.utcnow())
+            db.session.commit()
+            break
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                raise BatchConflict('the batch collided with a concurrent submission, retry it') from None
+
+    for index, sale in pending:
+        if sale.client_id in existing:
+            results[index] = {'id': sales[index]['id'], 'status': DUPLICATE}
+    for index, points in written:
+        results[index] = {'id': sales[index]['id'], 'status': CREATED, 'points': points}
+    for error in errors:
+        results[error.line] = {'id': sales[error.line]['id'], 'status': ERROR, 'error': error.message}
+
+    def count(status):
+        return sum(1 for result in results if result['status'] == status)
+
+    return BatchResult(results, count(CREATED), count(DUPLICATE), count(ERROR))
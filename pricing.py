@@ -0,0 +1,208 @@
+"""
+Checkout pricing.
+
+PricingEngine turns resolved cart lines, a delivery option and the
+customer's points balance into an immutable Quote: line prices, subtotal,
+delivery charge, points redeemed and the discount they buy, total and the
+points the order will earn. The rules are data (PricingRules, configured
+from app.config) rather than literals spread over the views.
+
+Quotes get a random id and are kept for PRICING_QUOTE_TTL seconds (in the
+catalog's Redis when CATALOG_CACHE_URL is set, else in the worker that made
+them). The checkout page prices the cart and posts the quote id back.
+place_order and pay_with_khalti still re-read every product in the cart
+(place_order with a lock), and reuse the quote, repricing only the delivery
+option, only if it belongs to the customer, has not expired and still
+matches the current names, prices, quantities and points balance.
+Otherwise the cart is priced again, so an order is never charged a price
+the catalog no longer has.
+
+quote_many() prices many carts in one pass for promotion simulations (see
+benchmarks.pricing_engine).
+"""
+import secrets
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from catalog_cache import LRUCache, RedisCache, shared_cache_client
+from checkout import resolve_cart
+from models import Product
+
+PricingRules = namedtuple('PricingRules', [
+    'delivery_fees',       # delivery option -> charge in NPR
+    'earn_rate',           # NPR spent per point earned
+    'redeem_min_balance',  # points needed before any can be redeemed
+    'redeem_max_points',   # points redeemed per order at most
+    'points_per_rupee',    # points per NPR of discount
+])
+
+DEFAULT_RULES = PricingRules(
+    delivery_fees=MappingProxyType({'standard': 0, 'express': 150, 'pickup': 0}),
+    earn_rate=10,
+    redeem_min_balance=100,
+    redeem_max_points=100,
+    points_per_rupee=10,
+)
+
+QuoteLine = namedtuple('QuoteLine', ['product_id', 'name', 'price', 'quantity', 'subtotal'])
+
+Quote = namedtuple('Quote', [
+    'quote_id', 'user_id', 'lines', 'subtotal', 'delivery_option', 'delivery_charge',
+    'points_to_redeem', 'discount', 'total', 'points_earned', 'expires_at',
+])
+
+
+def quote_to_dict(quote):
+    data = quote._asdict()
+    data['lines'] = [line._asdict() for line in quote.lines]
+    return data
+
+
+def quote_from_dict(data):
+    return Quote(**{**data, 'lines': tuple(QuoteLine(**line) for line in data['lines'])})
+
+
+def cart_signature(quote):
+    """{product_id: quantity} the quote was made for, comparable with carts.items()"""
+    return {line.product_id: line.quantity for line in quote.lines}
+
+
+class PricingEngine:
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = rules
+        self.ttl = 300
+        self.quotes = LRUCache(maxsize=4096, ttl=self.ttl)
+
+    def init_app(self, app, client=None):
+        """Read the rules and quote lifetime from app.config"""
+        fees = app.config.get('DELIVERY_FEES', dict(DEFAULT_RULES.delivery_fees))
+        self.rules = PricingRules(
+            delivery_fees=MappingProxyType({option: float(fee) for option, fee in fees.items()}),
+            earn_rate=app.config.get('POINTS_EARN_RATE', DEFAULT_RULES.earn_rate),
+            redeem_min_balance=app.config.get('POINTS_REDEEM_MIN_BALANCE', DEFAULT_RULES.redeem_min_balance),
+            redeem_max_points=app.config.get('POINTS_REDEEM_MAX', DEFAULT_RULES.redeem_max_points),
+            points_per_rupee=app.config.get('POINTS_PER_RUPEE', DEFAULT_RULES.points_per_rupee),
+        )
+        self.ttl = int(app.config.get('PRICING_QUOTE_TTL', 300))
+        if client is None:
+            client = shared_cache_client(app)
+        if client is not None:
+            self.quotes = RedisCache(client, prefix='quote', ttl=self.ttl)
+        else:
+            self.quotes = LRUCache(maxsize=4096, ttl=self.ttl)
+        app.extensions['pricing'] = self
+
+    # --- rules ------------------------------------------------------------
+
+    def delivery_charge(self, option):
+        """Charge for a delivery option; unknown options cost nothing, as before"""
+        return self.rules.delivery_fees.get(option, 0)
+
+    def points_earned(self, amount):
+        """Points earned on an amount in NPR (online orders and POS sales)"""
+        return int(amount / self.rules.earn_rate)
+
+    def points_to_redeem(self, balance):
+        """Points automatically redeemed on an order for a card balance"""
+        if balance is None or balance < self.rules.redeem_min_balance:
+            return 0
+        return min(self.rules.redeem_max_points, balance)
+
+    # --- quotes -----------------------------------------------------------
+
+    def price(self, lines, delivery_option='standard', points_balance=None, user_id=None):
+        """Quote for resolved cart lines (CartLine or QuoteLine); no database access"""
+        quote_lines = tuple(
+            QuoteLine(line.product_id, line.name, line.price, line.quantity, line.price * line.quantity)
+            for line in lines
+        )
+        subtotal = sum(line.subtotal for line in quote_lines)
+        delivery_charge = self.delivery_charge(delivery_option)
+        points_to_redeem = self.points_to_redeem(points_balance)
+        discount = points_to_redeem / self.rules.points_per_rupee
+        return Quote(
+            quote_id=secrets.token_urlsafe(12),
+            user_id=user_id,
+            lines=quote_lines,
+            subtotal=subtotal,
+            delivery_option=delivery_option,
+            delivery_charge=delivery_charge,
+            points_to_redeem=points_to_redeem,
+            discount=discount,
+            total=subtotal + delivery_charge - discount,
+            points_earned=self.points_earned(subtotal),
+            expires_at=time.time() + self.ttl,
+        )
+
+    def with_delivery(self, quote, delivery_option):
+        """The same quote for another delivery option (same id and expiry)"""
+        if delivery_option == quote.delivery_option:
+            return quote
+        delivery_charge = self.delivery_charge(delivery_option)
+        return quote._replace(
+            delivery_option=delivery_option,
+            delivery_charge=delivery_charge,
+            total=quote.subtotal + delivery_charge - quote.discount,
+        )
+
+    def save(self, quote):
+        self.quotes.set(quote.quote_id, quote_to_dict(quote))
+        return quote
+
+    def load(self, quote_id, user_id, cart_items):
+        """A saved quote still valid for this customer and cart, or None"""
+        data = self.quotes.get(quote_id) if quote_id else None
+        if data is None:
+            return None
+        quote = quote_from_dict(data)
+        if quote.user_id != user_id or quote.expires_at < time.time():
+            return None
+        if cart_signature(quote) != {int(product_id): quantity for product_id, quantity in cart_items.items()}:
+            return None
+        return quote
+
+    def is_current(self, quote, lines, points_balance):
+        """Whether a quote still matches freshly resolved cart lines and balance"""
+        def key(line):
+            return line.product_id, line.name, line.price, line.quantity
+        return (sorted(map(key, quote.lines)) == sorted(map(key, lines))
+                and quote.points_to_redeem == self.points_to_redeem(points_balance))
+
+    def quote_many(self, carts, delivery_option='standard'):
+        """Price many carts at once: [(cart items, points balance)] -> [Quote]
+
+        All products referenced by any cart are loaded with one query. Lines
+        whose product no longer exists are left out.
+        """
+        product_ids = {int(product_id) for items, _ in carts for product_id in items}
+        products = {}
+        if product_ids:
+            products = {product.id: product for product in Product.query.filter(Product.id.in_(product_ids))}
+        quotes = []
+        for items, balance in carts:
+            lines = []
+            for product_id, quantity in items.items():
+                product = products.get(int(product_id))
+                if product is not None:
+                    price = float(product.price)
+                    lines.append(QuoteLine(product.id, product.name, price, quantity, price * quantity))
+            quotes.append(self.price(lines, delivery_option, balance))
+        return quotes
+
+
+pricing = PricingEngine()
+
+
+def quote_cart(cart_items, delivery_option, user, lock=False, quote_id=None):
+    """(quote, resolved cart) for the current customer's cart at current prices
+
+    The cart's products are always re-read (and locked if asked). The saved
+    quote `quote_id` is reused only if it still matches them.
+    """
+    resolved_cart = resolve_cart(cart_items, lock=lock)
+    balance = user.loyalty_card.points if user.loyalty_card else None
+    quote = pricing.load(quote_id, user.id, cart_items) if quote_id else None
+    if quote is None or not pricing.is_current(quote, resolved_cart.lines, balance):
+        quote = pricing.price(resolved_cart.lines, delivery_option, balance, user.id)
+    return pricing.with_delivery(quote, delivery_option), resolved_cart
@@ -0,0 +1,220 @@
+"""
+Full-text product search for the storefront.
+
+On SQLite the catalog is indexed by an external-content FTS5 table
+(product_fts) kept in sync with the product table by triggers; on Postgres
+by a GIN index over a weighted tsvector expression, which the database
+maintains itself. Either way add/edit/delete_product need no extra code.
+Matches are filtered by category, price range and stock, ranked (name over
+category over description) and paginated by page number. Other databases
+fall back to an unranked LIKE search.
+
+On SQLite the ranking is by tier: products with every term in the name,
+then every term in the name or category, then the rest, newest first within
+a tier. Each tier is its own FTS5 query read in rowid order, and SQLite
+merges them, so a page only reads the matches up to its end instead of
+scoring every match of a broad term ("pen" hits a quarter of a large
+catalog). Postgres ranks all matches with ts_rank. Either way the order is
+total and the same for every page.
+"""
+import re
+from collections import namedtuple
+
+from sqlalchemy import column, func, literal_column, or_, select, table, text, union_all
+
+from models import db, Product
+from pagination import DEFAULT_PAGE_SIZE, get_page_size
+
+SearchParams = namedtuple('SearchParams', ['q', 'category', 'min_price', 'max_price', 'in_stock', 'page', 'per_page'])
+SearchResults = namedtuple('SearchResults', ['products', 'page', 'has_next'])
+
+product_fts = table('product_fts', column('rowid'))
+
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description, category,
+        content='product', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END""",
+    # Only text changes touch the index; stock updates at checkout do not
+    """CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF name, description, category ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO product_fts(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END""",
+]
+
+# Must match the indexed expression exactly for Postgres to use the GIN index
+PG_DOCUMENT = (
+    "(setweight(to_tsvector('english', coalesce(product.name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(product.category, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(product.description, '')), 'C'))"
+)
+PG_DDL = [f"CREATE INDEX IF NOT EXISTS ix_product_search ON product USING GIN ({PG_DOCUMENT})"]
+
+_ready_engines = set()
+
+
+def ensure_search_index(rebuild=False, conn=None):
+    """Create the search index for the current database if it is missing
+
+    With rebuild=True (or when the FTS5 table is created for the first time)
+    the index is repopulated from the product table. Runs on `conn` if given,
+    otherwise in its own transaction.
+    """
+    if conn is None:
+        with db.engine.begin() as conn:
+            return ensure_search_index(rebuild, conn)
+
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        existed = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'"
+        )).first() is not None
+        for statement in FTS_DDL:
+            conn.execute(text(statement))
+        if rebuild or not existed:
+            conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for statement in PG_DDL:
+            conn.execute(text(statement))
+        if rebuild:
+            conn.execute(text('REINDEX INDEX ix_product_search'))
+    _ready_engines.add(conn.engine)
+
+
+def drop_search_index(conn):
+    """Remove the search index and its triggers"""
+    if conn.dialect.name == 'sqlite':
+        for trigger in ('product_fts_insert', 'product_fts_delete', 'product_fts_update'):
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+        conn.execute(text('DROP TABLE IF EXISTS product_fts'))
+    elif conn.dialect.name == 'postgresql':
+        conn.execute(text('DROP INDEX IF EXISTS ix_product_search'))
+    _ready_engines.discard(conn.engine)
+
+
+def parse_search_args(args):
+    """Read q/category/min_price/max_price/in_stock/page/per_page from a request"""
+    def parse_price(name):
+        try:
+            value = float(args.get(name, ''))
+        except ValueError:
+            return None
+        return value if value >= 0 else None
+
+    try:
+        page = max(1, int(args.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    return SearchParams(
+        q=(args.get('q') or '').strip()[:100],
+        category=(args.get('category') or '').strip() or None,
+        min_price=parse_price('min_price'),
+        max_price=parse_price('max_price'),
+        in_stock=args.get('in_stock') in ('1', 'on', 'true'),
+        page=page,
+        per_page=get_page_size(args, default=DEFAULT_PAGE_SIZE),
+    )
+
+
+def _terms(q):
+    """Split a query into plain word tokens, dropping search-syntax characters"""
+    return re.findall(r'\w+', q.lower())[:10]
+
+
+def _apply_filters(query, params):
+    if params.category:
+        query = query.filter(Product.category == params.category)
+    if params.min_price is not None:
+        query = query.filter(Product.price >= params.min_price)
+    if params.max_price is not None:
+        query = query.filter(Product.price <= params.max_price)
+    if params.in_stock:
+        query = query.filter(Product.stock > 0)
+    return query
+
+
+def _tier_matches(terms):
+    """FTS5 queries for the name, name-or-category and any-column tiers
+
+    Every term must match (porter stemming makes "pens" find "pen"); each
+    tier excludes the ones before it, so a product is in exactly one.
+    """
+    def every_term(columns):
+        return ' AND '.join(f'{columns}"{term}"' for term in terms)
+
+    name, name_or_category, anywhere = every_term('{name}: '), every_term('{name category}: '), every_term('')
+    return [name, f'({name_or_category}) NOT ({name})', f'({anywhere}) NOT ({name_or_category})']
+
+
+def _search_fts(terms, params, offset):
+    """Up to per_page + 1 products for a page of an SQLite search"""
+    tiers = [
+        _apply_filters(
+            select(product_fts.c.rowid.label('id'), literal_column(str(tier)).label('tier'))
+            .select_from(product_fts)
+            .join(Product, Product.id == product_fts.c.rowid)
+            .where(literal_column('product_fts').op('MATCH')(match)),
+            params,
+        )
+        for tier, match in enumerate(_tier_matches(terms))
+    ]
+    # Ordering by the FTS rowid lets SQLite merge the tiers and stop early
+    ids = db.session.execute(
+        union_all(*tiers).order_by(text('tier'), text('id DESC')).offset(offset).limit(params.per_page + 1)
+    ).scalars().all()
+    products = {product.id: product for product in Product.query.filter(Product.id.in_(ids))}
+    return [products[product_id] for product_id in ids if product_id in products]
+
+
+def search_products(params):
+    """One page of products matching params, best matches first"""
+    query = _apply_filters(Product.query, params)
+    terms = _terms(params.q)
+    dialect = db.engine.dialect.name
+    offset = (params.page - 1) * params.per_page
+
+    if terms and dialect in ('sqlite', 'postgresql') and db.engine not in _ready_engines:
+        ensure_search_index()
+
+    if not terms:
+        query = query.order_by(Product.id)
+    elif dialect == 'sqlite':
+        rows = _search_fts(terms, params, offset)
+        return SearchResults(rows[:params.per_page], params.page, len(rows) > params.per_page)
+    elif dialect == 'postgresql':
+        tsquery = func.plainto_tsquery('english', ' '.join(terms))
+        document = literal_column(PG_DOCUMENT)
+        query = (
+            query.filter(document.op('@@')(tsquery))
+            .order_by(func.ts_rank(document, tsquery).desc(), Product.id)
+        )
+    else:
+        for term in terms:
+            pattern = f'%{term}%'
+            query = query.filter(or_(
+                Product.name.ilike(pattern),
+                Product.description.ilike(pattern),
+                Product.category.ilike(pattern)
+            ))
+        query = query.order_by(Product.name, Product.id)
+
+    rows = query.offset(offset).limit(params.per_page + 1).all()
+    return SearchResults(rows[:params.per_page], params.page, len(rows) > params.per_page)
+
+
+def get_categories():
+    """Distinct product categories, for the filter dropdown"""
+    return [category for (category,) in
+            db.session.query(Product.category).filter(Product.category.isnot(None), Product.category != '')
+            .distinct().order_by(Product.category)]
@@ -0,0 +1,59 @@
+"""
+Helpers for counting the SQL statements a block of code issues.
+
+Used to keep listing routes free of N+1 queries, e.g.:
+
+    with app.app_context(), assert_max_queries(5):
+        client.get('/my_orders')
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+# Upper bounds for the listing routes, independent of how many rows they show;
+# tests/test_query_budgets.py requests every route here against a seeded database
+ROUTE_QUERY_BUDGETS = {
+    '/my_orders': 5,
+    '/dashboard': 8,
+    '/admin/orders': 6,
+    '/admin/sales': 8,
+    '/admin/customers': 4,
+    '/admin/loyalty_cards': 4,
+}
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Collect every SQL statement executed on the engine inside the block"""
+    engine = engine or db.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with the offending SQL if the block issues more than `limit` statements"""
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > limit:
+        raise AssertionError(
+            f'{len(statements)} queries executed, expected at most {limit}:\n' + '\n'.join(statements)
+        )
+
+
+def assert_route_within_budget(client, path, limit=None):
+    """GET a route with a test client and check it stays within its query budget"""
+    limit = limit if limit is not None else ROUTE_QUERY_BUDGETS[path]
+    with assert_max_queries(limit):
+        response = client.get(path)
+    return response
@@ -0,0 +1,139 @@
+"""
+Maintenance of the DailyRevenue rollup table.
+
+record_sale/record_order are called inside the same transaction that writes
+the Sale or Order, so the rollup always agrees with the source tables.
+rebuild_daily_revenue recomputes the whole table from history; migration 0008
+runs it once to backfill databases that predate the rollup.
+"""
+from datetime import date, datetime
+
+from sqlalchemy import case, func, literal, select, text, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Sale, Order, DailyRevenue
+
+SOURCE_SALE = 'sale'
+SOURCE_ORDER = 'order'
+
+
+def _to_date(value):
+    """Normalize a datetime or func.date() result (str on SQLite) to a date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _increment(day, source, transactions=0, revenue=0, points_issued=0):
+    """Atomically add to the rollup row for (day, source), creating it if needed"""
+    table = DailyRevenue.__table__
+    values = {
+        'day': day,
+        'source': source,
+        'transactions': transactions,
+        'revenue': revenue,
+        'points_issued': points_issued,
+    }
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else pg_insert
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['day', 'source'],
+            set_={
+                'transactions': table.c.transactions + stmt.excluded.transactions,
+                'revenue': table.c.revenue + stmt.excluded.revenue,
+                'points_issued': table.c.points_issued + stmt.excluded.points_issued,
+            }
+        )
+        db.session.execute(stmt)
+        return
+
+    result = db.session.execute(
+        update(table)
+        .where(table.c.day == day, table.c.source == source)
+        .values(
+            transactions=table.c.transactions + transactions,
+            revenue=table.c.revenue + revenue,
+            points_issued=table.c.points_issued + points_issued,
+        )
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(**values))
+
+
+def record_sale(sale):
+    """Add a manual sale to the rollup (call after the sale is flushed)"""
+    _increment(
+        _to_date(sale.date or datetime.utcnow()),
+        SOURCE_SALE,
+        transactions=1,
+        revenue=sale.amount,
+        points_issued=sale.points_earned or 0,
+    )
+
+
+def record_sale_totals(day, transactions, revenue, points_issued):
+    """Add a day's worth of imported sales to the rollup in one statement"""
+    _increment(day, SOURCE_SALE, transactions=transactions, revenue=revenue, points_issued=points_issued)
+
+
+def record_order(order):
+    """Add an order to the rollup; only completed payments count as revenue"""
+    completed = order.payment_status == 'completed'
+    _increment(
+        _to_date(order.created_at or datetime.utcnow()),
+        SOURCE_ORDER,
+        transactions=1,
+        revenue=order.total if completed else 0,
+        points_issued=(order.points_earned or 0) if completed else 0,
+    )
+
+
+def rebuild_daily_revenue(conn=None):
+    """Recompute every rollup row from the Sale and Order tables
+
+    Runs on `conn` if given, otherwise in its own transaction, and returns the
+    number of rollup rows. The rollup table is locked before it is cleared and
+    refilled with one INSERT ... SELECT, so a sale or order committed while the
+    rebuild runs either waits for it or is already in the recomputed totals.
+    """
+    if conn is None:
+        with db.engine.begin() as conn:
+            return rebuild_daily_revenue(conn)
+
+    table = DailyRevenue.__table__
+    dialect = conn.dialect.name
+    if dialect == 'postgresql':
+        # SQLite takes its database-wide write lock on the DELETE below
+        conn.execute(text(f'LOCK TABLE {conn.dialect.identifier_preparer.format_table(table)} IN EXCLUSIVE MODE'))
+    conn.execute(table.delete())
+
+    sale_day = func.date(Sale.date)
+    sale_rows = select(
+        sale_day,
+        literal(SOURCE_SALE),
+        func.count(Sale.id),
+        func.coalesce(func.sum(Sale.amount), 0),
+        func.coalesce(func.sum(Sale.points_earned), 0),
+    ).where(Sale.date.isnot(None)).group_by(sale_day)
+
+    completed = Order.payment_status == 'completed'
+    order_day = func.date(Order.created_at)
+    order_rows = select(
+        order_day,
+        literal(SOURCE_ORDER),
+        func.count(Order.id),
+        func.coalesce(func.sum(case((completed, Order.total), else_=0)), 0),
+        func.coalesce(func.sum(case((completed, Order.points_earned), else_=0)), 0),
+    ).where(Order.created_at.isnot(None)).group_by(order_day)
+
+    conn.execute(table.insert().from_select(
+        ['day', 'source', 'transactions', 'revenue', 'points_issued'],
+        union_all(sale_rows, order_rows),
+    ))
+    return conn.execute(select(func.count()).select_from(table)).scalar()
@@ -0,0 +1,301 @@
+"""
+Bulk import of point-of-sale sales from CSV.
+
+Shops upload their end-of-day POS batch as a CSV with a header row:
+
+    username,amount,items,date,client_id
+    sita,1250.00,"5x Notebooks, 1x Parker Pen",2026-10-17 18:42:00,0b6f7c1e-...
+
+`items`, `date` and `client_id` are optional (date defaults to now; ISO
+dates or datetimes). `client_id` is the POS's UUID for the sale, stored as
+Sale.client_id like the sync API's ids: rows whose id is already recorded
+are counted as duplicates and skipped, so uploading the same file again
+after a failure changes nothing. Each sale earns points like a sale entered
+with add_sale.
+
+The file is read as a stream and handled in chunks of rows. For every chunk
+the usernames are resolved with one IN query (and remembered for later
+chunks), then Sale and PointsTransaction rows are inserted with one
+executemany each, every customer's points for the chunk are added with one
+batched UPDATE, and the revenue rollup gets one increment per day. Each chunk
+is its own transaction: a bad row is reported with its line number and
+skipped. If the database rejects a chunk, it is written again one row at a
+time, each in a savepoint, so only the rows that fail are reported and
+dropped. The whole file is decoded and parsed once before anything is
+written, so a file that is not UTF-8 CSV is rejected with the line where it
+became unreadable and nothing imported.
+"""
+import csv
+import io
+import math
+import shutil
+import tempfile
+import uuid
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, User, LoyaltyCard, Sale, PointsTransaction
+from points_ledger import tier_case
+from pricing import pricing
+from revenue_rollup import _to_date, record_sale_totals
+
+REQUIRED_COLUMNS = ('username', 'amount')
+
+SaleRow = namedtuple('SaleRow', ['username', 'amount', 'items', 'date', 'client_id'], defaults=(None,))
+RowError = namedtuple('RowError', ['line', 'message'])
+ImportResult = namedtuple('ImportResult', ['rows', 'imported', 'points', 'errors', 'duplicates'], defaults=(0,))
+
+# Customer lookup: username -> (user id, has a loyalty card)
+_Customer = namedtuple('_Customer', ['user_id', 'has_card'])
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'invalid date {value!r}') from None
+
+
+def _text(row, key):
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def parse_sale(row):
+    """SaleRow from a CSV row or JSON object; raises ValueError"""
+    username = _text(row, 'username')
+    if not username:
+        raise ValueError('missing username')
+    raw_amount = row.get('amount')
+    if raw_amount is None:
+        raise ValueError('missing amount')
+    # bool is an int subclass; true must not count as Rs. 1
+    if isinstance(raw_amount, bool) or not isinstance(raw_amount, (int, float, str)):
+        raise ValueError(f'invalid amount {raw_amount!r}')
+    try:
+        amount = float(raw_amount)
+    except (OverflowError, ValueError):
+        raise ValueError(f'invalid amount {raw_amount!r}') from None
+    if not (amount > 0 and math.isfinite(amount)):
+        raise ValueError(f'amount must be positive, got {raw_amount!r}')
+    items = _text(row, 'items')  # '' like an empty add_sale field
+    if len(items) > 500:
+        raise ValueError('items description is longer than 500 characters')
+    date = _text(row, 'date')
+    return SaleRow(username, amount, items, _parse_date(date) if date else None)
+
+
+def parse_client_id(value):
+    """Normalised UUID string for a sale's client id; raises ValueError"""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        raise ValueError(f'invalid id {value!r}, expected a UUID') from None
+
+
+def existing_client_ids(client_ids):
+    """The subset of client_ids already recorded as sales, with one query"""
+    if not client_ids:
+        return set()
+    return set(db.session.execute(select(Sale.client_id).where(Sale.client_id.in_(client_ids))).scalars())
+
+
+def _lookup_customers(usernames, known):
+    """Add the customers for usernames not in `known` with one query"""
+    missing = [name for name in usernames if name not in known]
+    if not missing:
+        return
+    rows = db.session.execute(
+        select(User.username, User.id, LoyaltyCard.id)
+        .outerjoin(LoyaltyCard, LoyaltyCard.user_id == User.id)
+        .where(User.username.in_(missing))
+    )
+    for username, user_id, card_id in rows:
+        known[username] = _Customer(user_id, card_id is not None)
+
+
+def _add_points(deltas):
+    """Credit {user_id: points} to the cards with one executemany UPDATE"""
+    table = LoyaltyCard.__table__
+    new_points = func.coalesce(table.c.points, 0) + bindparam('delta')
+    stmt = (
+        update(table)
+        .where(table.c.user_id == bindparam('card_user_id'))
+        .values(points=new_points, tier=tier_case(new_points))
+    )
+    db.session.execute(stmt, [{'card_user_id': user_id, 'delta': delta} for user_id, delta in deltas.items()])
+
+
+def write_sales(entries, customers, now):
+    """Insert [(key, SaleRow)] without committing; returns ([(key, points)], errors)
+
+    `customers` caches username lookups between calls. Rows for unknown users
+    are returned as RowError(key, message).
+    """
+    _lookup_customers({sale.username for _, sale in entries}, customers)
+
+    written = []
+    errors = []
+    sales = []
+    transactions = []
+    deltas = defaultdict(int)
+    days = defaultdict(lambda: [0, 0.0, 0])
+    for key, (username, amount, items, date, client_id) in entries:
+        customer = customers.get(username)
+        if customer is None:
+            errors.append(RowError(key, f'unknown user {username!r}'))
+            continue
+        date = date or now
+        points = pricing.points_earned(amount)
+        written.append((key, points))
+        sales.append({'user_id': customer.user_id, 'amount': amount, 'items': items, 'date': date,
+                      'client_id': client_id, 'points_earned': points})
+        # Like earn_points: customers without a card get no ledger entry
+        if customer.has_card:
+            deltas[customer.user_id] += points
+            transactions.append({
+                'user_id': customer.user_id, 'points': points, 'type': 'earn',
+                'description': f'Sale of Rs. {amount} - {items}'[:200], 'created_at': date,
+            })
+        totals = days[_to_date(date)]
+        totals[0] += 1
+        totals[1] += amount
+        totals[2] += points
+
+    if sales:
+        db.session.execute(Sale.__table__.insert(), sales)
+    if transactions:
+        db.session.execute(PointsTransaction.__table__.insert(), transactions)
+    if deltas:
+        _add_points(deltas)
+    for day, (count, revenue, points_issued) in days.items():
+        record_sale_totals(day, count, revenue, points_issued)
+    return written, errors
+
+
+def _write_row_by_row(entries, customers, now):
+    """write_sales one entry at a time, each in a savepoint, without committing"""
+    written = []
+    errors = []
+    for key, sale in entries:
+        try:
+            with db.session.begin_nested():
+                row_written, row_errors = write_sales([(key, sale)], customers, now)
+        except SQLAlchemyError as exc:
+            errors.append(RowError(key, f'not imported, the database rejected it: {exc.__class__.__name__}'))
+            continue
+        written.extend(row_written)
+        errors.extend(row_errors)
+    return written, errors
+
+
+def _unreadable(exc, line):
+    """RowError for a file that stops decoding or parsing after `line` lines"""
+    if isinstance(exc, UnicodeDecodeError):
+        # The error is raised for the whole block being decoded, which starts
+        # right after the lines read so far
+        line += 1 + exc.object[:exc.start].count(b'\n')
+        return RowError(line, 'the file is not UTF-8 text, nothing was imported; save it as "CSV UTF-8"')
+    return RowError(line, f'the file is not valid CSV ({exc}), nothing was imported')
+
+
+def _check_readable(raw):
+    """RowError for the first line of a binary CSV stream that is not UTF-8 CSV, or None"""
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    reader = csv.reader(text)
+    try:
+        for _ in reader:
+            pass
+    except (UnicodeDecodeError, csv.Error) as exc:
+        return _unreadable(exc, reader.line_num)
+    finally:
+        text.detach()  # leave `raw` open
+    return None
+
+
+def import_sales(raw, chunk_size=5000):
+    """Import sales from a binary UTF-8 CSV stream; returns an ImportResult
+
+    The file is read twice: once to check that all of it decodes and parses,
+    then to import it. Rows that cannot be imported are listed in
+    ImportResult.errors with their line number; everything else is
+    committed chunk by chunk.
+    """
+    if not raw.seekable():
+        spooled = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        shutil.copyfileobj(raw, spooled)
+        raw = spooled
+    raw.seek(0)
+    error = _check_readable(raw)
+    if error:
+        return ImportResult(0, 0, 0, [error])
+    raw.seek(0)
+    stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        return _import_rows(csv.DictReader(stream), chunk_size)
+    finally:
+        stream.detach()
+
+
+def _import_rows(reader, chunk_size):
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        return ImportResult(0, 0, 0, [RowError(1, f'missing column(s): {", ".join(missing)}')])
+
+    customers = {}
+    rows = imported = points = duplicates = 0
+    errors = []
+    chunk = []
+
+    def flush():
+        nonlocal imported, points, duplicates
+        # Skip sales already recorded by an earlier upload (or earlier in this file)
+        existing = existing_client_ids([sale.client_id for _, sale in chunk if sale.client_id])
+        entries = []
+        for line, sale in chunk:
+            if sale.client_id in existing:
+                duplicates += 1
+                continue
+            if sale.client_id:
+                existing.add(sale.client_id)
+            entries.append((line, sale))
+
+        now = datetime.utcnow()
+        try:
+            written, chunk_errors = write_sales(entries, customers, now)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            try:
+                written, chunk_errors = _write_row_by_row(entries, customers, now)
+                db.session.commit()
+            except SQLAlchemyError as exc:
+                db.session.rollback()
+                reason = f'not imported, the batch failed: {exc.__class__.__name__}'
+                errors.extend(RowError(line, reason) for line, _ in entries)
+                return
+        imported += len(written)
+        points += sum(sale_points for _, sale_points in written)
+        errors.extend(chunk_errors)
+
+    for row in reader:
+        rows += 1
+        try:
+            sale = parse_sale(row)
+            client_id = _text(row, 'client_id')
+            if client_id:
+                sale = sale._replace(client_id=parse_client_id(client_id))
+            chunk.append((reader.line_num, sale))
+        except ValueError as exc:
+            errors.append(RowError(reader.line_num, str(exc)))
+        if len(chunk) >= chunk_size:
+            flush()
+            chunk = []
+    if chunk:
+        flush()
+
+    errors.sort()
+    return ImportResult(rows, imported, points, errors, duplicates)
@@ -0,0 +1,236 @@
+"""
+Versioned schema migrations.
+
+Each migration is a numbered step with an upgrade (and, where it can be
+undone, a downgrade) function that receives a SQLAlchemy connection. Applied
+versions are recorded in the schema_version table, so `flask migrate` only
+runs what a database is missing. Every step is written to be idempotent
+(IF NOT EXISTS / column checks) so databases created by db.create_all() or
+patched by the old create_order_columns.py script upgrade cleanly, on both
+SQLite and Postgres.
+
+Usage:
+  flask --app app migrate             # upgrade to the latest version
+  flask --app app migrate --status    # list applied and pending migrations
+  flask --app app migrate --to 2      # upgrade or downgrade to version 2
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, inspect, text
+
+from models import db
+from product_search import drop_search_index, ensure_search_index
+from revenue_rollup import rebuild_daily_revenue
+
+Migration = namedtuple('Migration', ['version', 'name', 'upgrade', 'downgrade'])
+
+_version_metadata = MetaData()
+schema_version = Table(
+    'schema_version', _version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class MigrationError(Exception):
+    """Raised when the requested target version cannot be reached"""
+
+
+# --- 0001: tables -----------------------------------------------------------
+
+def create_tables(conn):
+    db.metadata.create_all(conn, checkfirst=True)
+
+
+# --- 0002: order delivery/tracking columns (was create_order_columns.py) ----
+
+DELIVERY_COLUMNS = ['tracking_number', 'carrier', 'delivered_at', 'delivery_confirmed', 'dispatcher_notes']
+
+
+def add_delivery_columns(conn):
+    order = db.metadata.tables['order']
+    existing = {column['name'] for column in inspect(conn).get_columns('order')}
+    preparer = conn.dialect.identifier_preparer
+    for name in DELIVERY_COLUMNS:
+        if name in existing:
+            continue
+        column = order.c[name]
+        ddl = f'ALTER TABLE {preparer.format_table(order)} ADD COLUMN {preparer.quote(name)} {column.type.compile(conn.dialect)}'
+        if name == 'delivery_confirmed':
+            ddl += ' DEFAULT FALSE'
+        conn.execute(text(ddl))
+
+
+# --- 0003: indexes for the hot query paths ----------------------------------
+
+# (table, index name, columns); the same indexes are declared on the models
+INDEXES = [
+    ('order', 'ix_order_user_id_created_at', ('user_id', 'created_at')),  # my orders, activity feed
+    ('order', 'ix_order_payment_status_created_at', ('payment_status', 'created_at')),  # revenue, payments
+    ('order', 'ix_order_order_status_created_at', ('order_status', 'created_at')),  # admin status filter
+    ('order', 'ix_order_created_at', ('created_at',)),  # admin listing, newest first
+    ('order_item', 'ix_order_item_order_id', ('order_id',)),
+    ('sale', 'ix_sale_user_id_date', ('user_id', 'date')),
+    ('sale', 'ix_sale_date', ('date',)),
+    ('points_transaction', 'ix_points_transaction_user_id_created_at', ('user_id', 'created_at')),
+    ('loyalty_card', 'ix_loyalty_card_tier', ('tier',)),
+    ('product', 'ix_product_stock', ('stock',)),  # low stock counts
+    ('product', 'ix_product_category_price', ('category', 'price')),  # catalog filters
+    ('user', 'ix_user_role', ('role',)),
+    ('pending_payment', 'ix_pending_payment_status_next_check_at', ('status', 'next_check_at')),
+]
+
+
+def _index(table_name, name, columns, unique=False):
+    table = db.metadata.tables[table_name]
+    return Index(name, *(table.c[column] for column in columns), unique=unique)
+
+
+def create_indexes(conn):
+    for table_name, name, columns in INDEXES:
+        _index(table_name, name, columns).create(conn, checkfirst=True)
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('ANALYZE'))
+
+
+def drop_indexes(conn):
+    existing = {
+        (table_name, index['name'])
+        for table_name in {table_name for table_name, _, _ in INDEXES}
+        for index in inspect(conn).get_indexes(table_name)
+    }
+    for table_name, name, columns in INDEXES:
+        if (table_name, name) in existing:
+            _index(table_name, name, columns).drop(conn)
+
+
+# --- 0004: product full-text search index ------------------------------------
+
+def create_search_index(conn):
+    ensure_search_index(conn=conn)
+
+
+# --- 0005: server-side carts -------------------------------------------------
+
+def create_cart_items(conn):
+    db.metadata.tables['cart_item'].create(conn, checkfirst=True)
+
+
+def drop_cart_items(conn):
+    db.metadata.tables['cart_item'].drop(conn, checkfirst=True)
+
+
+# --- 0006: POS terminal sale ids ---------------------------------------------
+
+def add_sale_client_id(conn):
+    sale = db.metadata.tables['sale']
+    if 'client_id' not in {column['name'] for column in inspect(conn).get_columns('sale')}:
+        preparer = conn.dialect.identifier_preparer
+        conn.execute(text(
+            f'ALTER TABLE {preparer.format_table(sale)} ADD COLUMN client_id {sale.c.client_id.type.compile(conn.dialect)}'
+        ))
+    _index('sale', 'uq_sale_client_id', ('client_id',), unique=True).create(conn, checkfirst=True)
+
+
+def drop_sale_client_id(conn):
+    sale = db.metadata.tables['sale']
+    if any(index['name'] == 'uq_sale_client_id' for index in inspect(conn).get_indexes('sale')):
+        _index('sale', 'uq_sale_client_id', ('client_id',)).drop(conn)
+    if 'client_id' in {column['name'] for column in inspect(conn).get_columns('sale')}:
+        conn.execute(text(f'ALTER TABLE {conn.dialect.identifier_preparer.format_table(sale)} DROP COLUMN client_id'))
+
+
+# --- 0007: points earned per sale ----------------------------------------------
+
+def add_sale_points_earned(conn):
+    sale = db.metadata.tables['sale']
+    preparer = conn.dialect.identifier_preparer
+    if 'points_earned' not in {column['name'] for column in inspect(conn).get_columns('sale')}:
+        conn.execute(text(
+            f'ALTER TABLE {preparer.format_table(sale)} ADD COLUMN points_earned {sale.c.points_earned.type.compile(conn.dialect)}'
+        ))
+    # Older sales earned int(amount / rate); SQLite's CAST truncates like int()
+    earned = 'CAST(amount / :rate AS INTEGER)' if conn.dialect.name == 'sqlite' else 'CAST(FLOOR(amount / :rate) AS INTEGER)'
+    conn.execute(
+        text(f'UPDATE {preparer.format_table(sale)} SET points_earned = {earned} WHERE points_earned IS NULL'),
+        {'rate': current_app.config.get('POINTS_EARN_RATE', 10)},
+    )
+
+
+def drop_sale_points_earned(conn):
+    sale = db.metadata.tables['sale']
+    if 'points_earned' in {column['name'] for column in inspect(conn).get_columns('sale')}:
+        conn.execute(text(f'ALTER TABLE {conn.dialect.identifier_preparer.format_table(sale)} DROP COLUMN points_earned'))
+
+
+# --- 0008: daily revenue rollup backfill -------------------------------------
+
+def backfill_daily_revenue(conn):
+    rebuild_daily_revenue(conn)
+
+
+def keep_daily_revenue(conn):
+    """The backfilled rollup stays valid at earlier versions; nothing to undo"""
+
+
+MIGRATIONS = [
+    Migration(1, 'create tables', create_tables, None),
+    Migration(2, 'order delivery columns', add_delivery_columns, None),
+    Migration(3, 'query path indexes', create_indexes, drop_indexes),
+    Migration(4, 'product search index', create_search_index, drop_search_index),
+    Migration(5, 'server-side carts', create_cart_items, drop_cart_items),
+    Migration(6, 'sale client ids', add_sale_client_id, drop_sale_client_id),
+    Migration(7, 'sale points earned', add_sale_points_earned, drop_sale_points_earned),
+    Migration(8, 'daily revenue backfill', backfill_daily_revenue, keep_daily_revenue),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def applied_versions(conn):
+    """Versions recorded in schema_version, creating the table if needed"""
+    _version_metadata.create_all(conn, checkfirst=True)
+    return {row.version for row in conn.execute(schema_version.select())}
+
+
+def migrate(target=None, log=print):
+    """Upgrade (or downgrade) the database to `target`, default the latest
+
+    Each step runs in its own transaction together with its schema_version
+    row. Returns the list of (direction, migration) steps that ran.
+    """
+    target = LATEST_VERSION if target is None else target
+    if target < 0 or target > LATEST_VERSION:
+        raise MigrationError(f'Unknown version {target}; latest is {LATEST_VERSION}')
+
+    with db.engine.begin() as conn:
+        applied = applied_versions(conn)
+
+    steps = [('up', m) for m in MIGRATIONS if m.version <= target and m.version not in applied]
+    steps += [('down', m) for m in reversed(MIGRATIONS) if m.version > target and m.version in applied]
+    for direction, migration in steps:
+        if direction == 'down' and migration.downgrade is None:
+            raise MigrationError(f'Migration {migration.version} ({migration.name}) cannot be reverted')
+
+    for direction, migration in steps:
+        log(f'{"Applying" if direction == "up" else "Reverting"} {migration.version:04d} {migration.name}')
+        with db.engine.begin() as conn:
+            if direction == 'up':
+                migration.upgrade(conn)
+                conn.execute(schema_version.insert().values(
+                    version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+                ))
+            else:
+                migration.downgrade(conn)
+                conn.execute(schema_version.delete().where(schema_version.c.version == migration.version))
+    return steps
+
+
+def migration_status():
+    """[(migration, applied)] for every known migration"""
+    with db.engine.begin() as conn:
+        applied = applied_versions(conn)
+    return [(migration, migration.version in applied) for migration in MIGRATIONS]
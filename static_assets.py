@@ -0,0 +1,141 @@
+"""
+Fingerprinted static assets and response compression.
+
+Every url_for('static', ...) gets a ?v=<content hash> parameter, so a file's
+URL changes whenever its contents do and responses for the current version
+can be cached by browsers for a year with Cache-Control: immutable. Content-
+hashed product uploads (see image_pipeline) are treated the same way.
+
+HTML, JSON, CSS, JS and SVG responses above COMPRESS_MIN_SIZE bytes are
+compressed with brotli (if the optional brotli package is installed) or gzip,
+according to the client's Accept-Encoding.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import request, url_for
+
+from image_pipeline import is_hashed_file
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is used without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+}
+ONE_YEAR = 365 * 24 * 3600
+
+
+class StaticAssets:
+    def __init__(self, app=None):
+        self._hashes = {}
+        self._compressed = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the URL fingerprinting, cache headers and compression hooks"""
+        app.config.setdefault('STATIC_MAX_AGE', ONE_YEAR)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        self.app = app
+        app.url_defaults(self._add_fingerprint)
+        app.after_request(self._cache_static)
+        app.after_request(self._compress)
+        app.jinja_env.globals['asset_url'] = asset_url
+        app.extensions['static_assets'] = self
+
+    def fingerprint(self, filename):
+        """Short content hash of a static file, or None if it does not exist"""
+        path = os.path.join(self.app.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._hashes.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._hashes[filename] = (mtime, digest)
+        return digest
+
+    def _add_fingerprint(self, endpoint, values):
+        if endpoint == 'static' and 'v' not in values and 'filename' in values:
+            if is_hashed_file(values['filename']):
+                return  # the name already changes with the contents
+            digest = self.fingerprint(values['filename'])
+            if digest:
+                values['v'] = digest
+
+    def _cache_static(self, response):
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        filename = (request.view_args or {}).get('filename', '')
+        version = request.args.get('v')
+        if is_hashed_file(filename) or (version and version == self.fingerprint(filename)):
+            response.cache_control.public = True
+            response.cache_control.max_age = self.app.config['STATIC_MAX_AGE']
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        return response
+
+    def _compress(self, response):
+        # Generated streams (exports) are left alone; static files are read in full
+        streamed = response.is_streamed and not response.direct_passthrough
+        if (response.status_code != 200 or streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            encoding = 'br'
+        elif accepted['gzip']:
+            encoding = 'gzip'
+        else:
+            response.vary.add('Accept-Encoding')
+            return response
+
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < self.app.config['COMPRESS_MIN_SIZE']:
+            response.vary.add('Accept-Encoding')
+            return response
+
+        # Static files only change with their fingerprint, so compress them once
+        key = None
+        if request.endpoint == 'static':
+            filename = request.view_args['filename']
+            key = (filename, self.fingerprint(filename), encoding)
+        body = self._compressed.get(key) if key else None
+        if body is None:
+            body = self._encode(data, encoding)
+            if key:
+                with self._lock:
+                    self._compressed[key] = body
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        # A compressed body is only semantically equal to the original
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _encode(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=5)
+        return gzip.compress(data, compresslevel=self.app.config['COMPRESS_LEVEL'], mtime=0)
+
+
+def asset_url(filename):
+    """Fingerprinted URL of a file in the static folder"""
+    return url_for('static', filename=filename)
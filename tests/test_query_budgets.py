@@ -0,0 +1,93 @@
+"""
+The listing routes stay within their query_counter.ROUTE_QUERY_BUDGETS.
+
+Seeds a temporary SQLite database with enough customers, orders, sales and
+ledger entries to fill every listing page, then requests each route in
+ROUTE_QUERY_BUDGETS and fails with the SQL it ran if it went over budget
+(an N+1 query shows up as one statement per row).
+
+Run from the project root:
+  python -m pytest tests
+  python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+_tmpdir = tempfile.TemporaryDirectory(prefix='query-budgets-')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmpdir.name, "budgets.db")}'
+os.environ['PAYMENT_WORKER_THREAD'] = '0'
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app  # noqa: E402
+from models import db, User, LoyaltyCard, Product, Order, OrderItem, Sale, PointsTransaction  # noqa: E402
+from query_counter import ROUTE_QUERY_BUDGETS, assert_route_within_budget  # noqa: E402
+from schema_migrations import migrate  # noqa: E402
+
+SEED_ROWS = 60  # more than a page of every listing
+PASSWORD = 'budget-test'
+
+
+def seed(rows=SEED_ROWS):
+    """An admin and `rows` customers, with orders, sales and ledger entries"""
+    now = datetime.utcnow()
+    password = generate_password_hash(PASSWORD)
+    db.session.add(User(username='admin', email='admin@example.com', password=password, role='admin'))
+    products = [Product(name=f'Pen {n}', price=50 + n, stock=100, category='Pens') for n in range(5)]
+    db.session.add_all(products)
+
+    customers = []
+    for n in range(rows):
+        customer = User(username=f'customer_{n}', email=f'customer_{n}@example.com', password=password)
+        customer.loyalty_card = LoyaltyCard(points=n * 20)
+        customers.append(customer)
+    db.session.add_all(customers)
+    db.session.flush()
+
+    # customer_0 fills its own pages; one row each for the others makes any
+    # per-row lazy load of the customer show up in the admin listings
+    owners = customers[1:] + [customers[0]] * rows
+    for n, owner in enumerate(owners):
+        created_at = now - timedelta(hours=n)
+        order = Order(user_id=owner.id, email=owner.email, phone='9800000000', full_name=owner.username,
+                      address='Thamel', city='Kathmandu', postal_code='44600', subtotal=200, total=200,
+                      points_earned=20, payment_status='completed', created_at=created_at)
+        order.items = [
+            OrderItem(product_id=product.id, product_name=product.name, product_price=product.price,
+                      quantity=1, subtotal=product.price)
+            for product in products[:2]
+        ]
+        db.session.add(order)
+        db.session.add(Sale(user_id=owner.id, amount=150, items='1x Pen', date=created_at, points_earned=15))
+        db.session.add(PointsTransaction(user_id=owner.id, points=15, type='earn',
+                                         description='Sale of Rs. 150', created_at=created_at))
+    db.session.commit()
+
+
+class RouteQueryBudgetTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.config['TESTING'] = True
+        with app.app_context():
+            migrate(log=lambda message: None)
+            seed()
+
+    def client_for(self, username):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        self.assertEqual(response.status_code, 302)
+        return client
+
+    def test_listing_routes_stay_within_budget(self):
+        clients = {'admin': self.client_for('admin'), 'customer_0': self.client_for('customer_0')}
+        for path, budget in ROUTE_QUERY_BUDGETS.items():
+            client = clients['admin' if path.startswith('/admin') else 'customer_0']
+            with self.subTest(path=path, budget=budget), app.app_context():
+                response = assert_route_within_budget(client, path)
+                self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
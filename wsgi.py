@@ -2,15 +2,23 @@
 WSGI entry point for Gunicorn/Render deployment
 """
 import os
-from app import app, db
+from app import app, start_payment_worker
+from schema_migrations import migrate
 
-# Initialize database on startup
+# Gunicorn imports this module in every worker, so migrations are not run
+# here; render.yaml runs `flask --app app migrate` once before starting it.
+# create_app() only migrates when this file is run directly.
 def create_app():
     with app.app_context():
-        # Create tables if they don't exist
-        db.create_all()
+        # Create tables and apply pending schema migrations
+        migrate()
     return app
 
+# Verify Khalti payments in the background of each Gunicorn worker
+# (set PAYMENT_WORKER_THREAD=0 when running `flask payment-worker` separately)
+if app.config['PAYMENT_WORKER_THREAD']:
+    start_payment_worker()
+
 # For Gunicorn
 if __name__ == "__main__":
     app = create_app()